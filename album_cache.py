@@ -0,0 +1,51 @@
+"""
+Shared cache of Spotify album objects, keyed by album ID. songs_from_playlist.py needs every album's album_type to
+skip singles and compilations, and process_albums.py needs the same object again for its attributes and track listing.
+Albums are fetched once (in concurrent batches through sp.albums), kept in the album_cache table of crawl_state.py
+(data/album_cache.json plus its journal), and served from there afterwards. Each cached object holds album_type and
+the first page of tracks. available_markets lists are dropped to keep it small. This is the only on-disk copy of
+album responses: response_cache.py leaves sp.albums out of its TTLS.
+"""
+import crawl_state
+from crawler_engine import chunks
+
+BATCH_SIZE = 20     # Max number of IDs accepted by sp.albums
+
+# album_id -> album object (None if Spotify did not recognize the ID)
+album_cache = {}
+
+
+def load_cache():
+    global album_cache
+    album_cache = crawl_state.load_dict("album_cache")
+
+
+"""
+Removes available_markets from the album and its embedded tracks. They are by far the largest part of the
+response and nothing in the pipeline reads them.
+"""
+def strip_markets(album):
+    if album is None:
+        return None
+    album.pop("available_markets", None)
+    for track in album.get("tracks", {}).get("items", []):
+        track.pop("available_markets", None)
+    return album
+
+
+"""
+Returns album objects for every ID in album_ids, in the same order. Only IDs that are not cached yet are
+requested, BATCH_SIZE per request, concurrently through the crawler engine.
+"""
+async def get_albums(album_ids, engine):
+    missing = list(dict.fromkeys(a for a in album_ids if a not in album_cache))
+    batches = chunks(missing, BATCH_SIZE)
+    for batch, results in zip(batches, await engine.call_many("albums", batches)):
+        for album_id, album in zip(batch, results["albums"]):
+            album_cache[album_id] = strip_markets(album)
+
+    return [album_cache[a] for a in album_ids]
+
+
+async def get_album(album_id, engine):
+    return (await get_albums([album_id], engine))[0]
@@ -0,0 +1,441 @@
+"""
+Benchmarks queries.sql (plus a set of typical parameterized lookups) against schema.sql databases of growing size.
+For each scale factor it:
+    1. builds a dataset in bench/sf<k>/output/: a catalog (a synthetic one, or the crawl's output/*.tsv duplicated
+       k times and its playlists with --duplicate-crawl), then users and relationships from generate_users.py --offline and
+       user_relationships.py
+    2. creates a fresh database, runs schema.sql and load_data.sql with psql (and performance_schema.sql with
+       --performance-schema), then ANALYZE
+    3. runs every query --runs times and records p50/p95 latency, plus one EXPLAIN (ANALYZE, BUFFERS) plan with its
+       shared buffer hits and reads
+Results go to a JSON report (bench/report-<time>.json). Compare two reports with --compare.
+
+Requires a local PostgreSQL server, psql on the PATH and psycopg 3 (pip install "psycopg[binary]").
+
+Usage: python benchmark_queries.py [--dsn postgresql://localhost/postgres] [--scales 1 10 100] [--runs 20]
+                                   [--duplicate-crawl] [--skewed] [--performance-schema] [--keep] [--seed 42]
+       python benchmark_queries.py --compare bench/report-a.json bench/report-b.json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_DIR = "bench"
+CRAWL_OUTPUT_DIR = "output"
+
+# Synthetic catalog size at scale factor 1. Genres do not grow with the scale
+ARTISTS_PER_SCALE = 2000
+SONGS_PER_SCALE = 20000
+ALBUMS_PER_SCALE = 4000
+GENRES = 300
+FEATURED_SHARE = 0.1        # songs with a second performing artist
+GENRES_PER_ARTIST = 2
+USERS_PER_SCALE = 1000
+
+REGRESSION_THRESHOLD = 1.2  # --compare flags queries whose p50 or p95 grew by more than this factor
+
+# name -> (SQL with one %s parameter, (table, column) to sample parameter values from)
+LOOKUPS = {
+    "songs_by_followed_artists": (
+        """SELECT s.SongTitle FROM FollowsArtist fa
+           JOIN Performs p ON p.ArtistID = fa.ArtistID
+           JOIN Songs s ON s.SongID = p.SongID
+           WHERE fa.UserID = %s""",
+        ("FollowsArtist", "UserID"),
+    ),
+    "playlist_contents": (
+        """SELECT s.SongTitle, ip.SongOrder FROM InPlaylist ip
+           JOIN Songs s ON s.SongID = ip.SongID
+           WHERE ip.PlaylistID = %s ORDER BY ip.SongOrder""",
+        ("InPlaylist", "PlaylistID"),
+    ),
+    "top_artists_by_genre": (
+        """SELECT a.ArtistName, a.ArtistPopularity FROM IsGenre ig
+           JOIN Artists a ON a.ArtistID = ig.ArtistID
+           WHERE ig.GenreID = %s ORDER BY a.ArtistPopularity DESC NULLS LAST LIMIT 10""",
+        ("IsGenre", "GenreID"),
+    ),
+    "liked_songs": (
+        """SELECT s.SongTitle FROM LikesSong ls
+           JOIN Songs s ON s.SongID = ls.SongID
+           WHERE ls.UserID = %s""",
+        ("LikesSong", "UserID"),
+    ),
+    "song_like_count": (
+        "SELECT COUNT(*) FROM LikesSong WHERE SongID = %s",
+        ("LikesSong", "SongID"),
+    ),
+    "follower_count": (
+        "SELECT COUNT(*) FROM FollowsUser WHERE FollowedID = %s",
+        ("FollowsUser", "FollowedID"),
+    ),
+}
+
+ROW_COUNT_TABLES = ["Artists", "Songs", "Genres", "Albums", '"Users"', "Playlists", "Performs", "IsGenre", "InAlbum",
+                    "FollowsArtist", "CreatesPlaylist", "InPlaylist", "FollowsPlaylist", "LikesSong", "FollowsUser"]
+
+
+# ----- DATASETS -----
+
+def write_tsv(df, dataset_dir, name):
+    df.to_csv(os.path.join(dataset_dir, "output", f"{name}.tsv"), sep="\t", index=False)
+
+
+"""
+Writes a synthetic catalog in create_tsv.py's layout: artists, songs, albums and genres with the relationships
+between them. Every song has one performer (FEATURED_SHARE have a second) and is on one album
+"""
+def synthetic_catalog(dataset_dir, scale, rng):
+    n_artists, n_songs, n_albums = ARTISTS_PER_SCALE * scale, SONGS_PER_SCALE * scale, ALBUMS_PER_SCALE * scale
+    artist_ids = np.array([f"artist{i}" for i in range(n_artists)], dtype=object)
+    song_ids = np.array([f"song{i}" for i in range(n_songs)], dtype=object)
+    album_ids = np.array([f"album{i}" for i in range(n_albums)], dtype=object)
+    dates = pd.to_datetime("1960-01-01") + pd.to_timedelta(rng.integers(0, 365 * 65, size=n_songs), unit="D")
+
+    write_tsv(pd.DataFrame({
+        "artistID": artist_ids,
+        "artistName": [f"Artist {i}" for i in range(n_artists)],
+        "artistPopularity": rng.binomial(100, 0.35, size=n_artists),
+        "artistArtURL": None,
+    }), dataset_dir, "artists")
+    write_tsv(pd.DataFrame({
+        "songID": song_ids,
+        "songTitle": [f"Song {i}" for i in range(n_songs)],
+        "duration": rng.integers(60000, 420000, size=n_songs),
+        "releaseDate": dates.strftime("%Y-%m-%d"),
+        "popularity": rng.binomial(100, 0.3, size=n_songs),
+        "artURL": None,
+    }), dataset_dir, "songs")
+
+    # Songs are dealt to albums in order, so track numbers are consecutive within each album
+    song_album = np.sort(rng.integers(0, n_albums, size=n_songs))
+    track_numbers = np.arange(n_songs) - np.searchsorted(song_album, song_album) + 1
+    tracks_per_album = np.maximum(np.bincount(song_album, minlength=n_albums), 1)
+    album_dates = pd.to_datetime("1960-01-01") + pd.to_timedelta(rng.integers(0, 365 * 65, size=n_albums), unit="D")
+    write_tsv(pd.DataFrame({
+        "albumID": album_ids,
+        "albumTitle": [f"Album {i}" for i in range(n_albums)],
+        "albumReleaseDate": album_dates.strftime("%Y-%m-%d"),
+        "label": None,
+        "numberOfTracks": tracks_per_album,
+        "albumArtURL": None,
+    }), dataset_dir, "albums")
+    write_tsv(pd.DataFrame({"songID": song_ids, "albumID": album_ids[song_album], "trackNumber": track_numbers}),
+              dataset_dir, "inAlbum")
+
+    write_tsv(pd.DataFrame({"genreID": np.arange(1, GENRES + 1), "genreName": [f"genre {i}" for i in range(GENRES)]}),
+              dataset_dir, "genres")
+
+    performer = rng.integers(0, n_artists, size=n_songs)
+    featured = np.flatnonzero(rng.random(n_songs) < FEATURED_SHARE)
+    guest = (performer[featured] + rng.integers(1, max(n_artists, 2), size=len(featured))) % n_artists
+    performs = pd.DataFrame({
+        "artistID": artist_ids[np.concatenate([performer, guest])],
+        "songID": song_ids[np.concatenate([np.arange(n_songs), featured])],
+    }).drop_duplicates()
+    write_tsv(performs, dataset_dir, "performs")
+
+    artist_genres = rng.integers(1, GENRES + 1, size=(n_artists, GENRES_PER_ARTIST))
+    is_genre = pd.DataFrame({
+        "artistID": np.repeat(artist_ids, GENRES_PER_ARTIST),
+        "genreID": artist_genres.ravel(),
+    }).drop_duplicates()
+    write_tsv(is_genre, dataset_dir, "isGenre")
+
+
+"""
+Copies the crawl's catalog TSVs scale times. Copy 0 keeps the real IDs, copy i gets "~i" appended to every
+artist, song and album ID. Genres are shared by all copies. The crawled playlists are copied once (see crawl_playlists)
+"""
+def duplicated_catalog(dataset_dir, scale):
+    id_columns = {
+        "artists": ["artistID"],
+        "songs": ["songID"],
+        "albums": ["albumID"],
+        "performs": ["artistID", "songID"],
+        "inAlbum": ["songID", "albumID"],
+        "isGenre": ["artistID"],
+        "genres": [],
+    }
+    for name, columns in id_columns.items():
+        path = os.path.join(CRAWL_OUTPUT_DIR, f"{name}.tsv")
+        if not os.path.exists(path):
+            print(f"❌ {path} not found. Run create_tsv.py first, or leave out --duplicate-crawl")
+            exit(1)
+        df = pd.read_csv(path, sep="\t", dtype=str, keep_default_na=False)
+        copies = [df]
+        for i in range(1, scale if columns else 1):
+            copy = df.copy()
+            for c in columns:
+                copy[c] = copy[c] + f"~{i}"
+            copies.append(copy)
+        pd.concat(copies).to_csv(os.path.join(dataset_dir, "output", f"{name}.tsv"), sep="\t", index=False)
+        if name == "songs":
+            song_ids = set(df["songID"])
+    crawl_playlists(dataset_dir, song_ids)
+
+
+"""
+Writes the crawled playlists and their songs to the dataset's data/, where user_relationships.py reads them, so the
+real playlists are loaded along with their creators' CreatesPlaylist rows. Playlist songs keep their real IDs, like
+copy 0 of the catalog. Songs missing from the catalog are left out, since InPlaylist could not reference them
+"""
+def crawl_playlists(dataset_dir, song_ids):
+    import crawl_state
+
+    playlists = dict(crawl_state.load_dict("playlists").items())
+    song_playlist = {
+        crawl_state.encode_key(key): value
+        for key, value in crawl_state.load_dict("song_playlist", pairs=True).items()
+        if key[0] in song_ids and key[1] in playlists
+    }
+    for name, table in [("playlists", playlists), ("song_playlist", song_playlist)]:
+        with open(os.path.join(dataset_dir, "data", f"{name}.json"), "w") as f:
+            json.dump(table, f)
+
+
+def run_script(dataset_dir, script, *args):
+    subprocess.run([sys.executable, os.path.join(REPO_DIR, script), *map(str, args)], cwd=dataset_dir, check=True,
+                   stdout=subprocess.DEVNULL)
+
+
+def build_dataset(scale, args):
+    dataset_dir = os.path.join(BENCH_DIR, f"sf{scale}")
+    shutil.rmtree(dataset_dir, ignore_errors=True)
+    os.makedirs(os.path.join(dataset_dir, "output"))
+    os.makedirs(os.path.join(dataset_dir, "data"))
+
+    start = time.perf_counter()
+    if args.duplicate_crawl:
+        duplicated_catalog(dataset_dir, scale)
+    else:
+        synthetic_catalog(dataset_dir, scale, np.random.default_rng([args.seed, scale]))
+
+    n_users = USERS_PER_SCALE * scale
+    run_script(dataset_dir, "generate_users.py", "--offline", "--count", n_users, "--format", "tsv", "--seed", args.seed)
+    relationship_args = ["--seed", args.seed] + (["--skewed"] if args.skewed else [])
+    run_script(dataset_dir, "user_relationships.py", *relationship_args)
+    print(f"✅ Built dataset for scale {scale} in {time.perf_counter() - start:.1f}s")
+    return dataset_dir
+
+
+# ----- LOADING -----
+
+def psql(conninfo, cwd, *args):
+    subprocess.run(["psql", "-X", "-q", "-v", "ON_ERROR_STOP=1", "-d", conninfo, *args], cwd=cwd, check=True,
+                   stdout=subprocess.DEVNULL)
+
+
+def create_database(args, scale):
+    import psycopg
+    from psycopg.conninfo import make_conninfo
+
+    name = f"music_bench_sf{scale}"
+    with psycopg.connect(args.dsn, autocommit=True) as conn:
+        conn.execute(f"DROP DATABASE IF EXISTS {name}")
+        conn.execute(f"CREATE DATABASE {name}")
+    return name, make_conninfo(args.dsn, dbname=name)
+
+
+def load_database(conninfo, dataset_dir, performance_schema):
+    start = time.perf_counter()
+    psql(conninfo, REPO_DIR, "-f", "schema.sql")
+    # load_data.sql reads output/*.tsv relative to the working directory
+    psql(conninfo, dataset_dir, "-f", os.path.join(REPO_DIR, "load_data.sql"))
+    if performance_schema:
+        psql(conninfo, REPO_DIR, "-f", "performance_schema.sql")
+    psql(conninfo, REPO_DIR, "-c", "VACUUM ANALYZE")
+    return time.perf_counter() - start
+
+
+# ----- MEASURING -----
+
+"""
+Splits queries.sql into its statements, named after their "-- Query N: ..." comments
+"""
+def load_queries(path=os.path.join(REPO_DIR, "queries.sql")):
+    queries = {}
+    name, lines = None, []
+    with open(path, "r") as f:
+        for line in f:
+            stripped = line.strip()
+            if stripped.startswith("-- Query"):
+                name = stripped[3:].split(":")[0]
+                continue
+            if not stripped or stripped.startswith("--"):
+                continue
+            lines.append(line.rstrip())
+            if stripped.endswith(";"):
+                queries[name or f"Statement {len(queries) + 1}"] = "\n".join(lines).rstrip(";")
+                name, lines = None, []
+    if lines:
+        queries[name or f"Statement {len(queries) + 1}"] = "\n".join(lines)
+    return queries
+
+
+def percentile(sorted_values, p):
+    # Nearest-rank percentile
+    index = max(0, int(np.ceil(p / 100 * len(sorted_values))) - 1)
+    return sorted_values[index]
+
+
+"""
+Random parameter values, drawn from the rows of an edge table so busy keys are picked as often as they occur
+"""
+def sample_params(conn, table, column, n):
+    estimate = conn.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", (table,)).fetchone()[0]
+    percent = min(100.0, 100.0 * n * 10 / max(estimate, 1))
+    rows = conn.execute(
+        f"SELECT {column} FROM {table} TABLESAMPLE BERNOULLI (%s) ORDER BY random() LIMIT %s", (percent, n)
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def measure(conn, sql, params, runs):
+    # One untimed run to warm the cache, then runs timed executions cycling through params
+    conn.execute(sql, params[0]).fetchall()
+    latencies = []
+    for i in range(runs):
+        start = time.perf_counter()
+        conn.execute(sql, params[i % len(params)]).fetchall()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    plan = conn.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", params[0]).fetchone()[0][0]
+    return {
+        "runs": runs,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "max_ms": round(latencies[-1], 3),
+        "shared_hit_blocks": plan["Plan"].get("Shared Hit Blocks", 0),
+        "shared_read_blocks": plan["Plan"].get("Shared Read Blocks", 0),
+        "plan_execution_ms": plan.get("Execution Time"),
+        "plan": plan,
+    }
+
+
+def benchmark_database(conninfo, runs):
+    import psycopg
+
+    results = {}
+    with psycopg.connect(conninfo, autocommit=True) as conn:
+        rows = {t.strip('"'): conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ROW_COUNT_TABLES}
+
+        for name, sql in load_queries().items():
+            results[name] = measure(conn, sql, [()], runs)
+            print(f"🔹 {name}: p50 {results[name]['p50_ms']} ms, p95 {results[name]['p95_ms']} ms")
+
+        for name, (sql, (table, column)) in LOOKUPS.items():
+            params = sample_params(conn, table, column, runs)
+            if not params:
+                print(f"⚠️ {table} is empty. Skipping {name}...")
+                continue
+            results[name] = measure(conn, sql, [(p,) for p in params], runs)
+            print(f"🔹 {name}: p50 {results[name]['p50_ms']} ms, p95 {results[name]['p95_ms']} ms")
+    return rows, results
+
+
+# ----- COMPARING -----
+
+def compare(base_path, new_path):
+    with open(base_path, "r") as f:
+        base = json.load(f)
+    with open(new_path, "r") as f:
+        new = json.load(f)
+
+    regressions = 0
+    for scale, new_scale in new["scales"].items():
+        base_scale = base["scales"].get(scale)
+        if base_scale is None:
+            continue
+        print(f"\n----- Scale {scale} -----")
+        print(f"{'query':<28} {'p50 base':>10} {'p50 new':>10} {'ratio':>7} {'p95 base':>10} {'p95 new':>10} {'ratio':>7}")
+        for name, q in new_scale["queries"].items():
+            b = base_scale["queries"].get(name)
+            if b is None:
+                continue
+            p50_ratio = q["p50_ms"] / max(b["p50_ms"], 1e-9)
+            p95_ratio = q["p95_ms"] / max(b["p95_ms"], 1e-9)
+            flag = ""
+            if max(p50_ratio, p95_ratio) > REGRESSION_THRESHOLD:
+                flag = "  ❌ slower"
+                regressions += 1
+            elif max(p50_ratio, p95_ratio) < 1 / REGRESSION_THRESHOLD:
+                flag = "  ✅ faster"
+            print(f"{name:<28} {b['p50_ms']:>10.2f} {q['p50_ms']:>10.2f} {p50_ratio:>7.2f} "
+                  f"{b['p95_ms']:>10.2f} {q['p95_ms']:>10.2f} {p95_ratio:>7.2f}{flag}")
+    print(f"\n{regressions} regressions over {REGRESSION_THRESHOLD}x")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark queries.sql at several data sizes")
+    parser.add_argument("--dsn", default=os.environ.get("DATABASE_URL", "postgresql://localhost/postgres"),
+                        help="server to create the benchmark databases on (default: $DATABASE_URL or localhost)")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10], help="scale factors to benchmark")
+    parser.add_argument("--runs", type=int, default=20, help="timed executions per query")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--duplicate-crawl", action="store_true", help="catalog = output/*.tsv copied <scale> times")
+    parser.add_argument("--skewed", action="store_true", help="pass --skewed to user_relationships.py")
+    parser.add_argument("--performance-schema", action="store_true", help="install performance_schema.sql before measuring")
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark databases and datasets")
+    parser.add_argument("--report", help="report path (default: bench/report-<time>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two reports and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        exit(1 if compare(*args.compare) else 0)
+
+    try:
+        import psycopg
+    except ImportError:
+        print("❌ benchmark_queries.py needs psycopg 3: pip install \"psycopg[binary]\"")
+        exit(1)
+    if shutil.which("psql") is None:
+        print("❌ psql not found. load_data.sql is run with psql")
+        exit(1)
+
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    report_path = args.report or os.path.join(BENCH_DIR, f"report-{datetime.now():%Y%m%d-%H%M%S}.json")
+    commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip()
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "settings": {k: v for k, v in vars(args).items() if k not in ("dsn", "compare", "report")},
+        "scales": {},
+    }
+
+    for scale in args.scales:
+        print(f"\n----- Scale {scale} -----")
+        dataset_dir = build_dataset(scale, args)
+        name, conninfo = create_database(args, scale)
+        load_seconds = load_database(conninfo, dataset_dir, args.performance_schema)
+        print(f"✅ Loaded {name} in {load_seconds:.1f}s")
+
+        rows, queries = benchmark_database(conninfo, args.runs)
+        report["scales"][str(scale)] = {"database": name, "load_seconds": round(load_seconds, 2), "rows": rows, "queries": queries}
+
+        # Written after every scale so a long run that fails later still leaves results
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+        if not args.keep:
+            with psycopg.connect(args.dsn, autocommit=True) as conn:
+                conn.execute(f"DROP DATABASE IF EXISTS {name}")
+            shutil.rmtree(dataset_dir, ignore_errors=True)
+
+    print(f"\n✅ Saved report to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+Loads the database straight from crawl state with COPY ... FROM STDIN, instead of writing TSV files with create_tsv.py
+and reading them back with load_data.sql. Entity and crawl-relationship rows (songs, albums, artists, genres, performs,
+isGenre, inAlbum) are streamed from crawl_state tables, users from data/users.json. The synthetic user tables that
+user_relationships.py writes (playlists.tsv, followsArtist.tsv, ...) are streamed from output/ as they are.
+
+For a full reload, every foreign key, primary key, unique constraint and secondary index on the target tables is dropped,
+the tables are truncated, each table is loaded in its own process on its own connection, and then the constraints
+and indexes are rebuilt from their saved definitions. Formatting COPY rows is CPU-bound Python, so processes rather
+than threads let the tables load in parallel. Each process streams its rows from crawl state instead of loading
+the tables it reads.
+
+Requires psycopg 3 (pip install "psycopg[binary]") and an existing schema (schema.sql).
+
+Usage: python bulk_load.py --dsn postgresql://localhost/music [--jobs 4] [--append] [--tables Songs Albums ...]
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import crawl_state
+import create_tsv
+
+DATA_DIR = "data"
+OUTPUT_DIR = "output"
+
+COPY_CHUNK_ROWS = 10000
+
+# Entity tables built from crawl state: table -> (crawl table, attribute keys in schema column order)
+ENTITIES = {
+    "Artists": ("artists", ["artistName", "artistPopularity", "artistArtURL"]),
+    "Songs": ("songs", ["songTitle", "duration", "releaseDate", "popularity", "artURL"]),
+    "Albums": ("albums", ["albumTitle", "albumReleaseDate", "label", "numberOfTracks", "albumArtURL"]),
+}
+
+# Tables only user_relationships.py produces, streamed from output/<file> (CSV with a header row)
+TSV_TABLES = {
+    "Playlists": "playlists.tsv",
+    "FollowsArtist": "followsArtist.tsv",
+    "CreatesPlaylist": "createsPlaylist.tsv",
+    "InPlaylist": "inPlaylist.tsv",
+    "FollowsPlaylist": "followsPlaylist.tsv",
+    "LikesSong": "likesSong.tsv",
+    "FollowsUser": "followsUser.tsv",
+}
+
+TABLES = ["Artists", "Songs", "Genres", "Albums", "Users", "Performs", "IsGenre", "InAlbum", *TSV_TABLES]
+
+
+def quote_table(table):
+    # Users is a reserved word, so schema.sql creates it quoted
+    return '"Users"' if table == "Users" else table
+
+
+"""
+Formats one value for COPY's text format. None and the literal \\N that generate_users.py uses
+for missing names both become NULL
+"""
+def copy_value(value):
+    if value is None or value == r"\N":
+        return r"\N"
+    text = str(value)
+    return text.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def copy_line(row):
+    return "\t".join(copy_value(v) for v in row) + "\n"
+
+
+# ----- ROW SOURCES -----
+
+"""
+Streams the (key, value) pairs of a crawl dict table. The JSON store is read from its snapshot and journal without
+loading the table (crawl_state.iter_dict). The SQLite and compact stores do not hold their tables as Python objects,
+so they are read through the table itself
+"""
+def crawl_items(name, pairs=False):
+    if crawl_state.BACKEND == "json":
+        return crawl_state.iter_dict(name, pairs)
+    return crawl_state.load_dict(name, pairs=pairs).items()
+
+
+def crawl_keys(name, pairs=False):
+    if crawl_state.BACKEND == "json":
+        return crawl_state.iter_set(name, pairs)
+    return iter(crawl_state.load_set(name, pairs=pairs))
+
+
+"""
+Genre IDs come from create_tsv.genre_ids, so Genres and IsGenre agree no matter which process builds them, and
+with the TSV files that load_data.sql loads
+"""
+def genre_ids():
+    return create_tsv.genre_ids(crawl_keys("genres"))
+
+
+def entity_rows(table):
+    crawl_table, fields = ENTITIES[table]
+    for entity_id, attributes in crawl_items(crawl_table):
+        yield [entity_id, *(attributes.get(f) for f in fields)]
+
+
+def user_rows():
+    with open(f"{DATA_DIR}/users.json", "r") as f:
+        users = json.load(f)
+    for user_id, u in users.items():
+        yield [user_id, u["username"], u["firstName"], u["lastName"], u["userArtURL"]]
+
+
+def rows_for(table):
+    if table in ENTITIES:
+        return entity_rows(table)
+    if table == "Genres":
+        return ([genre_id, name] for name, genre_id in genre_ids().items())
+    if table == "Users":
+        return user_rows()
+    if table == "Performs":
+        return ([artist_id, song_id] for song_id, artist_id in crawl_keys("song_artist", pairs=True))
+    if table == "IsGenre":
+        ids = genre_ids()
+        return ([artist_id, ids[genre]] for artist_id, genre in crawl_keys("artist_genre", pairs=True))
+    if table == "InAlbum":
+        return (
+            [song_id, album_id, v["trackNumber"]]
+            for (song_id, album_id), v in crawl_items("song_album", pairs=True)
+        )
+    raise ValueError(f"No row source for {table}")
+
+
+# ----- LOADING -----
+
+def copy_rows(conn, table, rows):
+    count = 0
+    with conn.cursor() as cur:
+        with cur.copy(f"COPY {quote_table(table)} FROM STDIN") as copy:
+            chunk = []
+            for row in rows:
+                chunk.append(copy_line(row))
+                if len(chunk) >= COPY_CHUNK_ROWS:
+                    copy.write("".join(chunk))
+                    count += len(chunk)
+                    chunk = []
+            copy.write("".join(chunk))
+            count += len(chunk)
+    return count
+
+
+def copy_tsv(conn, table, path):
+    count = 0
+    with conn.cursor() as cur, open(path, "r") as f:
+        with cur.copy(f"COPY {quote_table(table)} FROM STDIN (FORMAT csv, DELIMITER E'\\t', HEADER true)") as copy:
+            while True:
+                lines = f.readlines(COPY_CHUNK_ROWS * 64)
+                if not lines:
+                    break
+                copy.write("".join(lines))
+                count += len(lines)
+    return max(count - 1, 0)
+
+
+def load_table(dsn, table):
+    import psycopg
+
+    start = time.perf_counter()
+    with psycopg.connect(dsn) as conn:
+        if table in TSV_TABLES:
+            path = os.path.join(OUTPUT_DIR, TSV_TABLES[table])
+            if not os.path.exists(path):
+                print(f"❌ {path} not found. Skipping {table}...")
+                return table, 0, 0.0
+            count = copy_tsv(conn, table, path)
+        elif table == "Users" and not os.path.exists(f"{DATA_DIR}/users.json"):
+            print(f"❌ {DATA_DIR}/users.json not found. Skipping {table}...")
+            return table, 0, 0.0
+        else:
+            count = copy_rows(conn, table, rows_for(table))
+    return table, count, time.perf_counter() - start
+
+
+# ----- CONSTRAINTS AND INDEXES -----
+
+"""
+Tables outside tables with foreign keys into them. A reload cannot leave those out: they are not truncated, so their
+foreign keys could not be added back if the reloaded rows no longer contain the keys they reference
+"""
+def dependent_tables(conn, tables):
+    regclasses = [quote_table(t) for t in tables]
+    rows = conn.execute(
+        """
+        SELECT DISTINCT conrelid::regclass::text
+        FROM pg_constraint
+        WHERE contype = 'f' AND confrelid = ANY(%s::regclass[]) AND NOT conrelid = ANY(%s::regclass[])
+        ORDER BY 1
+        """,
+        (regclasses, regclasses)
+    ).fetchall()
+    return [table for table, in rows]
+
+
+"""
+Returns (drop statements, rebuild statements) for every key, foreign key and secondary index on tables. No other
+table references them, main() checks that first (dependent_tables).
+Foreign keys are dropped first and rebuilt last, after the keys they reference exist again
+"""
+def constraint_plan(conn, tables):
+    regclasses = [quote_table(t) for t in tables]
+    constraints = conn.execute(
+        """
+        SELECT conrelid::regclass::text, conname, contype, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE (contype IN ('f', 'p', 'u') AND conrelid = ANY(%s::regclass[]))
+           OR (contype = 'f' AND confrelid = ANY(%s::regclass[]))
+        ORDER BY contype = 'f' DESC
+        """,
+        (regclasses, regclasses)
+    ).fetchall()
+    indexes = conn.execute(
+        """
+        SELECT i.indexrelid::regclass::text, pg_get_indexdef(i.indexrelid)
+        FROM pg_index i
+        WHERE i.indrelid = ANY(%s::regclass[])
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+        """,
+        (regclasses,)
+    ).fetchall()
+
+    drops = [f'ALTER TABLE {table} DROP CONSTRAINT "{name}"' for table, name, _, _ in constraints]
+    drops += [f"DROP INDEX {name}" for name, _ in indexes]
+
+    keys = [f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition}' for table, name, kind, definition in constraints if kind != "f"]
+    foreign_keys = [f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition}' for table, name, kind, definition in constraints if kind == "f"]
+    rebuilds = keys + [definition for _, definition in indexes] + foreign_keys
+    return drops, rebuilds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load crawl state into PostgreSQL with COPY")
+    parser.add_argument("--dsn", default=os.environ.get("DATABASE_URL"), help="PostgreSQL connection string (default: $DATABASE_URL)")
+    parser.add_argument("--jobs", type=int, default=4, help="tables loaded in parallel")
+    parser.add_argument("--append", action="store_true", help="keep existing rows and constraints (no truncate, no index rebuild)")
+    parser.add_argument("--tables", nargs="+", default=TABLES, choices=TABLES, metavar="TABLE", help="subset of tables to load")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("--dsn or DATABASE_URL is required")
+
+    try:
+        import psycopg
+    except ImportError:
+        print("❌ bulk_load.py needs psycopg 3: pip install \"psycopg[binary]\"")
+        exit(1)
+
+    rebuilds = []
+    if not args.append:
+        with psycopg.connect(args.dsn, autocommit=True) as conn:
+            dependents = dependent_tables(conn, args.tables)
+            if dependents:
+                print(f"❌ {', '.join(dependents)} reference the tables being reloaded. Add them to --tables, or use --append")
+                exit(1)
+            drops, rebuilds = constraint_plan(conn, args.tables)
+            print(f"Dropping {len(drops)} constraints and indexes...")
+            for statement in drops:
+                conn.execute(statement)
+            conn.execute(f"TRUNCATE {', '.join(quote_table(t) for t in args.tables)}")
+
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            for table, count, seconds in pool.map(partial(load_table, args.dsn), args.tables):
+                print(f"✅ Loaded {count} rows into {table} in {seconds:.1f}s")
+    finally:
+        if rebuilds:
+            print(f"Rebuilding {len(rebuilds)} constraints and indexes...")
+            with psycopg.connect(args.dsn, autocommit=True) as conn:
+                for statement in rebuilds:
+                    conn.execute(statement)
+
+    # performance_schema.sql's materialized view is computed from Songs, Performs and Artists
+    with psycopg.connect(args.dsn, autocommit=True) as conn:
+        if conn.execute("SELECT to_regclass('artistsongpopularity')").fetchone()[0]:
+            print("Refreshing ArtistSongPopularity...")
+            conn.execute("REFRESH MATERIALIZED VIEW ArtistSongPopularity")
+
+    print(f"✅ Finished in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
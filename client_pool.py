@@ -0,0 +1,54 @@
+"""
+Crawling with several Spotify apps at once. Spotify rate-limits each app separately, so a crawl with N credential pairs
+can make about N times the requests. List them in CRAWL_CREDENTIALS, separated by commas:
+    export CRAWL_CREDENTIALS='<client_id>:<client_secret>,<client_id>:<client_secret>'
+
+make_client() then returns a ClientPool with one client per pair, and the crawler engine gives every client its own
+token bucket (see crawler_engine.Lane). Each request goes to the client that can send it soonest. A 429 only pauses
+and slows down the client that got it, and the others carry on. Without CRAWL_CREDENTIALS, the one client uses
+SPOTIPY_CLIENT_ID and SPOTIPY_CLIENT_SECRET as before.
+
+To try a pool without credentials, replay recorded responses: CRAWL_REPLAY_CLIENTS=N makes N replay clients, and
+CRAWL_REPLAY_RATE_LIMIT gives each one its own requests-per-second limit (see replay_client.py, or
+crawl_benchmark.py --clients).
+"""
+import itertools
+import os
+import threading
+
+
+"""
+(client_id, client_secret) pairs from CRAWL_CREDENTIALS. Without it, a single (None, None) pair, which makes spotipy
+read its own environment variables
+"""
+def credentials():
+    raw = os.environ.get("CRAWL_CREDENTIALS", "").strip()
+    if not raw:
+        return [(None, None)]
+    pairs = []
+    for entry in raw.split(","):
+        client_id, separator, client_secret = entry.strip().partition(":")
+        if not separator or not client_id or not client_secret:
+            raise ValueError("CRAWL_CREDENTIALS entries must look like <client_id>:<client_secret>")
+        pairs.append((client_id, client_secret))
+    return pairs
+
+
+class ClientPool:
+    """
+    Several Spotify clients used as one. The crawler engine balances requests across them itself. Anything else
+    calling the pool directly gets the clients in turn.
+    """
+
+    def __init__(self, clients):
+        self.clients = clients
+        self.turns = itertools.cycle(clients)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.clients)
+
+    def __getattr__(self, method):
+        with self.lock:
+            client = next(self.turns)
+        return getattr(client, method)
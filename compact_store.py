@@ -0,0 +1,683 @@
+"""
+Compact storage for the big crawl tables, used instead of their JSON snapshots when CRAWL_STORE=compact.
+Holding tens of millions of ("22-char id", "22-char id") relationship tuples costs gigabytes, and parsing "a|b"
+strings at every startup is slow. For the relationship tables (song_artist, song_album, song_playlist):
+    - every Spotify ID is interned once, as an int32 index into a shared ID table (IdTable)
+    - each relationship is a sorted int64 array of (first id << 32 | second id) keys, so membership is a binary search,
+      plus one array per attribute (trackNumber, dateAdded, songOrder), in key order
+    - arrays are saved as .npy files under data/compact/ and memory-mapped when loaded, so startup reads nothing
+      until it is used and concurrent stages share the OS page cache
+
+The entity tables (songs, albums, artists) are stored the same way: a sorted array of IDs, and each entity's
+attributes as a JSON document in one byte heap, found through an offsets array (EntityDict). Checking whether a
+song is known, or reading one album's attributes, no longer needs the whole catalog parsed at startup.
+
+Changes made since the arrays were saved live in memory (a dict of new keys plus a set of deleted ones) and are
+journaled to data/journal/<table>.jsonl like every other crawl_state table. crawl_state compacts them into new
+arrays once the journal outgrows them. Each save writes a new generation of files and then switches the table's
+manifest (data/compact/<table>.json) to it atomically, so a crash leaves the previous generation intact.
+
+Stages run as separate processes can share data/compact. Tables are loaded and saved under one lock (locked()), and a
+save first rebases on any generation another process saved since the table was loaded: its own changes are applied
+on top, and IDs it interned are renumbered after the other process's (IdTable.rebase).
+
+Existing data/<table>.json snapshots are imported the first time a table is opened. create_tsv.py still reads .json
+snapshots, so export them after a crawl with
+    python compact_store.py export
+"""
+from collections.abc import MutableMapping, MutableSet
+from contextlib import contextmanager
+import fcntl
+import glob
+import json
+import os
+
+import numpy as np
+
+DATA_DIR = "data"
+COMPACT_DIR = f"{DATA_DIR}/compact"
+os.makedirs(f"{COMPACT_DIR}", exist_ok=True)
+
+# Relationship table -> attribute columns (name -> NumPy dtype). Missing ints are stored as -1, missing strings as b""
+TABLES = {
+    "song_artist": {},
+    "song_album": {"trackNumber": "<i4"},
+    "song_playlist": {"dateAdded": "S32", "songOrder": "<i4"},
+}
+
+# Entity tables kept as an ID index plus a heap of JSON documents (see EntityDict)
+ENTITY_TABLES = ["songs", "albums", "artists"]
+
+ids = None      # The IdTable shared by every compact table
+
+lock_file = None
+lock_depth = 0
+
+
+def manifest_path(name):
+    return f"{COMPACT_DIR}/{name}.json"
+
+
+def array_path(name, generation, column):
+    return f"{COMPACT_DIR}/{name}.{generation}.{column}.npy"
+
+
+def read_manifest(name):
+    try:
+        with open(manifest_path(name), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"generation": 0, "count": 0}
+
+
+"""
+Writes a NumPy array (or JSON manifest) to path through a temporary file, fsynced and renamed into place
+"""
+def atomic_save(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        if isinstance(data, np.ndarray):
+            np.save(f, data)
+        else:
+            f.write(json.dumps(data).encode())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def sync_dir():
+    dir_fd = os.open(COMPACT_DIR, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+"""
+Deletes every file of a table that is not part of its current generation
+"""
+def remove_old_generations(name, generation):
+    for path in glob.glob(f"{COMPACT_DIR}/{name}.*.npy"):
+        if not path.startswith(f"{COMPACT_DIR}/{name}.{generation}."):
+            os.remove(path)
+
+
+def load_array(name, generation, column):
+    return np.load(array_path(name, generation, column), mmap_mode="r")
+
+
+"""
+Holds an exclusive lock on data/compact (and data/seen, see seen_ids.py) while tables are loaded or saved, so another
+process never removes a generation between reading its manifest and opening its files, and two saves never write
+the same generation. Re-entrant, since CompactTable.save saves the ID table inside its own lock
+"""
+@contextmanager
+def locked():
+    global lock_file, lock_depth
+    if not lock_depth:
+        lock_file = open(f"{COMPACT_DIR}/.lock", "a")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+    lock_depth += 1
+    try:
+        yield
+    finally:
+        lock_depth -= 1
+        if not lock_depth:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+
+"""
+Moves a CompactTable or EntityDict whose manifest points to a newer generation, saved by another process, onto it.
+The unsaved changes are kept on top: deletions of keys it no longer has are dropped, and the count is redone
+"""
+def rebase_table(table, manifest):
+    table.load(manifest)
+    table.deleted = {k for k in table.deleted if table.saved_position(k) is not None}
+    table.count = len(table.keys) - len(table.deleted) + sum(1 for k in table.delta if table.saved_position(k) is None)
+
+
+class IdTable:
+    """
+    Interns Spotify IDs as int32 indexes. Saved IDs keep their index forever (new ones are appended), so edge keys
+    never need rewriting. Lookups binary-search a sorted copy of the saved IDs, and check a dict of IDs added since.
+    """
+
+    def __init__(self):
+        self.tables = []        # Loaded CompactTables, whose unsaved keys a rebase renumbers
+        self.new = {}           # id -> index, for IDs added since the last save
+        self.new_list = []
+        with locked():
+            self.load(read_manifest("ids"))
+
+    def load(self, manifest):
+        self.generation = manifest["generation"]
+        if self.generation:
+            self.ids = load_array("ids", self.generation, "ids")
+            self.sorted_ids = load_array("ids", self.generation, "sorted")
+            self.order = load_array("ids", self.generation, "order")
+        else:
+            self.ids = self.sorted_ids = np.array([], dtype="S22")
+            self.order = np.array([], dtype=np.int32)
+        self.saved = len(self.ids)
+
+    def __len__(self):
+        return self.saved + len(self.new_list)
+
+    def lookup(self, spotify_id):
+        """Index of spotify_id, or None if it was never interned."""
+        index = self.new.get(spotify_id)
+        if index is not None:
+            return index
+        if not self.saved:
+            return None
+        raw = spotify_id.encode()
+        i = int(np.searchsorted(self.sorted_ids, raw))
+        if i < self.saved and self.sorted_ids[i] == raw:
+            return int(self.order[i])
+        return None
+
+    def intern(self, spotify_id):
+        index = self.lookup(spotify_id)
+        if index is None:
+            index = len(self)
+            if index >= 2 ** 31:
+                raise OverflowError("more than 2^31 IDs interned")
+            self.new[spotify_id] = index
+            self.new_list.append(spotify_id)
+        return index
+
+    def string(self, index):
+        if index < self.saved:
+            return self.ids[index].decode()
+        return self.new_list[index - self.saved]
+
+    def strings(self, indexes):
+        """Decodes an array of indexes at once."""
+        saved = indexes < self.saved
+        out = np.empty(len(indexes), dtype=object)
+        out[saved] = np.char.decode(self.ids[indexes[saved]]) if saved.any() else []
+        out[~saved] = [self.new_list[i - self.saved] for i in indexes[~saved]]
+        return out
+
+    def rebase(self, manifest):
+        """
+        Moves onto a newer generation saved by another process. Its IDs keep their indexes, and the IDs interned here
+        since the last save are looked up in it or appended after it, so they can get new indexes. Every loaded
+        table's unsaved keys are renumbered to match
+        """
+        new_list = self.new_list
+        first = self.saved
+        self.load(manifest)
+        self.new = {}
+        self.new_list = []
+        remap = {}
+        for i, spotify_id in enumerate(new_list, start=first):
+            index = self.intern(spotify_id)
+            if index != i:
+                remap[i] = index
+        if remap:
+            for table in self.tables:
+                table.remap_ids(remap)
+
+    def refresh(self):
+        """Rebases on the saved IDs if another process saved newer ones, so every index in a saved table decodes."""
+        with locked():
+            manifest = read_manifest("ids")
+            if manifest["generation"] != self.generation:
+                self.rebase(manifest)
+
+    def save(self):
+        with locked():
+            self.refresh()
+            if self.new_list:
+                self.write()
+
+    def write(self):
+        new_ids = np.array([i.encode() for i in self.new_list])
+        width = max(self.ids.dtype.itemsize, new_ids.dtype.itemsize)
+        all_ids = np.concatenate([np.asarray(self.ids, dtype=f"S{width}"), new_ids.astype(f"S{width}")])
+        order = np.argsort(all_ids, kind="stable").astype(np.int32)
+
+        generation = self.generation + 1
+        atomic_save(array_path("ids", generation, "ids"), all_ids)
+        atomic_save(array_path("ids", generation, "sorted"), all_ids[order])
+        atomic_save(array_path("ids", generation, "order"), order)
+        atomic_save(manifest_path("ids"), {"generation": generation, "count": len(all_ids)})
+        sync_dir()
+        remove_old_generations("ids", generation)
+
+        self.load(read_manifest("ids"))
+        self.new = {}
+        self.new_list = []
+
+
+def id_table():
+    global ids
+    if ids is None:
+        ids = IdTable()
+    return ids
+
+
+class CompactTable:
+    """Shared plumbing for CompactDict and CompactSet. Keys are (id, id) tuples."""
+
+    def __init__(self, name):
+        self.name = name
+        self.pairs = True
+        self.pending = []
+        self.ids = id_table()
+        self.ids.tables.append(self)
+        self.columns = TABLES[name]
+        self.delta = {}         # key -> value (None for sets) for keys added or changed since the last save
+        self.deleted = set()    # saved keys deleted since the last save
+        with locked():
+            # The table's keys can refer to IDs saved after the ID table was loaded
+            self.ids.refresh()
+            self.load(read_manifest(name))
+        self.count = len(self.keys)
+
+    def load(self, manifest):
+        self.generation = manifest["generation"]
+        if self.generation:
+            self.keys = load_array(self.name, self.generation, "keys")
+            self.values = {c: load_array(self.name, self.generation, c) for c in self.columns}
+        else:
+            self.keys = np.array([], dtype=np.int64)
+            self.values = {c: np.array([], dtype=dtype) for c, dtype in self.columns.items()}
+
+    def remap_ids(self, remap):
+        """Renumbers the unsaved keys after IdTable.rebase. Saved keys only use saved IDs, whose indexes never change."""
+        self.delta = {
+            (remap.get(k >> 32, k >> 32) << 32) | remap.get(k & 0xFFFFFFFF, k & 0xFFFFFFFF): v
+            for k, v in self.delta.items()
+        }
+
+    def edge_key(self, key, create=False):
+        if not isinstance(key, tuple) or len(key) != 2:
+            return None
+        if create:
+            return (self.ids.intern(key[0]) << 32) | self.ids.intern(key[1])
+        a, b = self.ids.lookup(key[0]), self.ids.lookup(key[1])
+        if a is None or b is None:
+            return None
+        return (a << 32) | b
+
+    def saved_position(self, k):
+        """Position of k in the saved keys, or None."""
+        i = int(np.searchsorted(self.keys, k))
+        if i < len(self.keys) and self.keys[i] == k:
+            return i
+        return None
+
+    def has(self, k):
+        if k is None:
+            return False
+        if k in self.delta:
+            return True
+        return k not in self.deleted and self.saved_position(k) is not None
+
+    def __contains__(self, key):
+        return self.has(self.edge_key(key))
+
+    def __len__(self):
+        return self.count
+
+    def put(self, k, value):
+        if not self.has(k):
+            self.count += 1
+        self.delta[k] = value
+        self.deleted.discard(k)
+
+    def drop(self, k):
+        if not self.has(k):
+            return False
+        self.count -= 1
+        self.delta.pop(k, None)
+        if self.saved_position(k) is not None:
+            self.deleted.add(k)
+        return True
+
+    def decode(self, k):
+        return self.ids.string(k >> 32), self.ids.string(k & 0xFFFFFFFF)
+
+    def saved_live(self):
+        """Mask of the saved keys that are neither deleted nor overridden by delta."""
+        mask = np.ones(len(self.keys), dtype=bool)
+        changed = np.fromiter(self.deleted | self.delta.keys(), dtype=np.int64, count=len(self.deleted | self.delta.keys()))
+        if len(changed):
+            mask &= ~np.isin(self.keys, changed)
+        return mask
+
+    def iter_keys(self):
+        mask = self.saved_live()
+        keys = np.asarray(self.keys)[mask]
+        for start in range(0, len(keys), 1_000_000):
+            block = keys[start:start + 1_000_000]
+            firsts = self.ids.strings(block >> 32)
+            seconds = self.ids.strings(block & 0xFFFFFFFF)
+            yield from zip(firsts, seconds)
+        for k in list(self.delta):
+            yield self.decode(k)
+
+    def __iter__(self):
+        return self.iter_keys()
+
+    def value_at(self, i):
+        value = {}
+        for c, dtype in self.columns.items():
+            v = self.values[c][i]
+            if dtype.startswith("S"):
+                value[c] = v.decode() if v else None
+            else:
+                value[c] = int(v) if v != -1 else None
+        return value
+
+    def column_value(self, c, value):
+        v = (value or {}).get(c)
+        if self.columns[c].startswith("S"):
+            return b"" if v is None else str(v).encode()
+        return -1 if v is None else v
+
+    """
+    Merges the in-memory changes into a new generation of sorted arrays. The ID table is saved first,
+    since the new keys refer to its new IDs
+    """
+    def save(self):
+        with locked():
+            self.ids.save()
+            manifest = read_manifest(self.name)
+            if manifest["generation"] != self.generation:
+                rebase_table(self, manifest)
+            self.write()
+
+    def write(self):
+        mask = self.saved_live()
+        new_keys = np.fromiter(self.delta.keys(), dtype=np.int64, count=len(self.delta))
+        keys = np.concatenate([np.asarray(self.keys)[mask], new_keys])
+        order = np.argsort(keys, kind="stable")
+
+        generation = self.generation + 1
+        atomic_save(array_path(self.name, generation, "keys"), keys[order])
+        for c, dtype in self.columns.items():
+            delta_values = np.array([self.column_value(c, v) for v in self.delta.values()], dtype=dtype)
+            column = np.concatenate([np.asarray(self.values[c])[mask].astype(dtype), delta_values])
+            atomic_save(array_path(self.name, generation, c), column[order])
+        atomic_save(manifest_path(self.name), {"generation": generation, "count": len(keys)})
+        sync_dir()
+        remove_old_generations(self.name, generation)
+
+        self.load(read_manifest(self.name))
+        self.delta = {}
+        self.deleted = set()
+        self.count = len(self.keys)
+
+    def snapshot_size(self):
+        return sum(os.path.getsize(p) for p in glob.glob(f"{COMPACT_DIR}/{self.name}.{self.generation}.*.npy"))
+
+
+class CompactDict(CompactTable, MutableMapping):
+    """dict-like relationship table with attribute columns (song_album, song_playlist)."""
+
+    def __getitem__(self, key):
+        k = self.edge_key(key)
+        if k is not None and k in self.delta:
+            return self.delta[k]
+        if k is None or k in self.deleted:
+            raise KeyError(key)
+        i = self.saved_position(k)
+        if i is None:
+            raise KeyError(key)
+        return self.value_at(i)
+
+    def __setitem__(self, key, value):
+        self.put(self.edge_key(key, create=True), value)
+        self.pending.append(["put", "|".join(key), value])
+
+    def __delitem__(self, key):
+        if not self.drop(self.edge_key(key)):
+            raise KeyError(key)
+        self.pending.append(["del", "|".join(key)])
+
+    def apply(self, record):
+        key = tuple(record[1].split("|"))
+        if record[0] == "put":
+            self.put(self.edge_key(key, create=True), record[2])
+        else:
+            self.drop(self.edge_key(key))
+
+    def import_json(self, raw):
+        for k, v in raw.items():
+            self.put(self.edge_key(tuple(k.split("|")), create=True), v)
+
+    def snapshot(self):
+        return {f"{a}|{b}": self[(a, b)] for a, b in self}
+
+
+class CompactSet(CompactTable, MutableSet):
+    """set-like relationship table without attributes (song_artist)."""
+
+    def add(self, key):
+        k = self.edge_key(key, create=True)
+        if not self.has(k):
+            self.put(k, None)
+            self.pending.append(["add", "|".join(key)])
+
+    def discard(self, key):
+        if self.drop(self.edge_key(key)):
+            self.pending.append(["del", "|".join(key)])
+
+    def apply(self, record):
+        key = tuple(record[1].split("|"))
+        if record[0] == "add":
+            self.put(self.edge_key(key, create=True), None)
+        else:
+            self.drop(self.edge_key(key))
+
+    def import_json(self, raw):
+        for k in raw:
+            self.put(self.edge_key(tuple(k.split("|")), create=True), None)
+
+    def snapshot(self):
+        return [f"{a}|{b}" for a, b in self]
+
+
+class EntityDict(MutableMapping):
+    """
+    dict-like entity table (songs, albums, artists). The saved entries are a sorted array of IDs, and each ID's
+    attributes are a JSON document in a byte heap, found through an offsets array. `in` is a binary search over the
+    IDs, and a lookup parses only that entity's document.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.pairs = False
+        self.pending = []
+        self.delta = {}         # id -> value for IDs added or changed since the last save
+        self.deleted = set()    # saved IDs deleted since the last save
+        with locked():
+            self.load(read_manifest(name))
+        self.count = len(self.keys)
+
+    def load(self, manifest):
+        self.generation = manifest["generation"]
+        if self.generation:
+            self.keys = load_array(self.name, self.generation, "ids")
+            self.offsets = load_array(self.name, self.generation, "offsets")
+            self.heap = load_array(self.name, self.generation, "heap")
+        else:
+            self.keys = np.array([], dtype="S22")
+            self.offsets = np.zeros(1, dtype=np.int64)
+            self.heap = np.array([], dtype=np.uint8)
+
+    def saved_position(self, key):
+        """Position of key in the saved IDs, or None."""
+        if not isinstance(key, str) or not len(self.keys):
+            return None
+        raw = key.encode()
+        i = int(np.searchsorted(self.keys, raw))
+        if i < len(self.keys) and self.keys[i] == raw:
+            return i
+        return None
+
+    def has(self, key):
+        if key in self.delta:
+            return True
+        return key not in self.deleted and self.saved_position(key) is not None
+
+    def __contains__(self, key):
+        return self.has(key)
+
+    def __len__(self):
+        return self.count
+
+    def saved_value(self, i):
+        return json.loads(self.heap[self.offsets[i]:self.offsets[i + 1]].tobytes())
+
+    def __getitem__(self, key):
+        if key in self.delta:
+            return self.delta[key]
+        i = None if key in self.deleted else self.saved_position(key)
+        if i is None:
+            raise KeyError(key)
+        return self.saved_value(i)
+
+    def put(self, key, value):
+        if not self.has(key):
+            self.count += 1
+        self.delta[key] = value
+        self.deleted.discard(key)
+
+    def drop(self, key):
+        if not self.has(key):
+            return False
+        self.count -= 1
+        self.delta.pop(key, None)
+        if self.saved_position(key) is not None:
+            self.deleted.add(key)
+        return True
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+        self.pending.append(["put", key, value])
+
+    def __delitem__(self, key):
+        if not self.drop(key):
+            raise KeyError(key)
+        self.pending.append(["del", key])
+
+    def apply(self, record):
+        if record[0] == "put":
+            self.put(record[1], record[2])
+        else:
+            self.drop(record[1])
+
+    def import_json(self, raw):
+        for k, v in raw.items():
+            self.put(k, v)
+
+    def saved_live(self):
+        """Mask of the saved IDs that are neither deleted nor overridden by delta."""
+        mask = np.ones(len(self.keys), dtype=bool)
+        changed = [k.encode() for k in self.deleted | self.delta.keys()]
+        if changed and len(self.keys):
+            mask &= ~np.isin(self.keys, np.array(changed, dtype=self.keys.dtype))
+        return mask
+
+    def __iter__(self):
+        live = np.flatnonzero(self.saved_live())
+        for start in range(0, len(live), 1_000_000):
+            yield from np.char.decode(np.asarray(self.keys[live[start:start + 1_000_000]])).tolist()
+        yield from list(self.delta)
+
+    def items(self):
+        live = np.flatnonzero(self.saved_live())
+        for i in live:
+            yield self.keys[i].decode(), self.saved_value(i)
+        yield from list(self.delta.items())
+
+    def snapshot(self):
+        return dict(self.items())
+
+    """
+    Merges the in-memory changes into a new generation of files. Kept entries are copied from the old heap as raw
+    bytes, without parsing them
+    """
+    def save(self):
+        with locked():
+            manifest = read_manifest(self.name)
+            if manifest["generation"] != self.generation:
+                rebase_table(self, manifest)
+            self.write()
+
+    def write(self):
+        live = np.flatnonzero(self.saved_live())
+        starts = np.asarray(self.offsets[:-1])[live]
+        lengths = np.asarray(self.offsets[1:])[live] - starts
+
+        delta_docs = [json.dumps(v).encode() for v in self.delta.values()]
+        delta_lengths = np.array([len(d) for d in delta_docs], dtype=np.int64)
+        delta_heap = np.frombuffer(b"".join(delta_docs), dtype=np.uint8)
+        delta_starts = len(self.heap) + np.concatenate([[0], np.cumsum(delta_lengths)[:-1]]).astype(np.int64)
+
+        new_ids = np.array([k.encode() for k in self.delta], dtype="S") if self.delta else np.array([], dtype="S22")
+        width = max(self.keys.dtype.itemsize, new_ids.dtype.itemsize)
+        keys = np.concatenate([np.asarray(self.keys)[live].astype(f"S{width}"), new_ids.astype(f"S{width}")])
+        order = np.argsort(keys, kind="stable")
+        starts = np.concatenate([starts, delta_starts])[order]
+        lengths = np.concatenate([lengths, delta_lengths])[order]
+
+        # Gather every document's bytes, in ID order, from the old heap followed by the new documents
+        source = np.concatenate([np.asarray(self.heap), delta_heap])
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        gather = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1], dtype=np.int64)
+        heap = source[gather]
+
+        generation = self.generation + 1
+        atomic_save(array_path(self.name, generation, "ids"), keys[order])
+        atomic_save(array_path(self.name, generation, "offsets"), offsets)
+        atomic_save(array_path(self.name, generation, "heap"), heap)
+        atomic_save(manifest_path(self.name), {"generation": generation, "count": len(keys)})
+        sync_dir()
+        remove_old_generations(self.name, generation)
+
+        self.load(read_manifest(self.name))
+        self.delta = {}
+        self.deleted = set()
+        self.count = len(self.keys)
+
+    def snapshot_size(self):
+        return sum(os.path.getsize(p) for p in glob.glob(f"{COMPACT_DIR}/{self.name}.{self.generation}.*.npy"))
+
+
+def is_compact(table):
+    return isinstance(table, (CompactTable, EntityDict))
+
+
+"""
+Writes every compact table back out as a data/<table>.json snapshot (the format create_tsv.py reads)
+"""
+def export_json():
+    import crawl_state
+
+    for name in list(TABLES) + ENTITY_TABLES:
+        if not read_manifest(name)["generation"]:
+            continue
+        if name in ENTITY_TABLES:
+            table = EntityDict(name)
+        else:
+            table = CompactDict(name) if TABLES[name] else CompactSet(name)
+        table = crawl_state.load_table(table)
+        # Fold the journal in first, so the JSON snapshot and the (then empty) journal agree
+        crawl_state.compact(table)
+        crawl_state.write_snapshot(name, table.snapshot())
+        print(f"✅ Exported {len(table)} rows of {name} to {crawl_state.snapshot_path(name)}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] == ["export"]:
+        export_json()
+    else:
+        print("Usage: python compact_store.py export")
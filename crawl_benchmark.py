@@ -0,0 +1,174 @@
+"""
+Measures crawler throughput offline, by running the crawl stages against recorded Spotify responses
+(see replay_client.py). Record fixtures once, on a machine with network access and credentials:
+    CRAWL_RECORD=data/fixtures.jsonl.gz CRAWL_CACHE=0 python pipeline.py --skip-tsv
+
+Then benchmark anywhere. Each run copies a starting state (by default an empty one, which is what the recording
+started from above) to a scratch directory and runs the stages one after another, like the standalone scripts:
+    playlists (songs_from_playlist.py) -> albums (process_albums.py) -> songs (remaining_songs.py) -> artists (process_artists.py)
+For every stage it reports requests/sec, items/sec, injected 429s and the time spent in crawl_state checkpoints.
+Requests still go through the crawler engine's rate limit (CRAWL_RATE, 10 per second by default). Raise it with
+--rate to measure the crawler's own overhead instead of the limit.
+
+To measure a multi-credential client pool (see client_pool.py), replay through --clients N clients, each limited
+like one Spotify app with --client-rate-limit, e.g. --clients 4 --client-rate-limit 20 --rate 40. Throughput should
+grow with the number of clients.
+
+Usage: python crawl_benchmark.py [--fixtures data/fixtures.jsonl.gz] [--state DIR] [--latency-ms 50]
+                                 [--throttle-rate 0.01] [--retry-after 1] [--rate 1000] [--max-in-flight 8]
+                                 [--clients 4] [--client-rate-limit 20]
+                                 [--stages playlists albums ...]
+                                 [--report report.json] [--verbose]
+"""
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Stage name -> module run for it
+STAGES = {
+    "playlists": "songs_from_playlist",
+    "albums": "process_albums",
+    "songs": "remaining_songs",
+    "artists": "process_artists",
+}
+
+
+class CheckpointTimer:
+    """Wraps crawl_state.checkpoint and crawl_state.close, and adds up the time spent in them."""
+
+    def __init__(self, crawl_state):
+        self.seconds = 0.0
+        self.checkpoints = 0
+        self.depth = 0
+        crawl_state.checkpoint = self.timed(crawl_state.checkpoint, counts=True)
+        crawl_state.close = self.timed(crawl_state.close, counts=False)
+
+    def timed(self, fn, counts):
+        def wrapper(*args, **kwargs):
+            # close() calls checkpoint(), which must not be counted twice
+            self.depth += 1
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.seconds += time.perf_counter() - start
+                    self.checkpoints += counts
+        return wrapper
+
+    def reset(self):
+        self.seconds = 0.0
+        self.checkpoints = 0
+
+
+def run_stage(name, module, timer, replay_client, verbose):
+    replay_client.reset_stats()
+    timer.reset()
+    sys.argv = [f"{module.__name__}.py"]
+
+    out = sys.stdout if verbose else open(os.devnull, "w")
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(out):
+            module.main()
+    except SystemExit:
+        # The standalone scripts exit when their *_to_check file does not exist
+        pass
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    seconds = time.perf_counter() - start
+
+    stats = dict(replay_client.stats)
+    return {
+        "seconds": round(seconds, 3),
+        "requests": stats["requests"],
+        "requests_per_sec": round(stats["requests"] / seconds, 1),
+        "items": stats["items"],
+        "items_per_sec": round(stats["items"] / seconds, 1),
+        "throttled": stats["throttled"],
+        "missing": stats["missing"],
+        "checkpoints": timer.checkpoints,
+        "checkpoint_seconds": round(timer.seconds, 3),
+        "checkpoint_share": round(timer.seconds / seconds, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the crawl stages against recorded responses")
+    parser.add_argument("--fixtures", default="data/fixtures.jsonl.gz", help="file recorded with CRAWL_RECORD")
+    parser.add_argument("--state", help="data directory to start from (default: empty)")
+    parser.add_argument("--latency-ms", type=float, default=0, help="delay added to every request")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="share of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds of injected 429s")
+    parser.add_argument("--rate", type=float, help="engine requests per second (default: CRAWL_RATE)")
+    parser.add_argument("--max-in-flight", type=int, help="engine concurrent requests (default: CRAWL_MAX_IN_FLIGHT)")
+    parser.add_argument("--clients", type=int, default=1, help="replay clients in the pool, like credential pairs")
+    parser.add_argument("--client-rate-limit", type=float, default=0,
+                        help="requests per second each client may make before getting 429s")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--report", help="also write the results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="show the stages' own output")
+    args = parser.parse_args()
+
+    fixtures = os.path.abspath(args.fixtures)
+    if not os.path.exists(fixtures):
+        print(f"❌ {args.fixtures} not found. Record fixtures first (see crawl_benchmark.py)")
+        exit(1)
+
+    # Settings are read when the modules are imported, so set them first
+    os.environ["CRAWL_REPLAY"] = fixtures
+    os.environ["CRAWL_REPLAY_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["CRAWL_REPLAY_429_RATE"] = str(args.throttle_rate)
+    os.environ["CRAWL_REPLAY_RETRY_AFTER"] = str(args.retry_after)
+    os.environ["CRAWL_REPLAY_CLIENTS"] = str(args.clients)
+    os.environ["CRAWL_REPLAY_RATE_LIMIT"] = str(args.client_rate_limit)
+    if args.rate:
+        os.environ["CRAWL_RATE"] = str(args.rate)
+    if args.max_in_flight:
+        os.environ["CRAWL_MAX_IN_FLIGHT"] = str(args.max_in_flight)
+    report_path = os.path.abspath(args.report) if args.report else None
+
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="crawl_benchmark_")
+    if args.state:
+        shutil.copytree(args.state, os.path.join(workdir, "data"))
+    os.makedirs(os.path.join(workdir, "data", "journal"), exist_ok=True)
+    os.chdir(workdir)
+
+    try:
+        import crawl_state
+        import replay_client
+        # Load the fixtures up front so the first stage is not charged for it
+        replay_client.load_fixtures(fixtures)
+        timer = CheckpointTimer(crawl_state)
+        results = {}
+        for name in args.stages:
+            module = importlib.import_module(STAGES[name])
+            results[name] = run_stage(name, module, timer, replay_client, args.verbose)
+            r = results[name]
+            print(f"🔹 {name:<10} {r['seconds']:>8.2f}s  {r['requests_per_sec']:>8.1f} req/s  "
+                  f"{r['items_per_sec']:>9.1f} items/s  {r['throttled']:>4} 429s  "
+                  f"checkpoints {r['checkpoint_seconds']:.2f}s ({r['checkpoint_share']:.0%})")
+            if r["missing"]:
+                print(f"⚠️ {r['missing']} requests were not in the fixtures")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if report_path:
+        settings = {k: v for k, v in vars(args).items() if k not in ("report", "verbose")}
+        with open(report_path, "w") as f:
+            json.dump({"settings": settings, "stages": results}, f, indent=2)
+        print(f"✅ Saved report to {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,466 @@
+"""
+Persistent crawl state shared by the crawl scripts. Every table (songs, song_album, artists_to_check, ...) is stored as
+    data/<table>.json             a snapshot, in the same format the scripts have always written
+    data/journal/<table>.jsonl    an append-only log of every change made since that snapshot
+
+Tables are loaded as JournaledDict / JournaledSet, which behave like a normal dict / set but record each change in
+memory. checkpoint() appends only those records to the journal files and fsyncs them once per checkpoint, so its cost
+is proportional to what changed instead of to the size of the catalog. A table's journal is compacted into a new
+snapshot once it grows larger than the snapshot itself, which keeps total write volume linear in the crawl size.
+
+Relationship tables use (id, id) tuple keys, which are flattened to "a|b" strings on disk.
+
+Restarts lose at most the work that was in flight. Work queues are consumed with lease() / ack() (see
+crawler_engine.take): an item only counts as removed once its batch is done, and queue journals are written after
+every other table at each checkpoint. Snapshots are replaced atomically (write_snapshot).
+
+Set CRAWL_STORE=sqlite to keep the same tables in data/crawl_state.sqlite instead (see sqlite_store.py), or
+CRAWL_STORE=compact to keep the entity and relationship tables as memory-mapped arrays (see compact_store.py).
+
+The stages' "already found?" checks go through a seen-ID index per entity type (load_seen, see seen_ids.py), which
+works with every store. Stages consume the *_to_check sets in priority order through load_frontier (see frontier.py).
+"""
+import json
+import os
+import time
+
+import compact_store
+import frontier
+import json_stream
+import metrics
+import seen_ids
+import sqlite_store
+
+BACKEND = os.environ.get("CRAWL_STORE", "json")      # "json", "sqlite" or "compact"
+
+DATA_DIR = "data"
+JOURNAL_DIR = f"{DATA_DIR}/journal"
+os.makedirs(f"{JOURNAL_DIR}", exist_ok=True)
+
+COMPACT_RATIO = 1.0                 # Compact once journal size > snapshot size * COMPACT_RATIO
+MIN_COMPACT_BYTES = 1024 * 1024     # ...and is at least this big
+
+# table name -> loaded table. Loading a table twice in one process returns the same object
+tables = {}
+# entity -> its Frontier (see load_frontier)
+frontiers = {}
+
+
+def encode_key(key):
+    return "|".join(key) if isinstance(key, tuple) else key
+
+
+def decode_key(key, pairs):
+    return tuple(key.split("|")) if pairs else key
+
+
+"""
+Whether a table is saved as arrays of its own (compact_store tables, seen-ID indexes) instead of a .json snapshot
+"""
+def has_arrays(table):
+    return compact_store.is_compact(table) or isinstance(table, seen_ids.SeenIds)
+
+
+class JournaledDict(dict):
+    """dict that records every assignment and deletion for the next checkpoint."""
+
+    def __init__(self, name, pairs=False):
+        super().__init__()
+        self.name = name
+        self.pairs = pairs
+        self.pending = []
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.pending.append(["put", encode_key(key), value])
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.pending.append(["del", encode_key(key)])
+
+    def pop(self, key, *default):
+        if key in self:
+            self.pending.append(["del", encode_key(key)])
+        return super().pop(key, *default)
+
+    def apply(self, record):
+        op, key = record[0], decode_key(record[1], self.pairs)
+        if op == "put":
+            super().__setitem__(key, record[2])
+        else:
+            super().pop(key, None)
+
+    def snapshot(self):
+        if self.pairs:
+            return {encode_key(k): v for k, v in self.items()}
+        return self
+
+
+class JournaledSet(set):
+    """
+    set that records every addition and removal for the next checkpoint. Work queues (*_to_check) are consumed with
+    lease() and ack(): leased items leave the set but are only recorded as removed once they are acknowledged.
+    """
+
+    def __init__(self, name, pairs=False):
+        super().__init__()
+        self.name = name
+        self.pairs = pairs
+        self.pending = []
+        self.leased = set()
+
+    def add(self, key):
+        if key not in self:
+            super().add(key)
+            self.pending.append(["add", encode_key(key)])
+
+    def discard(self, key):
+        if key in self:
+            super().discard(key)
+            self.pending.append(["del", encode_key(key)])
+
+    def remove(self, key):
+        super().remove(key)
+        self.pending.append(["del", encode_key(key)])
+
+    def pop(self):
+        key = super().pop()
+        self.pending.append(["del", encode_key(key)])
+        return key
+
+    def lease(self, n):
+        """Takes up to n items out of the set without recording their removal."""
+        keys = [super(JournaledSet, self).pop() for _ in range(min(n, len(self)))]
+        self.leased.update(keys)
+        return keys
+
+    def lease_keys(self, keys):
+        """Leases the given items, which must be in the set. Used by frontier.Frontier to lease in priority order."""
+        for key in keys:
+            super().remove(key)
+        self.leased.update(keys)
+        return keys
+
+    def ack(self, keys):
+        """Records leased items as done. An item added again while it was leased stays in the set."""
+        for key in keys:
+            self.leased.discard(key)
+            if key not in self:
+                self.pending.append(["del", encode_key(key)])
+
+    def release(self, keys):
+        """Returns leased items to the set unprocessed."""
+        for key in keys:
+            if key in self.leased:
+                self.leased.discard(key)
+                super().add(key)
+
+    def apply(self, record):
+        op, key = record[0], decode_key(record[1], self.pairs)
+        if op == "add":
+            super().add(key)
+        else:
+            super().discard(key)
+
+    def snapshot(self):
+        # Leased items are still owed work, so they stay in the saved set until acknowledged
+        return [encode_key(k) for k in self] + [encode_key(k) for k in self.leased if k not in self]
+
+
+def snapshot_path(name):
+    return f"{DATA_DIR}/{name}.json"
+
+
+def journal_path(name):
+    return f"{JOURNAL_DIR}/{name}.jsonl"
+
+
+"""
+Rebuilds a table from its snapshot and journal. A record cut off by a crash mid-write can only be the
+last line of a journal, so an unparseable last line is dropped.
+"""
+def load_table(table, required=False):
+    has_snapshot = os.path.exists(snapshot_path(table.name))
+    has_journal = os.path.exists(journal_path(table.name))
+    # A compact table's arrays replace its JSON snapshot once they have been saved
+    is_compact = has_arrays(table)
+    has_saved_arrays = is_compact and table.generation > 0
+    if required and not has_snapshot and not has_journal and not has_saved_arrays:
+        raise FileNotFoundError(snapshot_path(table.name))
+
+    if has_snapshot and not has_saved_arrays:
+        with open(snapshot_path(table.name), "r") as f:
+            raw = json.load(f)
+        if is_compact:
+            table.import_json(raw)
+        elif isinstance(table, JournaledDict):
+            for k, v in raw.items():
+                dict.__setitem__(table, decode_key(k, table.pairs), v)
+        else:
+            set.update(table, (decode_key(k, table.pairs) for k in raw))
+
+    if has_journal:
+        with open(journal_path(table.name), "rb+") as f:
+            valid_end = 0
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Cut it off so the next checkpoint does not append onto a partial line
+                    print(f"⚠️ Dropping incomplete record at the end of {journal_path(table.name)}")
+                    f.truncate(valid_end)
+                    break
+                table.apply(record)
+                valid_end += len(line)
+
+    if is_compact and not has_saved_arrays and (has_snapshot or has_journal):
+        compact(table)
+        print(f"📥 Imported {len(table)} {table.name} rows into {compact_store.COMPACT_DIR}")
+    return table
+
+
+"""
+Opens a table in the SQLite store. A table opened for the first time is filled from its
+JSON snapshot and journal, if there are any.
+"""
+def open_sqlite(store_class, json_table, required):
+    has_json = os.path.exists(snapshot_path(json_table.name)) or os.path.exists(journal_path(json_table.name))
+    sql_name = sqlite_store.table_spec(json_table.name, json_table.pairs)[0]
+    if required and not has_json and not sqlite_store.table_exists(sql_name):
+        raise FileNotFoundError(snapshot_path(json_table.name))
+
+    table = store_class(json_table.name, json_table.pairs)
+    if table.created and has_json:
+        load_table(json_table)
+        table.import_rows(json_table.items() if isinstance(json_table, dict) else json_table)
+        print(f"📥 Imported {len(table)} {table.name} rows into {sqlite_store.DB_PATH}")
+    return table
+
+
+def load_dict(name, pairs=False, required=False):
+    if name not in tables:
+        if BACKEND == "compact" and pairs and name in compact_store.TABLES:
+            tables[name] = load_table(compact_store.CompactDict(name), required)
+        elif BACKEND == "compact" and name in compact_store.ENTITY_TABLES:
+            tables[name] = load_table(compact_store.EntityDict(name), required)
+        elif BACKEND == "sqlite":
+            tables[name] = open_sqlite(sqlite_store.SqliteDict, JournaledDict(name, pairs), required)
+        else:
+            tables[name] = load_table(JournaledDict(name, pairs), required)
+    return tables[name]
+
+
+def load_set(name, pairs=False, required=False):
+    if name not in tables:
+        if BACKEND == "compact" and pairs and name in compact_store.TABLES:
+            tables[name] = load_table(compact_store.CompactSet(name), required)
+        elif BACKEND == "sqlite":
+            tables[name] = open_sqlite(sqlite_store.SqliteSet, JournaledSet(name, pairs), required)
+        else:
+            tables[name] = load_table(JournaledSet(name, pairs), required)
+    return tables[name]
+
+
+"""
+Every ID of an entity type that is stored in <entity> or queued in <entity>_to_check, leased items included. With
+the JSON store, tables this process has not loaded are streamed from their snapshots instead of loaded
+"""
+def known_ids(entity):
+    queue = f"{entity}_to_check"
+    if BACKEND == "json" and entity not in tables:
+        yield from (key for key, _ in iter_dict(entity))
+    else:
+        yield from load_dict(entity)
+    if BACKEND == "json" and queue not in tables:
+        yield from iter_set(queue)
+    else:
+        to_check = load_set(queue)
+        yield from to_check
+        yield from to_check.leased
+
+
+"""
+Opens the seen-ID index of an entity type (see seen_ids.py). An index opened for the first time is built from
+known_ids(entity)
+"""
+def load_seen(entity):
+    name = f"seen_{entity}"
+    if name not in tables:
+        seen = seen_ids.SeenIds(entity)
+        if seen.generation == 0:
+            seen.import_ids(known_ids(entity))
+        tables[name] = load_table(seen)
+        if seen.generation == 0:
+            compact(seen)
+            print(f"📥 Indexed {len(seen)} known {entity} IDs in {seen_ids.SEEN_DIR}")
+    return tables[name]
+
+
+"""
+Opens the work queue of an entity type as a frontier.Frontier: the <entity>_to_check set, its seen-ID index and the
+priority signals of its items (<entity>_frontier)
+"""
+def load_frontier(entity, required=False):
+    if entity not in frontiers:
+        queue = load_set(f"{entity}_to_check", required=required)
+        frontiers[entity] = frontier.Frontier(queue, load_seen(entity), load_dict(f"{entity}_frontier"))
+    return frontiers[entity]
+
+
+"""
+Returns the last journal record for each key of a table, skipping an incomplete last line.
+"""
+def journal_overrides(name):
+    overrides = {}
+    if os.path.exists(journal_path(name)):
+        with open(journal_path(name), "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                overrides[record[1]] = record
+    return overrides
+
+
+"""
+Streams a dict table's (key, value) pairs from its snapshot without loading the table, applying any changes still
+in its journal on the way. Only the journal is held in memory, and close() leaves it empty.
+Used by exports that should not need the whole catalog in memory (create_tsv.py --stream).
+"""
+def iter_dict(name, pairs=False):
+    overrides = journal_overrides(name)
+    if os.path.exists(snapshot_path(name)):
+        for key, value in json_stream.iter_json(snapshot_path(name)):
+            record = overrides.pop(key, None)
+            if record is None:
+                yield decode_key(key, pairs), value
+            elif record[0] == "put":
+                yield decode_key(key, pairs), record[2]
+    for key, record in overrides.items():
+        if record[0] == "put":
+            yield decode_key(key, pairs), record[2]
+
+
+"""
+Streams a set table's keys, like iter_dict.
+"""
+def iter_set(name, pairs=False):
+    overrides = journal_overrides(name)
+    if os.path.exists(snapshot_path(name)):
+        for key in json_stream.iter_json(snapshot_path(name)):
+            record = overrides.pop(key, None)
+            if record is None or record[0] == "add":
+                yield decode_key(key, pairs)
+    for key, record in overrides.items():
+        if record[0] == "add":
+            yield decode_key(key, pairs)
+
+
+"""
+Replaces a snapshot file atomically: the data is written to a temporary file, fsynced, and renamed over the old
+snapshot, so a crash leaves either the old or the new snapshot, never a truncated one.
+"""
+def write_snapshot(name, snapshot):
+    path = snapshot_path(name)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(snapshot, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    # The rename itself is only durable once the directory is synced
+    dir_fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+"""
+Writes a table's full contents as its new snapshot and empties its journal. If a crash hits between the two, the
+old journal is replayed onto the new snapshot on the next load, which gives the same table.
+"""
+def compact(table):
+    start = time.perf_counter()
+    if has_arrays(table):
+        table.save()
+    else:
+        write_snapshot(table.name, table.snapshot())
+    open(journal_path(table.name), "w").close()
+    metrics.inc("compaction_seconds_total", time.perf_counter() - start)
+    metrics.inc("compaction_bytes_total", snapshot_size(table))
+
+
+def snapshot_size(table):
+    if has_arrays(table):
+        return table.snapshot_size()
+    return os.path.getsize(snapshot_path(table.name)) if os.path.exists(snapshot_path(table.name)) else 0
+
+
+"""
+Appends every pending record to its table's journal (one write and one fsync per changed table),
+then compacts any journal that has outgrown its snapshot. With the SQLite store, commits instead
+(seen-ID indexes are still journaled, after the commit). Returns the number of records written.
+"""
+def checkpoint():
+    start = time.perf_counter()
+    if BACKEND == "sqlite":
+        written = sqlite_store.commit()
+        written += write_journals([t for t in tables.values() if isinstance(t, seen_ids.SeenIds)])
+    else:
+        written = write_journals(tables.values())
+    metrics.observe("checkpoint_seconds", time.perf_counter() - start)
+
+    # Counting a SQLite table scans it, so only the frontiers are counted there
+    metrics.record_tables({name: t for name, t in tables.items() if BACKEND != "sqlite" or name.endswith("_to_check")})
+    metrics.export()
+    return written
+
+
+"""
+Order in which journals are written. Work queues come after the other tables, so an item is never recorded as done
+before the results of its work are on disk. Seen-ID indexes come last, so an ID is never recorded as seen before it
+is stored or queued (which would keep it from ever being crawled)
+"""
+def journal_order(table):
+    if isinstance(table, seen_ids.SeenIds):
+        return 2
+    return 1 if table.name.endswith("_to_check") else 0
+
+
+"""
+Appends the pending records of every changed table to its journal, compacting journals that outgrew their snapshot
+"""
+def write_journals(to_write):
+    written = 0
+    for table in sorted(to_write, key=journal_order):
+        if not table.pending:
+            continue
+        data = "".join(json.dumps(record) + "\n" for record in table.pending).encode()
+        metrics.inc("checkpoint_bytes_total", len(data))
+        with open(journal_path(table.name), "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        written += len(table.pending)
+        table.pending = []
+
+        journal_size = os.path.getsize(journal_path(table.name))
+        if journal_size > max(snapshot_size(table) * COMPACT_RATIO, MIN_COMPACT_BYTES):
+            compact(table)
+    return written
+
+
+"""
+Final checkpoint of a run. Compacts every loaded table so the snapshot .json files are complete
+for create_tsv.py.
+"""
+def close():
+    checkpoint()
+    for table in tables.values():
+        if BACKEND == "sqlite" and not isinstance(table, seen_ids.SeenIds):
+            continue
+        if os.path.exists(journal_path(table.name)) and os.path.getsize(journal_path(table.name)) > 0:
+            compact(table)
+    metrics.export(force=True)
@@ -0,0 +1,222 @@
+"""
+Concurrent fetch engine shared by the crawl scripts. spotipy is blocking, so every call runs in a worker thread,
+with up to MAX_IN_FLIGHT requests outstanding at once. All workers draw from one token bucket. When Spotify answers
+429, the bucket pauses everyone for Retry-After seconds and halves its rate, then slowly speeds back up, instead of
+each worker sleeping and retrying on its own.
+
+With several credential pairs (CRAWL_CREDENTIALS, see client_pool.py), every client gets its own token bucket, and
+MAX_IN_FLIGHT and CRAWL_RATE apply per client. Each request goes to the client that can send soonest, and a 429 only
+pauses the client that got it.
+
+Tuning (environment variables):
+    CRAWL_MAX_IN_FLIGHT     concurrent requests per client (default 8)
+    CRAWL_RATE              starting requests per second per client (default 10)
+    CRAWL_REQUEST_BUDGET    requests a run may make before take() stops handing out work (default 0, no limit).
+                            Frontiers hand out their best items first (see frontier.py), so a run stopped by its
+                            budget has crawled the most useful part of the catalog. Batches already taken finish
+
+Responses are cached on disk (see response_cache.py), so re-running a crawl skips most requests it already made.
+Request counts, latencies and rate-limit pauses are recorded in metrics.py.
+"""
+import spotipy
+from spotipy.oauth2 import SpotifyClientCredentials
+
+import client_pool
+import metrics
+import response_cache
+
+import asyncio
+import os
+import time
+
+MAX_IN_FLIGHT = int(os.environ.get("CRAWL_MAX_IN_FLIGHT", 8))
+REQUESTS_PER_SECOND = float(os.environ.get("CRAWL_RATE", 10))
+MIN_REQUESTS_PER_SECOND = 0.5
+REQUEST_BUDGET = int(os.environ.get("CRAWL_REQUEST_BUDGET", 0))
+
+requests_made = 0           # Requests made by every engine in this process, for REQUEST_BUDGET
+budget_reported = False
+
+
+"""
+Creates the Spotify client used by the engine, or a client_pool.ClientPool with one client per CRAWL_CREDENTIALS
+pair. 429 is left out of spotipy's own retry list so the response (and its Retry-After header) reaches the engine
+instead of being slept on inside a worker thread. Clients share one on-disk response cache unless CRAWL_CACHE=0.
+
+CRAWL_REPLAY=<fixtures> returns clients that replay recorded responses instead (CRAWL_REPLAY_CLIENTS of them), and
+CRAWL_RECORD=<fixtures> records every response (see replay_client.py).
+"""
+def make_client():
+    if os.environ.get("CRAWL_REPLAY"):
+        import replay_client
+        clients = [replay_client.ReplayClient(os.environ["CRAWL_REPLAY"]) for _ in range(replay_client.CLIENTS)]
+    else:
+        cache = response_cache.ResponseCache() if response_cache.ENABLED else None
+        clients = []
+        for client_id, client_secret in client_pool.credentials():
+            auth_manager = SpotifyClientCredentials(client_id=client_id, client_secret=client_secret)
+            sp = response_cache.wrap(spotipy.Spotify(auth_manager=auth_manager, status_forcelist=(500, 502, 503, 504)), cache)
+            if os.environ.get("CRAWL_RECORD"):
+                import replay_client
+                sp = replay_client.RecordingClient(sp, os.environ["CRAWL_RECORD"])
+            clients.append(sp)
+    return clients[0] if len(clients) == 1 else client_pool.ClientPool(clients)
+
+
+class TokenBucket:
+    """Shared request budget. Refills at `rate` tokens per second, up to `capacity`."""
+
+    def __init__(self, rate=REQUESTS_PER_SECOND, capacity=MAX_IN_FLIGHT):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, wait_out_pause=True):
+        """Takes a token. With wait_out_pause=False, returns False instead of waiting while the bucket is paused."""
+        # Waiters queue on the lock, so a pause holds back every worker at once
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    if not wait_out_pause:
+                        return False
+                    await asyncio.sleep(self.paused_until - now)
+                    metrics.inc("rate_limit_sleep_seconds_total", time.monotonic() - now)
+                    continue
+
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                metrics.inc("token_wait_seconds_total", time.monotonic() - now)
+
+    def wait_time(self, now):
+        """Seconds until acquire() could take a token, if nobody else takes one first."""
+        start = max(now, self.paused_until)
+        tokens = min(self.capacity, self.tokens + max(0.0, start - self.updated) * self.rate)
+        return start - now + max(0.0, 1 - tokens) / self.rate
+
+    def pause(self, retry_after):
+        """Stop all workers for retry_after seconds and back off the refill rate."""
+        now = time.monotonic()
+        # Requests that were in flight with the first 429 often get one too. They extend the pause, but do not
+        # halve the rate again
+        if now >= self.paused_until:
+            self.rate = max(MIN_REQUESTS_PER_SECOND, self.rate / 2)
+        self.paused_until = max(self.paused_until, now + retry_after)
+        self.tokens = 0
+        self.updated = self.paused_until
+
+    def succeeded(self):
+        """Additive increase back toward the configured rate after a successful request."""
+        self.rate = min(self.max_rate, self.rate + 0.1)
+
+
+class Lane:
+    """One client of the engine, with its own rate limit."""
+
+    def __init__(self, sp, name, rate, capacity):
+        self.sp = sp
+        self.name = name
+        self.bucket = TokenBucket(rate, capacity)
+        self.waiting = 0        # Calls that picked this lane and wait for its bucket
+
+
+class CrawlerEngine:
+    """Runs blocking spotipy calls concurrently, under one rate limit per client."""
+
+    def __init__(self, sp, max_in_flight=MAX_IN_FLIGHT, rate=REQUESTS_PER_SECOND):
+        self.sp = sp
+        clients = sp.clients if isinstance(sp, client_pool.ClientPool) else [sp]
+        self.lanes = [Lane(client, str(i), rate, max_in_flight) for i, client in enumerate(clients)]
+        self.in_flight = asyncio.Semaphore(max_in_flight * len(self.lanes))
+
+    def pick_lane(self):
+        """The lane that can send soonest, counting the calls already waiting for it. Ties go to the first lane."""
+        now = time.monotonic()
+        return min(self.lanes, key=lambda lane: lane.bucket.wait_time(now) + lane.waiting / lane.bucket.rate)
+
+    async def call(self, method, *args, **kwargs):
+        """Calls sp.<method>(*args, **kwargs), retrying on 429 (on another client, if there is one free sooner)."""
+        global requests_made
+        while True:
+            lane = self.pick_lane()
+            # While another client is not paused, a call waiting on a client that gets paused moves over to it
+            now = time.monotonic()
+            reroute = any(other.bucket.paused_until <= now for other in self.lanes if other is not lane)
+            lane.waiting += 1
+            try:
+                acquired = await lane.bucket.acquire(wait_out_pause=not reroute)
+            finally:
+                lane.waiting -= 1
+            if not acquired:
+                continue
+            async with self.in_flight:
+                requests_made += 1
+                start = time.perf_counter()
+                try:
+                    result = await asyncio.to_thread(getattr(lane.sp, method), *args, **kwargs)
+                except spotipy.SpotifyException as e:
+                    metrics.observe("spotify_request_seconds", time.perf_counter() - start, endpoint=method)
+                    metrics.inc("spotify_requests_total", endpoint=method, status=e.http_status)
+                    if e.http_status != 429:
+                        raise
+                    retry_after = int((e.headers or {}).get("Retry-After", 1))
+                    paused = "all workers" if len(self.lanes) == 1 else f"client {lane.name}"
+                    print(f"❌ Rate limit hit. Pausing {paused} for {retry_after} seconds.\n")
+                    metrics.inc("rate_limit_pauses_total", client=lane.name)
+                    lane.bucket.pause(retry_after)
+                    continue
+                metrics.observe("spotify_request_seconds", time.perf_counter() - start, endpoint=method)
+                metrics.inc("spotify_requests_total", endpoint=method, status=200)
+            lane.bucket.succeeded()
+            return result
+
+    async def call_many(self, method, arg_list, **kwargs):
+        """Runs sp.<method>(args, **kwargs) for every entry of arg_list concurrently. Results keep arg_list's order."""
+        return await asyncio.gather(*(self.call(method, args, **kwargs) for args in arg_list))
+
+
+"""
+Splits ids into lists of at most size items
+"""
+def chunks(ids, size):
+    ids = list(ids)
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+
+"""
+Whether this process has made CRAWL_REQUEST_BUDGET requests
+"""
+def budget_spent():
+    global budget_reported
+    if not REQUEST_BUDGET or requests_made < REQUEST_BUDGET:
+        return False
+    if not budget_reported:
+        print(f"⛔ Request budget of {REQUEST_BUDGET} spent. No more work will be started\n")
+        budget_reported = True
+    return True
+
+
+"""
+Leases up to n items from a *_to_check set (or its Frontier, best items first). They leave the set, but stay in its
+saved state until ack() is called for them, so a crash before then leaves them queued for the next run.
+Returns nothing once the request budget is spent
+"""
+def take(to_check, n):
+    if budget_spent():
+        return []
+    return to_check.lease(n)
+
+
+"""
+Acknowledges items from take() once their results are recorded. The next checkpoint writes the results first
+"""
+def ack(to_check, items):
+    to_check.ack(items)
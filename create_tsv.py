@@ -1,55 +1,63 @@
 """
-Converts .json files to .tsv ready to use with PostgreSQL. All tables are generated with the exception of 
-all relationship tables with Users and Playlists. Those will be generated in user_relationships.py using these files. 
+Converts .json files to .tsv ready to use with PostgreSQL. All tables are generated with the exception of
+all relationship tables with Users and Playlists. Those will be generated in user_relationships.py using these files.
 Input .json files should be in data/, and .tsv files will be saved in output/
+
+With --stream, tables are read incrementally from the snapshots (and any uncompacted journal) and written in
+chunks of rows, so memory stays flat no matter how large the catalog is. Each table is read twice: once to find its
+columns and how pandas would type them, once to write it. The output is the same as the pandas export's.
+
+With --jobs N, each table is exported in its own worker process (with either mode).
+
+Usage: python create_tsv.py [--stream] [--chunk-rows 10000] [--jobs N]
 """
 
+import argparse
+import csv
 import os
-import pandas as pd
 import json
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import crawl_state
 
 DATA_DIR = "data"
 OUTPUT_DIR = "output"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-# ----- ENTITIES -----
+CHUNK_ROWS = 10000
 
-# Load Entity data
+# Entity data
 entities = ["albums", "artists", "genres", "songs", "users"]
-entity_data = {}
+# Every output table, in export order. isGenre must come after genres
+TABLES = entities + ["performs", "inAlbum", "isGenre"]
+id_columns = {
+    "albums": "albumID",
+    "artists": "artistID",
+    "genres": "genreID",
+    "songs": "songID",
+    "users": "userID"
+}
 
-print(f"Loading entities...\n")
-for e in entities:
+
+# ----- PANDAS EXPORT -----
+
+def load_entity(e):
     path = os.path.join(DATA_DIR, f"{e}.json")
     try:
         with open(path, "r") as f:
-            entity_data[e] = json.load(f)
+            data = json.load(f)
         print(f"✅ Successfully loaded {e}.json")
+        return data
     except FileNotFoundError:
         print(f"❌ {path} not found. Initializing empty object")
+        return None
 
-albums = entity_data["albums"]
-artists = entity_data["artists"]
-genres = entity_data["genres"]
-songs = entity_data["songs"]
-users = entity_data["users"]
-
-# Saving in TSV files
-id_columns = {
-    "albums": "albumID",
-    "artists": "artistID",
-    "genres": "genreID",
-    "songs": "songID",
-    "users": "userID"
-}
 
-print(f"\nSaving entities...")
-for entity in entity_data.keys():
-    if entity == "genres":
-        # Genre is a set, cannot process like a dictionary
-        continue
+def save_entity(entity, data):
+    import pandas as pd
 
-    df = pd.DataFrame.from_dict(entity_data[entity], orient="index")
+    df = pd.DataFrame.from_dict(data, orient="index")
     df.index.name = id_columns[entity]
     df.reset_index(inplace=True)
 
@@ -58,85 +66,350 @@ for entity in entity_data.keys():
     if os.path.exists(tsv_path):
         print(f"✅ Successfully saved {entity} in {tsv_path}")
 
-# Save genres
-genres_list = list(genres)
-genres_df = pd.DataFrame({
-    "genreID": range(1, len(genres)+1),
-    "genreName": genres_list,
-})
-tsv_path = os.path.join(OUTPUT_DIR, "genres.tsv")
-genres_df.to_csv(tsv_path, sep="\t", index=False)
-if os.path.exists(tsv_path):
-    print(f"✅ Successfully saved genres in {tsv_path}")
 
+"""
+Genre IDs by name, numbered in sorted name order. Both exports and bulk_load.py use it, so a genre gets the same
+GenreID whichever way the crawl is loaded
+"""
+def genre_ids(genres):
+    return {name: i for i, name in enumerate(sorted(genres), start=1)}
+
+
+def save_genres(genres):
+    import pandas as pd
+
+    if genres is None:
+        return None
+    ids = genre_ids(genres)
+    genres_df = pd.DataFrame({
+        "genreID": list(ids.values()),
+        "genreName": list(ids.keys()),
+    })
+    tsv_path = os.path.join(OUTPUT_DIR, "genres.tsv")
+    genres_df.to_csv(tsv_path, sep="\t", index=False)
+    if os.path.exists(tsv_path):
+        print(f"✅ Successfully saved genres in {tsv_path}")
+    return genres_df
 
-# ----- RELATIONSHIPS -----
-print(f"\nLoading relationships...\n")
-# Save song-artist, song-album, and artist-genre
 
 # Song - Artist
-path = os.path.join(DATA_DIR, "song_artist.json")
-try:
-    with open(path, "r") as f:
-        raw = list(json.load(f))
-        song_artist = [pair.split("|") for pair in raw]
-        print(f"✅ Successfully loaded song_artist.json")
-    df = pd.DataFrame(song_artist, columns=["songID", "artistID"])
-    df = df.reindex(columns = ["artistID", "songID"])   # Reorder to match schema
-    
-    # Saving
-    song_artist_path = os.path.join(OUTPUT_DIR, "performs.tsv")
-    df.to_csv(song_artist_path, sep="\t", index=False)
-    if os.path.exists(song_artist_path):
+def save_performs():
+    import pandas as pd
+
+    path = os.path.join(DATA_DIR, "song_artist.json")
+    try:
+        with open(path, "r") as f:
+            raw = list(json.load(f))
+            song_artist = [pair.split("|") for pair in raw]
+            print(f"✅ Successfully loaded song_artist.json")
+        df = pd.DataFrame(song_artist, columns=["songID", "artistID"])
+        df = df.reindex(columns = ["artistID", "songID"])   # Reorder to match schema
+
+        # Saving
+        song_artist_path = os.path.join(OUTPUT_DIR, "performs.tsv")
+        df.to_csv(song_artist_path, sep="\t", index=False)
+        if os.path.exists(song_artist_path):
             print(f"✅ Successfully saved song_artist in {song_artist_path}\n")
 
-except FileNotFoundError:
+    except FileNotFoundError:
         print(f"❌ {path} not found. Skipping...")
 
+
 # Song - Album
-path = os.path.join(DATA_DIR, "song_album.json")
-try:
-    with open(path, "r") as f:
-        raw = json.load(f)
-        song_album = {tuple(k.split('|')): v for k, v in raw.items()}
-        print(f"✅ Successfully loaded song_album.json")
-    
-        df = pd.DataFrame([
-            {"songID": song, "albumID": album, **trackNums} for (song, album), trackNums in song_album.items()
-        ])
-        
-        # Saving
-        song_album_path = os.path.join(OUTPUT_DIR, "inAlbum.tsv")
-        df.to_csv(song_album_path, sep="\t", index=False)
-        if os.path.exists(song_album_path):
-            print(f"✅ Successfully saved song_album in {song_album_path}\n")
+def save_in_album():
+    import pandas as pd
+
+    path = os.path.join(DATA_DIR, "song_album.json")
+    try:
+        with open(path, "r") as f:
+            raw = json.load(f)
+            song_album = {tuple(k.split('|')): v for k, v in raw.items()}
+            print(f"✅ Successfully loaded song_album.json")
+
+            df = pd.DataFrame([
+                {"songID": song, "albumID": album, **trackNums} for (song, album), trackNums in song_album.items()
+            ])
+
+            # Saving
+            song_album_path = os.path.join(OUTPUT_DIR, "inAlbum.tsv")
+            df.to_csv(song_album_path, sep="\t", index=False)
+            if os.path.exists(song_album_path):
+                print(f"✅ Successfully saved song_album in {song_album_path}\n")
+
+    except FileNotFoundError:
+        print(f"❌ {path} not found. Skipping...")
 
-except FileNotFoundError:
-     print(f"❌ {path} not found. Skipping...")
 
 # Artist - Genre
-path = os.path.join(DATA_DIR, "artist_genre.json")
-try:
-    with open(path, "r") as f:
-        raw = json.load(f)
-        artist_genre = [pair.split('|') for pair in raw]
-        print(f"✅ Successfully loaded artist_genre.json")
-    
-    artist_genre_df = pd.DataFrame(artist_genre, columns=["artistID", "genreName"])
-    # Replace "genreName" with "genreID"
-    # Left outer join on artist_genre and genre on genreName, then drop genreName
-    merged = artist_genre_df.merge(
-        genres_df[["genreID", "genreName"]],
-        on="genreName",
-        how="left"
+def save_is_genre(genres_df):
+    import pandas as pd
+
+    if genres_df is None:
+        print(f"❌ No genres to look up genreID in. Skipping isGenre...")
+        return
+    path = os.path.join(DATA_DIR, "artist_genre.json")
+    try:
+        with open(path, "r") as f:
+            raw = json.load(f)
+            artist_genre = [pair.split('|') for pair in raw]
+            print(f"✅ Successfully loaded artist_genre.json")
+
+        artist_genre_df = pd.DataFrame(artist_genre, columns=["artistID", "genreName"])
+        # Replace "genreName" with "genreID"
+        # Left outer join on artist_genre and genre on genreName, then drop genreName
+        merged = artist_genre_df.merge(
+            genres_df[["genreID", "genreName"]],
+            on="genreName",
+            how="left"
+        )
+        merged = merged.drop(columns="genreName")
+
+        # Saving
+        artist_genre_path = os.path.join(OUTPUT_DIR, "isGenre.tsv")
+        merged.to_csv(artist_genre_path, sep="\t", index=False)
+        if os.path.exists(artist_genre_path):
+            print(f"✅ Successfully saved artist_genre in {artist_genre_path}\n")
+
+    except FileNotFoundError:
+        print(f"❌ {path} not found. Skipping...")
+
+
+"""
+Exports one table with pandas. Returns the genres DataFrame for the genres table, which isGenre needs
+"""
+def export_pandas_table(table, genres_df=None):
+    if table in id_columns:
+        data = load_entity(table)
+        if table == "genres":
+            return save_genres(data)
+        if data is not None:
+            save_entity(table, data)
+    elif table == "performs":
+        save_performs()
+    elif table == "inAlbum":
+        save_in_album()
+    elif table == "isGenre":
+        save_is_genre(genres_df)
+
+
+def export_pandas():
+    genres_df = None
+    print(f"Exporting entities...\n")
+    for table in TABLES:
+        if table == "performs":
+            print(f"\nLoading relationships...\n")
+        result = export_pandas_table(table, genres_df)
+        if table == "genres":
+            genres_df = result
+
+
+# ----- STREAMING EXPORT -----
+
+"""
+Returns the dtype pandas would give a column holding values of these Python types: ints with gaps become
+float64 (written as 85.0), and anything mixed with strings stays object
+"""
+def pandas_kind(types, has_missing):
+    if not types:
+        return "object"
+    if types == {bool}:
+        return "object" if has_missing else "bool"
+    if types <= {int}:
+        return "float" if has_missing else "int"
+    if types <= {int, float}:
+        return "float"
+    return "object"
+
+
+"""
+First pass over a table's rows (dicts). Returns its columns in order of first appearance, after the given
+leading columns, and the pandas kind of each
+"""
+def scan_columns(rows, columns):
+    columns = list(columns)
+    types = {c: set() for c in columns}
+    missing = set()
+    count = 0
+    for row in rows:
+        count += 1
+        for column, value in row.items():
+            if column not in types:
+                types[column] = set()
+                columns.append(column)
+                if count > 1:
+                    missing.add(column)
+            if value is None:
+                missing.add(column)
+            else:
+                types[column].add(type(value))
+        if len(row) < len(columns):
+            missing.update(c for c in columns if c not in row)
+    return columns, {c: pandas_kind(types[c], c in missing) for c in columns}, count
+
+
+def format_value(value, kind):
+    if value is None:
+        return ""
+    if kind == "float":
+        return repr(float(value))
+    return str(value)
+
+
+"""
+Writes a table the way DataFrame.to_csv(sep="\\t", index=False) would. rows is a function returning a fresh
+iterator of dict rows, since the table is read once to type its columns and again to write it
+"""
+def write_tsv(tsv_path, rows, columns=(), chunk_rows=CHUNK_ROWS):
+    columns, kinds, count = scan_columns(rows(), columns)
+
+    with open(tsv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, delimiter="\t", lineterminator=os.linesep, quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(columns)
+        chunk = []
+        for row in rows():
+            chunk.append([format_value(row.get(c), kinds[c]) for c in columns])
+            if len(chunk) >= chunk_rows:
+                writer.writerows(chunk)
+                chunk = []
+        writer.writerows(chunk)
+    return count
+
+
+def table_exists(name):
+    return os.path.exists(crawl_state.snapshot_path(name)) or os.path.exists(crawl_state.journal_path(name))
+
+
+def stream_entity(entity, chunk_rows):
+    if not table_exists(entity):
+        print(f"❌ {crawl_state.snapshot_path(entity)} not found. Skipping...")
+        return
+    id_column = id_columns[entity]
+    rows = lambda: ({id_column: key, **attributes} for key, attributes in crawl_state.iter_dict(entity))
+
+    tsv_path = os.path.join(OUTPUT_DIR, f"{entity}.tsv")
+    count = write_tsv(tsv_path, rows, [id_column], chunk_rows)
+    print(f"✅ Successfully saved {count} {entity} in {tsv_path}")
+
+
+def stream_genres(chunk_rows):
+    rows = lambda: (
+        {"genreID": i, "genreName": name} for name, i in genre_ids(crawl_state.iter_set("genres")).items()
     )
-    merged = merged.drop(columns="genreName")
-    
-    # Saving
-    artist_genre_path = os.path.join(OUTPUT_DIR, "isGenre.tsv")
-    merged.to_csv(artist_genre_path, sep="\t", index=False)
-    if os.path.exists(artist_genre_path):
-        print(f"✅ Successfully saved artist_genre in {artist_genre_path}\n")
-
-except FileNotFoundError:
-    print(f"❌ {path} not found. Skipping...")
+    tsv_path = os.path.join(OUTPUT_DIR, "genres.tsv")
+    count = write_tsv(tsv_path, rows, ["genreID", "genreName"], chunk_rows)
+    print(f"✅ Successfully saved {count} genres in {tsv_path}")
+
+
+def stream_performs(chunk_rows):
+    if not table_exists("song_artist"):
+        print(f"❌ {crawl_state.snapshot_path('song_artist')} not found. Skipping...")
+        return
+    rows = lambda: (
+        {"artistID": artist, "songID": song} for song, artist in crawl_state.iter_set("song_artist", pairs=True)
+    )
+    tsv_path = os.path.join(OUTPUT_DIR, "performs.tsv")
+    count = write_tsv(tsv_path, rows, ["artistID", "songID"], chunk_rows)
+    print(f"✅ Successfully saved {count} song_artist in {tsv_path}")
+
+
+def stream_in_album(chunk_rows):
+    if not table_exists("song_album"):
+        print(f"❌ {crawl_state.snapshot_path('song_album')} not found. Skipping...")
+        return
+    rows = lambda: (
+        {"songID": song, "albumID": album, **trackNums}
+        for (song, album), trackNums in crawl_state.iter_dict("song_album", pairs=True)
+    )
+    tsv_path = os.path.join(OUTPUT_DIR, "inAlbum.tsv")
+    count = write_tsv(tsv_path, rows, [], chunk_rows)
+    print(f"✅ Successfully saved {count} song_album in {tsv_path}")
+
+
+"""
+isGenre needs genre IDs by name. Genres are the one table kept in memory, and there are only a few thousand
+"""
+def stream_is_genre(chunk_rows):
+    if not table_exists("artist_genre"):
+        print(f"❌ {crawl_state.snapshot_path('artist_genre')} not found. Skipping...")
+        return
+    ids = genre_ids(crawl_state.iter_set("genres"))
+    rows = lambda: (
+        {"artistID": artist, "genreID": ids.get(genre)}
+        for artist, genre in crawl_state.iter_set("artist_genre", pairs=True)
+    )
+    tsv_path = os.path.join(OUTPUT_DIR, "isGenre.tsv")
+    count = write_tsv(tsv_path, rows, ["artistID", "genreID"], chunk_rows)
+    print(f"✅ Successfully saved {count} artist_genre in {tsv_path}")
+
+
+def export_stream_table(table, chunk_rows):
+    if table == "genres":
+        stream_genres(chunk_rows)
+    elif table in id_columns:
+        stream_entity(table, chunk_rows)
+    elif table == "performs":
+        stream_performs(chunk_rows)
+    elif table == "inAlbum":
+        stream_in_album(chunk_rows)
+    elif table == "isGenre":
+        stream_is_genre(chunk_rows)
+
+
+def export_stream(chunk_rows):
+    print(f"Streaming entities...\n")
+    for table in TABLES:
+        if table == "performs":
+            print(f"\nStreaming relationships...\n")
+        export_stream_table(table, chunk_rows)
+
+
+# ----- PARALLEL EXPORT -----
+
+"""
+Worker process entry point. Each worker reads its own inputs, so tables share nothing but the genres DataFrame
+"""
+def export_table(table, stream, chunk_rows, genres_df=None):
+    start = time.perf_counter()
+    if stream:
+        result = export_stream_table(table, chunk_rows)
+    else:
+        result = export_pandas_table(table, genres_df)
+    return table, result, time.perf_counter() - start
+
+
+"""
+Exports every table in its own worker process. isGenre is the only table that depends on another: it is submitted
+once genres has finished, with the genres DataFrame it returned. Everything else starts right away, so the export
+takes about as long as the largest table
+"""
+def export_parallel(stream, chunk_rows, jobs):
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        pending = {pool.submit(export_table, t, stream, chunk_rows) for t in TABLES if t != "isGenre"}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                table, result, seconds = future.result()
+                print(f"⏱️ {table} took {seconds:.1f}s")
+                if table == "genres":
+                    pending.add(pool.submit(export_table, "isGenre", stream, chunk_rows, result))
+    print(f"✅ Exported {len(TABLES)} tables in {time.perf_counter() - start:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert crawl data to TSV files for PostgreSQL")
+    parser.add_argument("--stream", action="store_true", help="constant-memory export, without pandas")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="rows written at a time with --stream")
+    parser.add_argument("--jobs", type=int, default=1, help="export tables in parallel worker processes")
+    args = parser.parse_args()
+
+    if args.jobs > 1:
+        export_parallel(args.stream, args.chunk_rows, args.jobs)
+    elif args.stream:
+        export_stream(args.chunk_rows)
+    else:
+        export_pandas()
+
+
+if __name__ == "__main__":
+    main()
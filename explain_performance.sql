@@ -0,0 +1,88 @@
+-- Before/after plans for performance_schema.sql. Runs each queries.sql query with EXPLAIN (ANALYZE, BUFFERS)
+-- on the plain schema, then installs performance_schema.sql and runs them again.
+--     psql -d <db> -f explain_performance.sql > plans.txt
+-- Note: leaves performance_schema.sql installed.
+
+\set ON_ERROR_STOP on
+\pset pager off
+
+-- ----- BEFORE -----
+-- Remove the add-on, if installed, so the first plans use the primary keys only
+
+DROP MATERIALIZED VIEW IF EXISTS ArtistSongPopularity;
+DROP FUNCTION IF EXISTS refresh_artist_song_popularity();
+DROP INDEX IF EXISTS performs_songid_idx, isgenre_genreid_idx, inalbum_songid_idx, followsartist_artistid_idx,
+    createsplaylist_playlistid_idx, inplaylist_songid_idx, followsplaylist_playlistid_idx, likessong_songid_idx,
+    followsuser_followedid_idx, users_name_idx;
+ANALYZE;
+
+\echo '===== BEFORE: Query 1 (songs by artists a user follows) ====='
+EXPLAIN (ANALYZE, BUFFERS)
+SELECT u.FirstName, u.LastName, u.Username, a.ArtistName, s.SongTitle
+FROM FollowsArtist fa
+JOIN "Users" u ON fa.UserID = u.UserID
+JOIN Artists a ON fa.ArtistID = a.ArtistID
+JOIN Performs p ON p.ArtistID = a.ArtistID
+JOIN Songs s ON p.SongID = s.SongID
+WHERE
+    u.FirstName = 'Lukas'
+    AND u.LastName = 'Robert'
+    AND s.SongPopularity >= 90;
+
+\echo '===== BEFORE: Query 2 (top artists by average song popularity) ====='
+EXPLAIN (ANALYZE, BUFFERS)
+SELECT a.ArtistName, ROUND(AVG(s.SongPopularity), 2) AS AvgPopularity
+FROM Artists a
+JOIN Performs p ON a.ArtistID = p.ArtistID
+JOIN Songs s ON s.SongID = p.SongID
+GROUP BY a.ArtistName
+ORDER BY AvgPopularity DESC
+LIMIT 5;
+
+\echo '===== BEFORE: Query 3 (playlists with songs released before 2020) ====='
+EXPLAIN (ANALYZE, BUFFERS)
+SELECT DISTINCT pl.PlaylistName
+FROM Playlists pl
+JOIN InPlaylist ip ON pl.PlaylistID = ip.PlaylistID
+JOIN Songs s ON s.SongID = ip.SongID
+WHERE s.SongReleaseDate < '2020-01-01';
+
+-- ----- AFTER -----
+
+\echo '===== Installing performance_schema.sql ====='
+\i performance_schema.sql
+ANALYZE;
+
+\echo '===== AFTER: Query 1 ====='
+EXPLAIN (ANALYZE, BUFFERS)
+SELECT u.FirstName, u.LastName, u.Username, a.ArtistName, s.SongTitle
+FROM FollowsArtist fa
+JOIN "Users" u ON fa.UserID = u.UserID
+JOIN Artists a ON fa.ArtistID = a.ArtistID
+JOIN Performs p ON p.ArtistID = a.ArtistID
+JOIN Songs s ON p.SongID = s.SongID
+WHERE
+    u.FirstName = 'Lukas'
+    AND u.LastName = 'Robert'
+    AND s.SongPopularity >= 90;
+
+\echo '===== AFTER: Query 2, on the materialized view ====='
+EXPLAIN (ANALYZE, BUFFERS)
+SELECT ArtistName, ROUND(SUM(PopularitySum)::numeric / NULLIF(SUM(RatedSongs), 0), 2) AS AvgPopularity
+FROM ArtistSongPopularity
+GROUP BY ArtistName
+ORDER BY AvgPopularity DESC
+LIMIT 5;
+
+\echo '===== AFTER: Query 3 ====='
+EXPLAIN (ANALYZE, BUFFERS)
+SELECT DISTINCT pl.PlaylistName
+FROM Playlists pl
+JOIN InPlaylist ip ON pl.PlaylistID = ip.PlaylistID
+JOIN Songs s ON s.SongID = ip.SongID
+WHERE s.SongReleaseDate < '2020-01-01';
+
+\echo '===== Refresh cost of the materialized view ====='
+\timing on
+SELECT refresh_artist_song_popularity();
+\timing off
@@ -0,0 +1,120 @@
+"""
+Priority-ordered work queues for the crawl stages. A Frontier wraps an entity's *_to_check set and hands out its items
+best first, instead of in the arbitrary order of a set, so a crawl stopped early (see CRAWL_REQUEST_BUDGET in
+crawler_engine.py) has spent its requests on the most useful part of the catalog. Runs over the same state crawl in
+the same order: ties are broken by ID.
+
+Every item keeps the signals it was discovered with in a crawl_state table, <entity>_frontier:
+    depth           hops from the seed playlists (1 for albums and artists on a playlist, 2 for their songs, ...)
+    refs            how often it was found, e.g. the number of playlist tracks on an album
+    popularity      Spotify popularity of what it was found through (the track or album), -1 if unknown
+CRAWL_PRIORITY picks the order, from PRIORITIES (default "depth"). Other orders can be added to PRIORITIES.
+
+The set itself is unchanged, so the standalone scripts, the SQLite store and resuming all work as before. Items are
+still leased and acknowledged (see crawler_engine.take), and their signals are dropped once they are done.
+"""
+import heapq
+import os
+
+PRIORITY = os.environ.get("CRAWL_PRIORITY", "depth")
+
+# Priority name -> sort key of an item's signals. Smaller keys are crawled first
+PRIORITIES = {
+    # Breadth first from the seed playlists, then the most referenced
+    "depth": lambda s: (s["depth"], -s["refs"], -s["popularity"]),
+    # Most referenced first (albums and artists on many playlist tracks)
+    "references": lambda s: (-s["refs"], s["depth"], -s["popularity"]),
+    # Found through the most popular tracks and albums first
+    "popularity": lambda s: (-s["popularity"], s["depth"], -s["refs"]),
+}
+
+# Signals of items queued before they were recorded
+UNKNOWN = {"depth": 1, "refs": 0, "popularity": -1}
+
+
+class Frontier:
+    """
+    An entity's work queue: its *_to_check set, the seen-ID index that keeps processed IDs out of it, and the signals
+    of every queued item. Behaves like the set for `in`, len() and iteration.
+    """
+
+    def __init__(self, queue, seen, signals, priority=PRIORITY):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown CRAWL_PRIORITY {priority!r}, expected one of {', '.join(PRIORITIES)}")
+        self.name = queue.name
+        self.queue = queue
+        self.seen = seen
+        self.signals = signals
+        self.sort_key = PRIORITIES[priority]
+        self.heap = None        # (sort key, id) entries, built at the first lease
+
+    def __len__(self):
+        return len(self.queue)
+
+    def __contains__(self, key):
+        return key in self.queue
+
+    def __iter__(self):
+        return iter(self.queue)
+
+    @property
+    def leased(self):
+        return self.queue.leased
+
+    def priority(self, key):
+        return self.sort_key(self.signals.get(key, UNKNOWN)), key
+
+    def push(self, key):
+        if self.heap is not None:
+            heapq.heappush(self.heap, self.priority(key))
+
+    def discover(self, key, depth, popularity=None):
+        """
+        Queues key unless it was seen before. An item that is still queued counts the extra reference, and keeps the
+        smallest depth and highest popularity it was found with.
+        """
+        popularity = -1 if popularity is None else popularity
+        if key not in self.seen:
+            self.seen.add(key)
+            self.signals[key] = {"depth": depth, "refs": 1, "popularity": popularity}
+            self.queue.add(key)
+        elif key in self.queue:
+            old = self.signals.get(key, UNKNOWN)
+            self.signals[key] = {
+                "depth": min(old["depth"], depth),
+                "refs": old["refs"] + 1,
+                "popularity": max(old["popularity"], popularity),
+            }
+        else:
+            return
+        # An item whose priority changed gets a new heap entry. Its old one is skipped once the item has left the queue
+        self.push(key)
+
+    def depth(self, key):
+        """Depth an item was found at, for the depth of what is discovered through it."""
+        return self.signals.get(key, UNKNOWN)["depth"]
+
+    def lease(self, n):
+        """Leases the n best items."""
+        if self.heap is None:
+            self.heap = [self.priority(key) for key in self.queue]
+            heapq.heapify(self.heap)
+        keys = []
+        chosen = set()
+        while self.heap and len(keys) < n:
+            _, key = heapq.heappop(self.heap)
+            if key not in chosen and key in self.queue:
+                chosen.add(key)
+                keys.append(key)
+        return self.queue.lease_keys(keys)
+
+    def ack(self, keys):
+        self.queue.ack(keys)
+        for key in keys:
+            if key not in self.queue:
+                self.signals.pop(key, None)
+
+    def release(self, keys):
+        self.queue.release(keys)
+        for key in keys:
+            self.push(key)
@@ -1,28 +1,91 @@
 """
-This script generates 100 random users to populate our database. Usernames, first names, and last names are generated 
-from randomuser.me. randomuser.me also sources pictures from the authorized images on uifaces.com. While uifaces.com 
+This script generates 100 random users to populate our database. Usernames, first names, and last names are generated
+from randomuser.me. randomuser.me also sources pictures from the authorized images on uifaces.com. While uifaces.com
 is no longer maintained, more info can be found at https://web.archive.org/web/20160811185628/http://uifaces.com/faq
+
+For scale tests, --count N generates any number of users. Pages of up to 5000 users (the API maximum) are requested
+concurrently, and written out as they arrive. With --offline, users are synthesized locally from name lists instead,
+for machines without network access. Either way users are streamed to data/users.json, or to output/users.tsv with
+--format tsv, so memory does not grow with the number of users. The seed-playlist creator accounts are always added
+after the generated users.
+
+Usage: python generate_users.py [--count N] [--offline] [--format json|tsv] [--jobs 4] [--seed N]
 """
 
+import argparse
+import csv
 import requests
 import json
 import os
+import random
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 DATA_DIR = "data"
+OUTPUT_DIR = "output"
 os.makedirs(DATA_DIR, exist_ok=True)
 
-def get_random_users(n=100):
+API_PAGE_SIZE = 5000    # Most users randomuser.me returns per request
+MAX_RETRIES = 5
+OFFLINE_CHUNK = 100000  # Users synthesized and written at a time with --offline
+
+# Real users that created our seed playlists
+CREATORS = ["Billboard", "Trap Nation", "Drake", "swift_fan"]
+
+# Name lists for --offline
+FIRST_NAMES = [
+    "Olivia", "Liam", "Emma", "Noah", "Amelia", "Oliver", "Ava", "Elijah", "Sophia", "Mateo", "Isabella", "Lucas",
+    "Mia", "Levi", "Charlotte", "Ezra", "Harper", "Leo", "Evelyn", "Luca", "Aria", "Asher", "Ella", "James", "Nora",
+    "Ethan", "Layla", "Sebastian", "Chloe", "Hudson", "Zoe", "Aiden", "Lily", "Kai", "Hannah", "Jack", "Maya", "Owen",
+    "Sofia", "Daniel", "Aaliyah", "Henry", "Yuki", "Arjun", "Mei", "Omar", "Ingrid", "Mohammed", "Lucia", "Emil",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+    "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin", "Lee",
+    "Perez", "Thompson", "White", "Harris", "Sanchez", "Clark", "Ramirez", "Lewis", "Robinson", "Walker", "Young",
+    "Allen", "King", "Wright", "Scott", "Torres", "Nguyen", "Hill", "Flores", "Green", "Adams", "Nelson", "Baker",
+    "Hall", "Rivera", "Campbell", "Mitchell", "Carter", "Roberts",
+]
+USERNAME_WORDS = [
+    "happy", "blue", "silver", "lazy", "crazy", "brave", "quiet", "golden", "wild", "tiny", "purple", "sad", "heavy",
+    "organic", "beautiful", "big", "red", "black", "white", "orange", "yellow", "green", "brown", "ticklish",
+]
+USERNAME_ANIMALS = [
+    "duck", "tiger", "koala", "panda", "rabbit", "swan", "lion", "wolf", "bear", "frog", "fish", "bird", "cat", "dog",
+    "goose", "leopard", "peacock", "gorilla", "elephant", "butterfly", "ladybug", "zebra", "snake", "ostrich",
+]
+USERNAME_PREFIXES = [w + a for w in USERNAME_WORDS for a in USERNAME_ANIMALS]
+PICTURE_URLS = [f"https://randomuser.me/api/portraits/{g}/{i}.jpg" for g in ["men", "women"] for i in range(100)]
+
+def get_random_users(n=100, page=None):
     url = f"https://randomuser.me/api/?results={n}"
-    while True:
+    if page is not None:
+        # Only the fields format_users keeps, which makes large pages several times smaller
+        url += f"&page={page}&inc=login,name,picture&noinfo"
+    for attempt in range(1, MAX_RETRIES + 1):
         try:
-            response = requests.get(url)
+            response = requests.get(url, timeout=60)
             response.raise_for_status()
             data = response.json()
             return data["results"]
         except requests.exceptions.RequestException as e:
-            print(f"❌ API error: {e}. Retrying in 5 seconds...")
-            time.sleep(5)
+            if attempt == MAX_RETRIES:
+                raise
+            delay = 5 * 2 ** (attempt - 1)
+            print(f"❌ API error: {e}. Retrying in {delay} seconds ({attempt}/{MAX_RETRIES})...")
+            time.sleep(delay)
+
+def creator_users(last_id):
+    users = {}
+    for i, u in enumerate(CREATORS, start=1):
+        users[i+last_id] = {
+            "username": u,
+            "firstName": f"{u}",
+            "lastName": r"\N",
+            "userArtURL": r"\N"
+        }
+    return users
 
 def format_users(raw_users):
     users = {}
@@ -38,25 +101,145 @@ def format_users(raw_users):
         last_id = user_id
 
     # Add real users that created our seed playlists
-    usernames = ["Billboard", "Trap Nation", "Drake", "swift_fan"]
-    for i, u in enumerate(usernames, start=1):
-        users[i+last_id] = {
-            "username": u,
-            "firstName": f"{u}",
-            "lastName": r"\N",
-            "userArtURL": r"\N"
-        }
+    users.update(creator_users(last_id))
     return users
 
+# ----- BULK GENERATION -----
+
+class UserWriter:
+    """Streams users to data/users.json (same layout as json.dump(users, indent=2)) or output/users.tsv."""
+
+    def __init__(self, fmt):
+        self.fmt = fmt
+        if fmt == "json":
+            self.path = f"{DATA_DIR}/users.json"
+        else:
+            os.makedirs(OUTPUT_DIR, exist_ok=True)
+            self.path = f"{OUTPUT_DIR}/users.tsv"
+        self.f = open(self.path, "w", newline="", encoding="utf-8")
+        self.count = 0
+        if fmt == "json":
+            self.f.write("{")
+        else:
+            self.tsv = csv.writer(self.f, delimiter="\t", lineterminator=os.linesep)
+            self.tsv.writerow(["userID", "username", "firstName", "lastName", "userArtURL"])
+
+    # rows are (userID, username, firstName, lastName, userArtURL) tuples. plain rows have no characters that need
+    # quoting (synthesized users), so they can skip the csv module
+    def write(self, rows, plain=False):
+        rows = list(rows)
+        if self.fmt == "json":
+            parts = []
+            for user_id, username, first, last, art in rows:
+                u = {"username": username, "firstName": first, "lastName": last, "userArtURL": art}
+                entry = json.dumps(u, indent=2).replace("\n", "\n  ")
+                parts.append(f"{',' if self.count or parts else ''}\n  \"{user_id}\": {entry}")
+            self.f.write("".join(parts))
+        elif plain:
+            self.f.write("".join(f"{r[0]}\t{r[1]}\t{r[2]}\t{r[3]}\t{r[4]}{os.linesep}" for r in rows))
+        else:
+            self.tsv.writerows(rows)
+        self.count += len(rows)
+
+    def close(self):
+        if self.fmt == "json":
+            self.f.write("\n}" if self.count else "}")
+        self.f.close()
+
+"""
+Formats a page of API users starting at user ID start_id. randomuser.me usernames repeat at this scale,
+so a username already taken gets the user ID appended
+"""
+def format_page(raw_users, start_id, taken):
+    rows = []
+    for user_id, u in enumerate(raw_users, start=start_id):
+        username = u["login"]["username"]
+        if username in taken:
+            username = f"{username}{user_id}"
+            while username in taken:
+                username += "_"
+        taken.add(username)
+        rows.append((user_id, username, u["name"]["first"], u["name"]["last"], u["picture"]["large"]))
+    return rows
+
+def user_rows(users):
+    return [(user_id, u["username"], u["firstName"], u["lastName"], u["userArtURL"]) for user_id, u in users.items()]
+
+def fetch_users(count, jobs, writer):
+    sizes = [min(API_PAGE_SIZE, count - start) for start in range(0, count, API_PAGE_SIZE)]
+    taken = set(CREATORS)
+    next_id = 1
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        # At most jobs * 2 pages are requested or waiting to be written at a time, so memory does not grow with
+        # count. Pages are written in order, so user IDs stay sequential while later pages download
+        pending = deque()
+        submitted = written = 0
+        while submitted < len(sizes) or pending:
+            if submitted < len(sizes) and len(pending) < jobs * 2:
+                pending.append(pool.submit(get_random_users, sizes[submitted], page=submitted + 1))
+                submitted += 1
+                continue
+            raw = pending.popleft().result()
+            writer.write(format_page(raw, next_id, taken))
+            next_id += len(raw)
+            written += 1
+            print(f"🔹 Page {written}/{len(sizes)}: {writer.count} users")
+    return next_id - 1
+
+"""
+Synthesizes users locally. Usernames end in the user ID, so they are unique without keeping track of them
+"""
+def synthesize_users(count, rng, writer):
+    for start in range(1, count + 1, OFFLINE_CHUNK):
+        ids = range(start, min(start + OFFLINE_CHUNK, count + 1))
+        n = len(ids)
+        firsts = rng.choices(FIRST_NAMES, k=n)
+        lasts = rng.choices(LAST_NAMES, k=n)
+        names = rng.choices(USERNAME_PREFIXES, k=n)
+        pictures = rng.choices(PICTURE_URLS, k=n)
+        writer.write((
+            (user_id, f"{name}{user_id}", first, last, picture)
+            for user_id, name, first, last, picture in zip(ids, names, firsts, lasts, pictures)
+        ), plain=True)
+        print(f"🔹 {writer.count} users")
+    return count
+
 def main():
-    print("🎲 Generating random users...")
-    raw = get_random_users(100)
-    users = format_users(raw)
-
-    with open(f"{DATA_DIR}/users.json", "w") as f:
-        json.dump(users, f, indent=2)
-    
-    print(f"✅ Saved {len(users)} users to users.json")
+    parser = argparse.ArgumentParser(description="Generate random users")
+    parser.add_argument("--count", type=int, help="number of users to generate (default: 100, in one request)")
+    parser.add_argument("--offline", action="store_true", help="synthesize users locally instead of calling randomuser.me")
+    parser.add_argument("--format", choices=["json", "tsv"], default="json", help="data/users.json or output/users.tsv")
+    parser.add_argument("--jobs", type=int, default=4, help="concurrent API requests")
+    parser.add_argument("--seed", type=int, help="seed for --offline")
+    args = parser.parse_args()
+
+    if args.count is None and not args.offline and args.format == "json":
+        print("🎲 Generating random users...")
+        raw = get_random_users(100)
+        users = format_users(raw)
+
+        with open(f"{DATA_DIR}/users.json", "w") as f:
+            json.dump(users, f, indent=2)
+
+        print(f"✅ Saved {len(users)} users to users.json")
+        return
+
+    count = args.count if args.count is not None else 100
+    print(f"🎲 Generating {count} random users...")
+    start = time.perf_counter()
+    writer = UserWriter(args.format)
+    try:
+        if args.offline:
+            last_id = synthesize_users(count, random.Random(args.seed), writer)
+        else:
+            last_id = fetch_users(count, args.jobs, writer)
+        # Add real users that created our seed playlists
+        writer.write(user_rows(creator_users(last_id)))
+    finally:
+        writer.close()
+
+    seconds = time.perf_counter() - start
+    print(f"✅ Saved {writer.count} users to {writer.path} in {seconds:.1f}s ({writer.count / max(seconds, 1e-9):,.0f} users/s)")
 
 if __name__ == "__main__":
     main()
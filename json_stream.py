@@ -0,0 +1,89 @@
+"""
+Incremental reader for the large top-level JSON objects and arrays the crawl writes (songs.json, song_album.json, ...).
+Only one chunk of the file and one entry are held in memory at a time, so memory does not grow with the file.
+"""
+import json
+
+CHUNK_SIZE = 1 << 20    # characters read at a time
+
+decoder = json.JSONDecoder()
+WHITESPACE = " \t\n\r"
+NUMBER_CHARS = "0123456789.eE+-"
+
+
+class Reader:
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop what has already been consumed before growing the buffer
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Returns the next non-whitespace character without consuming it ("" at end of file)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos} of {self.f.name}")
+        self.pos += 1
+
+    def value(self):
+        """Decodes the next JSON value, reading more of the file until it is complete."""
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buf, self.pos)
+                # A number cut off by the end of the buffer (12 of 123, 1.5e of 1.5e-07) decodes as a shorter
+                # one, so only accept a value once the character after it cannot continue it
+                if self.eof or (end < len(self.buf) and self.buf[end] not in NUMBER_CHARS):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+"""
+Yields the (key, value) pairs of a top-level JSON object, or the items of a top-level JSON array
+"""
+def iter_json(path, chunk_size=CHUNK_SIZE):
+    with open(path, "r") as f:
+        reader = Reader(f, chunk_size)
+        opening = reader.peek()
+        if not opening or opening not in "{[":
+            raise ValueError(f"{path} is not a JSON object or array")
+        closing = "}" if opening == "{" else "]"
+        reader.pos += 1
+
+        first = True
+        while True:
+            if reader.peek() == closing:
+                return
+            if not first:
+                reader.expect(",")
+            first = False
+
+            if opening == "{":
+                key = reader.value()
+                reader.expect(":")
+                yield key, reader.value()
+            else:
+                yield reader.value()
@@ -0,0 +1,210 @@
+"""
+Metrics for the crawl scripts: counters, gauges and latency histograms, kept in memory and written out periodically
+so a long crawl shows where its time goes. What is recorded:
+    spotify_requests_total{endpoint,status}     requests made through the crawler engine
+    spotify_request_seconds{endpoint}           request latency histogram
+    rate_limit_pauses_total{client}             429 responses, by the client of the pool that got them
+    rate_limit_sleep_seconds_total              time every worker spent paused by a 429's Retry-After
+    token_wait_seconds_total                    time spent waiting for the engine's token bucket
+    checkpoint_seconds                          crawl_state checkpoint duration histogram
+    checkpoint_bytes_total                      bytes appended to journals
+    compaction_seconds_total / compaction_bytes_total
+    queue_depth{queue}                          size of every loaded *_to_check set
+    table_rows{table}                           size of every other loaded crawl table
+    entities_processed_total{stage}             albums / songs / artists / playlist tracks processed
+    entities_per_second{stage}                  entities_processed_total over the time since the stage started
+
+Set CRAWL_METRICS to a file path to export them, at most every CRAWL_METRICS_INTERVAL seconds (default 15) and at
+the end of the run. A path ending in .prom gets the Prometheus text format (rewritten each time, for node_exporter's
+textfile collector); anything else gets one JSON object per export appended (JSON lines).
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+EXPORT_PATH = os.environ.get("CRAWL_METRICS")
+EXPORT_INTERVAL = float(os.environ.get("CRAWL_METRICS_INTERVAL", 15))
+
+# Upper bounds (seconds) of the histogram buckets. The last bucket, +Inf, is implicit
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+HELP = {
+    "spotify_requests_total": ("counter", "Spotify API requests by endpoint and HTTP status"),
+    "spotify_request_seconds": ("histogram", "Spotify API request latency"),
+    "rate_limit_pauses_total": ("counter", "429 responses that paused a client of the engine"),
+    "rate_limit_sleep_seconds_total": ("counter", "Seconds the engine was paused by Retry-After"),
+    "token_wait_seconds_total": ("counter", "Seconds spent waiting for the engine's token bucket"),
+    "checkpoint_seconds": ("histogram", "crawl_state checkpoint duration"),
+    "checkpoint_bytes_total": ("counter", "Bytes appended to crawl_state journals"),
+    "compaction_seconds_total": ("counter", "Seconds spent rewriting crawl_state snapshots"),
+    "compaction_bytes_total": ("counter", "Bytes written to crawl_state snapshots"),
+    "queue_depth": ("gauge", "Items waiting in a *_to_check set"),
+    "table_rows": ("gauge", "Rows in a crawl_state table"),
+    "entities_processed_total": ("counter", "Entities processed by a crawl stage"),
+    "entities_per_second": ("gauge", "Entities processed per second since the stage started"),
+}
+
+lock = threading.Lock()
+started = time.time()
+last_export = 0.0
+
+# (name, labels) -> value, where labels is a sorted tuple of (label, value) pairs
+counters = {}
+gauges = {}
+# (name, labels) -> [bucket counts..., +Inf count, sum]
+histograms = {}
+# stage -> time its first entity was processed
+stage_started = {}
+
+
+def series(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    key = series(name, labels)
+    with lock:
+        counters[key] = counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    with lock:
+        gauges[series(name, labels)] = value
+
+
+def observe(name, value, **labels):
+    key = series(name, labels)
+    with lock:
+        h = histograms.get(key)
+        if h is None:
+            h = histograms[key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                h[i] += 1
+                break
+        else:
+            h[len(BUCKETS)] += 1
+        h[-1] += value
+
+
+@contextmanager
+def timer(name, **labels):
+    """Observes the duration of the with block in histogram name."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+"""
+Counts entities a crawl stage finished. entities_per_second is derived from these at export
+"""
+def processed(stage, n):
+    with lock:
+        stage_started.setdefault(stage, time.time())
+    inc("entities_processed_total", n, stage=stage)
+
+
+"""
+Records the size of every loaded crawl_state table: *_to_check sets as queue_depth, the rest as table_rows
+"""
+def record_tables(tables):
+    for name, table in tables.items():
+        if name.endswith("_to_check"):
+            set_gauge("queue_depth", len(table), queue=name)
+        else:
+            set_gauge("table_rows", len(table), table=name)
+
+
+def update_rates():
+    now = time.time()
+    for (name, labels), value in list(counters.items()):
+        if name == "entities_processed_total":
+            stage = dict(labels)["stage"]
+            elapsed = max(now - stage_started.get(stage, started), 1e-9)
+            gauges[("entities_per_second", labels)] = value / elapsed
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def prometheus_text():
+    lines = []
+    metrics = {}
+    for store in (counters, gauges, histograms):
+        for name, labels in store:
+            metrics.setdefault(name, [])
+    for name in sorted(metrics):
+        kind, description = HELP.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "histogram":
+            for (n, labels), h in sorted(histograms.items()):
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, c in zip(list(BUCKETS) + ["+Inf"], h[:-1]):
+                    cumulative += c
+                    lines.append(f"{name}_bucket{format_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {h[-1]}")
+                lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+        else:
+            store = counters if kind == "counter" else gauges
+            for (n, labels), value in sorted(store.items()):
+                if n == name:
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def json_snapshot():
+    def flat(store):
+        return {f"{name}{format_labels(labels)}": value for (name, labels), value in sorted(store.items())}
+    return {
+        "time": round(time.time(), 3),
+        "elapsed": round(time.time() - started, 3),
+        "counters": flat(counters),
+        "gauges": flat(gauges),
+        "histograms": {
+            key: {"buckets": dict(zip([str(b) for b in BUCKETS] + ["+Inf"], h[:-1])), "count": sum(h[:-1]), "sum": h[-1]}
+            for key, h in flat(histograms).items()
+        },
+    }
+
+
+"""
+Writes the metrics to CRAWL_METRICS if it is set and EXPORT_INTERVAL has passed since the last export
+(or always, with force=True)
+"""
+def export(force=False):
+    global last_export
+    if not EXPORT_PATH:
+        return
+    now = time.time()
+    if not force and now - last_export < EXPORT_INTERVAL:
+        return
+    last_export = now
+
+    with lock:
+        update_rates()
+        if EXPORT_PATH.endswith(".prom"):
+            text = prometheus_text()
+        else:
+            text = json.dumps(json_snapshot()) + "\n"
+
+    os.makedirs(os.path.dirname(EXPORT_PATH) or ".", exist_ok=True)
+    if EXPORT_PATH.endswith(".prom"):
+        # Scrapers may read the file at any time, so replace it in one step
+        tmp_path = f"{EXPORT_PATH}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, EXPORT_PATH)
+    else:
+        with open(EXPORT_PATH, "a") as f:
+            f.write(text)
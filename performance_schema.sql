@@ -0,0 +1,62 @@
+-- Optional performance add-on for the queries.sql workload. Run after schema.sql (and safe to re-run):
+--     psql -d <db> -f performance_schema.sql
+-- explain_performance.sql shows the query plans with and without it.
+
+-- REVERSE-SIDE INDEXES
+-- Each relationship table's primary key only serves lookups by its first column. These serve the other side,
+-- e.g. "which playlists contain this song" (Query 3 joins InPlaylist by SongID), and let ON DELETE CASCADE from
+-- the second table find its rows without a sequential scan.
+
+CREATE INDEX IF NOT EXISTS performs_songid_idx ON Performs (SongID);
+CREATE INDEX IF NOT EXISTS isgenre_genreid_idx ON IsGenre (GenreID);
+CREATE INDEX IF NOT EXISTS inalbum_songid_idx ON InAlbum (SongID);
+CREATE INDEX IF NOT EXISTS followsartist_artistid_idx ON FollowsArtist (ArtistID);
+CREATE INDEX IF NOT EXISTS createsplaylist_playlistid_idx ON CreatesPlaylist (PlaylistID);
+CREATE INDEX IF NOT EXISTS inplaylist_songid_idx ON InPlaylist (SongID);
+CREATE INDEX IF NOT EXISTS followsplaylist_playlistid_idx ON FollowsPlaylist (PlaylistID);
+CREATE INDEX IF NOT EXISTS likessong_songid_idx ON LikesSong (SongID);
+CREATE INDEX IF NOT EXISTS followsuser_followedid_idx ON FollowsUser (FollowedID);
+
+-- USERS BY NAME
+-- Query 1 looks users up by first and last name
+
+CREATE INDEX IF NOT EXISTS users_name_idx ON "Users" (FirstName, LastName);
+
+-- PER-ARTIST POPULARITY
+-- Query 2 aggregates SongPopularity over every Performs row. This view keeps the aggregate per artist.
+-- PopularitySum / RatedSongs (songs with a popularity) let name-level averages be recombined exactly, which is
+-- what Query 2 groups by. Refresh it after loading data: SELECT refresh_artist_song_popularity();
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS ArtistSongPopularity AS
+SELECT
+    a.ArtistID,
+    a.ArtistName,
+    COUNT(*) AS SongCount,
+    COUNT(s.SongPopularity) AS RatedSongs,
+    SUM(s.SongPopularity) AS PopularitySum,
+    ROUND(AVG(s.SongPopularity), 2) AS AvgPopularity,
+    MAX(s.SongPopularity) AS MaxPopularity
+FROM Artists a
+JOIN Performs p ON a.ArtistID = p.ArtistID
+JOIN Songs s ON s.SongID = p.SongID
+GROUP BY a.ArtistID, a.ArtistName;
+
+-- The unique index is what allows REFRESH ... CONCURRENTLY (readers are not blocked during a refresh)
+CREATE UNIQUE INDEX IF NOT EXISTS artistsongpopularity_artistid_idx ON ArtistSongPopularity (ArtistID);
+CREATE INDEX IF NOT EXISTS artistsongpopularity_avgpopularity_idx ON ArtistSongPopularity (AvgPopularity DESC);
+
+CREATE OR REPLACE FUNCTION refresh_artist_song_popularity() RETURNS void
+LANGUAGE plpgsql AS $$
+BEGIN
+    REFRESH MATERIALIZED VIEW CONCURRENTLY ArtistSongPopularity;
+END;
+$$;
+
+-- Query 2 against the view. Same result as queries.sql, but it aggregates one row per artist instead of
+-- every Performs row:
+--
+-- SELECT ArtistName, ROUND(SUM(PopularitySum)::numeric / NULLIF(SUM(RatedSongs), 0), 2) AS AvgPopularity
+-- FROM ArtistSongPopularity
+-- GROUP BY ArtistName
+-- ORDER BY AvgPopularity DESC
+-- LIMIT 5;
@@ -0,0 +1,145 @@
+"""
+Runs the whole crawl (playlists -> albums -> songs -> artists -> TSV) in a single process. All stages share one
+crawler engine, so they share its rate limit. Stages overlap instead of running one after another. Each stage's
+workers drain their *_to_check set as soon as an upstream stage adds IDs to it, and go back to waiting when it is
+empty. A stage finishes once every upstream stage has finished and its set is drained. The *_to_check sets are the
+same crawl_state tables the standalone scripts use, so a stopped pipeline can be resumed by any of them (or by
+running this again).
+
+Usage: python pipeline.py [--incremental] [--skip-playlists] [--skip-tsv] [--stream-tsv]
+"""
+import argparse
+import asyncio
+
+import crawl_state
+import create_tsv
+import process_albums
+import process_artists
+import remaining_songs
+import songs_from_playlist
+from crawler_engine import CrawlerEngine, MAX_IN_FLIGHT, ack, make_client, take
+
+WORKERS_PER_STAGE = 2
+CHECKPOINT_EVERY = 5    # batches, across all stages
+
+
+class Stage:
+    def __init__(self, name, to_check, process_batch, batch_size, upstream):
+        self.name = name
+        self.to_check = to_check
+        self.process_batch = process_batch
+        self.batch_size = batch_size
+        self.upstream = upstream
+        self.active = 0
+        self.processed = 0
+        self.done = False
+
+
+class Pipeline:
+    def __init__(self, engine):
+        self.engine = engine
+        self.changed = asyncio.Event()
+        self.batches = 0
+
+    def notify(self):
+        # Wake every waiting worker. Waiters hold the old event, new waiters get a fresh one
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def checkpoint(self):
+        self.batches += 1
+        if self.batches % CHECKPOINT_EVERY == 0:
+            written = crawl_state.checkpoint()
+            print(f"💾 Checkpoint: {written} records written\n")
+
+    async def worker(self, stage):
+        while True:
+            batch = take(stage.to_check, stage.batch_size)
+            if not batch:
+                if all(u.done for u in stage.upstream) and stage.active == 0:
+                    return
+                await self.changed.wait()
+                continue
+
+            stage.active += 1
+            try:
+                stage.processed += await stage.process_batch(batch, self.engine)
+                ack(stage.to_check, batch)
+            finally:
+                stage.active -= 1
+            print(f"🔹 [{stage.name}] {stage.processed} processed, {len(stage.to_check)} queued")
+            self.checkpoint()
+            self.notify()
+
+    async def run_stage(self, stage):
+        await asyncio.gather(*(self.worker(stage) for _ in range(WORKERS_PER_STAGE)))
+        stage.done = True
+        self.notify()
+        print(f"✅ [{stage.name}] finished. {stage.processed} processed\n")
+
+
+"""
+The playlist stage has no *_to_check set to drain. It runs songs_from_playlist.crawl once, waking the other
+stages at each of its checkpoints so they start on the albums and artists found so far
+"""
+async def run_playlists(pipeline, stage, incremental):
+    if not stage.done:
+        await songs_from_playlist.crawl(pipeline.engine, incremental, pipeline.notify)
+        stage.done = True
+    pipeline.notify()
+
+
+async def run(engine, skip_playlists, incremental):
+    pipeline = Pipeline(engine)
+
+    playlists = Stage("playlists", None, None, 0, [])
+    playlists.done = skip_playlists
+    albums = Stage("albums", process_albums.albums_to_check, process_albums.process_batch,
+                   process_albums.BATCH_SIZE * MAX_IN_FLIGHT, [playlists])
+    songs = Stage("songs", remaining_songs.songs_to_check, remaining_songs.process_batch,
+                  remaining_songs.BATCH_SIZE * MAX_IN_FLIGHT, [playlists, albums])
+    artists = Stage("artists", process_artists.artists_to_check, process_artists.process_batch,
+                    process_artists.BATCH_SIZE * MAX_IN_FLIGHT, [playlists, albums, songs])
+
+    await asyncio.gather(
+        run_playlists(pipeline, playlists, incremental),
+        pipeline.run_stage(albums),
+        pipeline.run_stage(songs),
+        pipeline.run_stage(artists),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run every crawl stage in one process")
+    parser.add_argument("--incremental", action="store_true", help="only crawl playlists that changed (see songs_from_playlist.py)")
+    parser.add_argument("--skip-playlists", action="store_true", help="only drain the existing *_to_check sets")
+    parser.add_argument("--skip-tsv", action="store_true", help="do not run create_tsv.py at the end")
+    parser.add_argument("--stream-tsv", action="store_true", help="use create_tsv.py's constant-memory --stream export")
+    args = parser.parse_args()
+
+    sp = make_client()
+
+    # Create the frontiers first so no stage exits on a missing *_to_check file. Every stage then loads
+    # the same table objects from crawl_state
+    for name in ["albums_to_check", "songs_to_check", "artists_to_check"]:
+        crawl_state.load_set(name)
+    for stage in [songs_from_playlist, process_albums, remaining_songs, process_artists]:
+        stage.load_data()
+
+    try:
+        asyncio.run(run(CrawlerEngine(sp), args.skip_playlists, args.incremental))
+    finally:
+        crawl_state.close()
+
+    if not args.skip_tsv:
+        if crawl_state.BACKEND == "sqlite":
+            import sqlite_store
+            sqlite_store.export_json()
+        if args.stream_tsv:
+            create_tsv.export_stream(create_tsv.CHUNK_ROWS)
+        else:
+            create_tsv.export_pandas()
+
+
+if __name__ == "__main__":
+    main()
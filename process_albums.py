@@ -3,15 +3,15 @@ This script takes the outputs from songs_from_playlist.py to search for all asso
 found from the playlists, their albums are grabbed here. This code then adds albums to the schema, finds new songs
 to add, and new artists to add.
 """
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
-
-import json
-import time
+import asyncio
 import os
 
+import album_cache
+import crawl_state
+import metrics
+from crawler_engine import CrawlerEngine, MAX_IN_FLIGHT, ack, make_client, take
+
 # Initialize globals
-songs = {}
 albums = {}
 albums_to_check = set()
 songs_to_check = set()
@@ -21,54 +21,35 @@ song_album = {}
 DATA_DIR = "data"
 os.makedirs(f"{DATA_DIR}", exist_ok=True)
 
+BATCH_SIZE = album_cache.BATCH_SIZE
+PAGE_SIZE = 50      # Max number of items per sp.album_tracks page
+
 
 def load_data():
-    global songs, albums, albums_to_check, songs_to_check, artists_to_check, song_album
+    global albums, albums_to_check, songs_to_check, artists_to_check, song_album
     # ------- ENTITIES -------
-    # Songs (only for checking if it was already found) - dict
-    try:
-        with open(f"{DATA_DIR}/songs.json", "r") as f:
-            songs = json.load(f)
-    except FileNotFoundError:
-        songs = {}
-
     # Albums - dict
-    try:
-        with open(f"{DATA_DIR}/albums.json", "r") as f:
-            albums = json.load(f)
-    except FileNotFoundError:
-        albums = {}
+    albums = crawl_state.load_dict("albums")
 
-    # Albums To Check (our list of IDs to check) - set
+    # Albums To Check (our list of IDs to check) - frontier
     try:
-        with open(f"{DATA_DIR}/albums_to_check.json", "r") as f:
-            albums_to_check = set(json.load(f))
+        albums_to_check = crawl_state.load_frontier("albums", required=True)
     except FileNotFoundError:
         print(f"❌ No albums_to_check.json file found.")
         exit()
 
-    # Artists To Check (to further populate artists.json) - set
-    try:
-        with open(f"{DATA_DIR}/artists_to_check.json", "r") as f:
-            artists_to_check = set(json.load(f))
-    except FileNotFoundError:
-        artists_to_check = set()
+    # Artists To Check (to further populate artists.json) - frontier
+    artists_to_check = crawl_state.load_frontier("artists")
 
-    # Songs To Check (to further populate songs.json) - set
-    try:
-        with open(f"{DATA_DIR}/songs_to_check.json", "r") as f:
-            songs_to_check = set(json.load(f))
-    except FileNotFoundError:
-        songs_to_check = set()
+    # Songs To Check (to further populate songs.json) - frontier. Its seen-ID index replaces loading every song
+    songs_to_check = crawl_state.load_frontier("songs")
 
     # ------- RELATIONSHIPS -------
     # Song - Album
-    try:
-        with open(f"{DATA_DIR}/song_album.json", "r") as f:
-            raw = json.load(f)
-            song_album = {tuple(k.split('|')) : v for k, v in raw.items()}
-    except FileNotFoundError:
-        song_album = {}
+    song_album = crawl_state.load_dict("song_album", pairs=True)
+
+    # Album objects shared with songs_from_playlist.py
+    album_cache.load_cache()
 
 
 # ------- HELPER FUNCTIONS -------
@@ -77,19 +58,8 @@ def load_data():
 Stores album information that will be needed for the Album schema.
 Also gets artist information to update artists_to_check
 """
-def save_album_info(album_id, sp):
-    while True:
-        try:
-            item = sp.album(album_id)
-            break
-        except spotipy.SpotifyException as e:
-            if e.http_status == 429:
-                retry_after = int(e.headers.get("Retry-After", 1))
-                print(f"❌ Rate limit hit. Retrying after {retry_after} seconds.\n")
-                time.sleep(retry_after)
-            else:
-                raise
-
+def save_album_info(item):
+    album_id = item["id"]
     if item.get("album_type") in ["single", "compilation"]:
         return
 
@@ -105,91 +75,65 @@ def save_album_info(album_id, sp):
     
     # Artists To Check
     for artist in item["artists"]:
-        if artist["id"] not in artists_to_check:
-            artists_to_check.add(artist["id"])
+        artists_to_check.discover(artist["id"], depth=albums_to_check.depth(album_id) + 1,
+                                  popularity=item.get("popularity"))
 
 """
-Gets all tracks found on the album. Handles any rate limiting from Spotify's API
+Gets all tracks found on the album. The first page comes embedded in the cached album object, so only
+albums with more tracks than that need extra requests. Those pages are fetched concurrently through
+the crawler engine, which handles any rate limiting from Spotify's API
 """
-def get_album_tracks(album_id, sp):
-    album = sp.album(album_id)
+async def get_album_tracks(album, engine):
     if album.get("album_type") in ["single", "compilation"]:
         return None     # skip
 
-    all_tracks = []
-    results = None
-    while True:
-        try:
-            if results is None:
-                results = sp.album_tracks(album_id, limit=50, offset=0)
-            else:
-                if results.get("next"):
-                    results = sp.next(results)
-                else:
-                    break
-            all_tracks.extend(results["items"])
-            print(f"🔹 Fetched {len(all_tracks)} tracks so far...\n")
-
-        except spotipy.SpotifyException as e:
-            if e.http_status == 429:
-                retry_after = int(e.headers.get("Retry-After", 1))
-                print(f"❌ Rate limit hit. Retrying after {retry_after} seconds.\n")
-                time.sleep(retry_after)
-            else:
-                raise
-    
+    first = album["tracks"]
+    offsets = range(len(first["items"]), first["total"], PAGE_SIZE)
+    pages = await asyncio.gather(*(
+        engine.call("album_tracks", album["id"], limit=PAGE_SIZE, offset=offset) for offset in offsets
+    ))
+
+    all_tracks = list(first["items"])
+    for page in pages:
+        all_tracks.extend(page["items"])
+    if pages:
+        print(f"🔹 Fetched {len(all_tracks)} tracks in {len(pages) + 1} pages\n")
     return all_tracks
 
 
 """
-Save all data in JSON format.
+Save all changes since the last checkpoint (see crawl_state.py).
 """
 def checkpoint():
     print(f"✅ Checkpointing...")
+    written = crawl_state.checkpoint()
+    print(f"💾 Checkpoint: {len(albums)} albums items saved ({written} records written)\n")
 
-    # Albums
-    with open(f"{DATA_DIR}/albums.json", "w") as f:
-        json.dump(albums, f)
-    # Albums To Check
-    with open(f"{DATA_DIR}/albums_to_check.json", "w") as f:
-        json.dump(list(albums_to_check), f)
-    # Artists To Check
-    with open(f"{DATA_DIR}/artists_to_check.json", "w") as f:
-        json.dump(list(artists_to_check), f)
-    # Songs To Check
-    with open(f"{DATA_DIR}/songs_to_check.json", "w") as f:
-        json.dump(list(songs_to_check), f)
-    
-    # Relationships require flattening
-    # Song - Album
-    with open(f"{DATA_DIR}/song_album.json", "w") as f:
-        json.dump({ f"{k[0]}|{k[1]}":v for k, v in song_album.items() }, f)
-    
-    print(f"💾 Checkpoint: {len(albums)} albums items saved\n")
 
+"""
+Saves the albums for one batch of IDs from albums_to_check, queues their songs in songs_to_check,
+and records the song - album relationships. Returns the number of albums processed
+"""
+async def process_batch(album_ids, engine):
+    processed = 0
+    # Albums already seen by songs_from_playlist.py are served from the cache
+    batch_albums = [album for album in await album_cache.get_albums(album_ids, engine) if album]
+    batch_tracks = await asyncio.gather(*(get_album_tracks(album, engine) for album in batch_albums))
 
-def main():
-    auth_manager = SpotifyClientCredentials()
-    sp = spotipy.Spotify(auth_manager=auth_manager)
-
-    load_data()
-
-    processed_albums = 0
-
-    print(f"Beginning processing! {len(albums)} exist, {len(albums_to_check)} to add.")
-    while albums_to_check:
-        album_id = albums_to_check.pop()     # Remove random album
+    for album, album_tracks in zip(batch_albums, batch_tracks):
+        album_id = album["id"]
 
         # Album entity
-        save_album_info(album_id, sp)
+        save_album_info(album)
 
-        album_tracks = get_album_tracks(album_id, sp)
+        if album_tracks is None:
+            continue
+        depth = albums_to_check.depth(album_id) + 1
         try:
             for item in album_tracks:
                 track_id = item["id"]
-                # Check if song has already been found
-                if track_id not in songs and track_id not in songs_to_check:
-                    songs_to_check.add(track_id)
+                # Queue the song unless it has already been found
+                songs_to_check.discover(track_id, depth=depth, popularity=album.get("popularity"))
 
                 # Add song to song - album relationship
                 if (track_id, album_id) not in song_album:
@@ -201,12 +145,37 @@ def main():
             checkpoint()
             raise e
         
-        processed_albums += 1
-        if processed_albums % 10 == 0:
-            print(f"Processed {processed_albums} albums. {len(albums_to_check)} remaining\n")
-            checkpoint()
+        processed += 1
     
+    metrics.processed("albums", processed)
+    return processed
+
+
+async def crawl(engine):
+    processed_albums = 0
+
+    print(f"Beginning processing! {len(albums)} exist, {len(albums_to_check)} to add.")
+    while True:
+        # Drain albums_to_check in enough full-size batches to keep every worker busy
+        batch = take(albums_to_check, BATCH_SIZE * MAX_IN_FLIGHT)
+        if not batch:
+            break
+        processed_albums += await process_batch(batch, engine)
+        ack(albums_to_check, batch)
+
+        print(f"Processed {processed_albums} albums. {len(albums_to_check)} remaining\n")
+        checkpoint()
+
+
+def main():
+    sp = make_client()
+
+    load_data()
+
+    asyncio.run(crawl(CrawlerEngine(sp)))
+
     checkpoint()
+    crawl_state.close()
     print(f"✅ Saved {len(albums)} albums. {len(albums_to_check)} left to process.")
 
 
@@ -2,13 +2,13 @@
 This script handles all remaining artsists from artists_to_check.json. It also adds genres and the artist-genre relationship.
 
 """
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
-
-import json
-import time
+import asyncio
 import os
 
+import crawl_state
+import metrics
+from crawler_engine import CrawlerEngine, MAX_IN_FLIGHT, ack, chunks, make_client, take
+
 # Initialize globals
 artists_to_check = set()
 artists = {}
@@ -18,90 +18,60 @@ artist_genre = set()
 DATA_DIR = "data"
 os.makedirs(f"{DATA_DIR}", exist_ok=True)
 
+BATCH_SIZE = 50     # Max number of IDs accepted by sp.artists
+
 def load_data():
     global artists_to_check, artists, genres, artist_genre
 
     # ----- ENTITIES -----
-    # Artists To Check (list of IDs to check) - set
+    # Artists To Check (list of IDs to check) - frontier
     try:
-        with open(f"{DATA_DIR}/artists_to_check.json", "r") as f:
-            artists_to_check = set(json.load(f))
+        artists_to_check = crawl_state.load_frontier("artists", required=True)
     except FileNotFoundError:
         print(f"❌ No artists_to_check.json file found.")
         exit()
     
     # Artists - dict
-    try:
-        with open(f"{DATA_DIR}/artists.json", "r") as f:
-            artists = json.load(f)
-    except FileNotFoundError:
-        artists = {}
+    artists = crawl_state.load_dict("artists")
 
     # Genres - set
-    try:
-        with open(f"{DATA_DIR}/genres.json", "r") as f:
-            genres = set(json.load(f))
-    except FileNotFoundError:
-        genres = set()
+    genres = crawl_state.load_set("genres")
     
     # ----- RELATIONSHIPS -----
     # Artist - Genre - set
-    try:
-        with open(f"{DATA_DIR}/artist_genre.json", "r") as f:
-            raw = json.load(f)
-            artist_genre = set(tuple(k.split('|')) for k in raw)
-    except FileNotFoundError:
-        artist_genre = set()
+    artist_genre = crawl_state.load_set("artist_genre", pairs=True)
     
 
-def checkpoint():
-    print(f"✅ Checkpointing...")
+"""
+Fetches full artist objects for every ID, BATCH_SIZE per request, with the requests running concurrently
+through the crawler engine (which handles any rate limiting from Spotify's API).
+IDs Spotify does not recognize come back as None.
+"""
+async def get_artists(artist_ids, engine):
+    batches = chunks(artist_ids, BATCH_SIZE)
+    results = await engine.call_many("artists", batches)
+    return [item for result in results for item in result["artists"]]
 
-    # Artists To Check (list of IDs to check) - set
-    with open(f"{DATA_DIR}/artists_to_check.json", "w") as f:
-        json.dump(list(artists_to_check), f)
-    
-    # Artists - dict
-    with open(f"{DATA_DIR}/artists.json", "w") as f:
-        json.dump(artists, f)
 
-    # Genres - set
-    with open(f"{DATA_DIR}/genres.json", "w") as f:
-        json.dump(list(genres), f)
-        
-    # Artist - Genre
-    with open(f"{DATA_DIR}/artist_genre.json", "w") as f:
-        json.dump( [f"{k[0]}|{k[1]}" for k in artist_genre], f)
-
-    print(f"💾 Checkpoint: {len(artists)} artists saved\n")
+def checkpoint():
+    print(f"✅ Checkpointing...")
+    written = crawl_state.checkpoint()
+    print(f"💾 Checkpoint: {len(artists)} artists saved ({written} records written)\n")
     
 
-def main():
-    auth_manager = SpotifyClientCredentials()
-    sp = spotipy.Spotify(auth_manager=auth_manager)
-
-    load_data()
-
-    processed_artists = 0
+"""
+Saves the artists for one batch of IDs from artists_to_check, along with their genres.
+Returns the number of new artists
+"""
+async def process_batch(artist_ids, engine):
+    processed = 0
+    items = await get_artists(artist_ids, engine)
 
-    print(f"Beginning processing! {len(artists)} exist, {len(artists_to_check)} to add.")
+    for item in items:
+        if not item:
+            continue
 
-    while artists_to_check:
-        artist_id = artists_to_check.pop()
-        
-        while True:
-            try:
-                item = sp.artist(artist_id)
-                break
-            except spotipy.SpotifyException as e:
-                if e.http_status == 429:
-                    retry_after = int(e.headers.get('Retry-After', 1))
-                    print(f"❌ Rate limit hit. Retrying after {retry_after} seconds.\n")
-                    time.sleep(retry_after)
-                    print(f"Retrying...\n")
-                else:
-                    raise
-        
+        artist_id = item["id"]
         # Attributes
         if artist_id not in artists:
             artists[artist_id] = {
@@ -109,23 +79,47 @@ def main():
                 "artistPopularity": item["popularity"],
                 "artistArtURL": item["images"][0]["url"] if item.get("images") else None
             }
-            processed_artists += 1
-        
+            processed += 1
+
         # Genres
         for g in item["genres"]:
             if g not in genres:
                 genres.add(g)
             if (artist_id, g) not in artist_genre:
                 artist_genre.add((artist_id, g))
-        
-        if processed_artists % 25 == 0:
-            print(f"Processed {processed_artists} / {processed_artists + len(artists_to_check)} artists...")
-            checkpoint()
+
+    metrics.processed("artists", processed)
+    return processed
+
+
+async def crawl(engine):
+    processed_artists = 0
+
+    print(f"Beginning processing! {len(artists)} exist, {len(artists_to_check)} to add.")
+
+    while True:
+        # Drain artists_to_check in enough full-size batches to keep every worker busy
+        batch = take(artists_to_check, BATCH_SIZE * MAX_IN_FLIGHT)
+        if not batch:
+            break
+        processed_artists += await process_batch(batch, engine)
+        ack(artists_to_check, batch)
+
+        print(f"Processed {processed_artists} / {processed_artists + len(artists_to_check)} artists...")
+        checkpoint()
     
     checkpoint()
     print(f"✅ Finished! Successfully saved {processed_artists} artists. Total artists: {len(artists)}\n")
     print(f"✅ Finished! Successfully saved {len(genres)} genres.")
 
 
+def main():
+    sp = make_client()
+
+    load_data()
+
+    asyncio.run(crawl(CrawlerEngine(sp)))
+    crawl_state.close()
+
 if __name__ == "__main__":
     main()
@@ -2,13 +2,13 @@
 This script handles all remaining songs from songs_to_check.json, including all attributes and relationships with artists.
 
 """
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
-
-import json
-import time
+import asyncio
 import os
 
+import crawl_state
+import metrics
+from crawler_engine import CrawlerEngine, MAX_IN_FLIGHT, ack, chunks, make_client, take
+
 
 # Initialize globals
 songs = {}
@@ -19,84 +19,57 @@ song_artist = {}
 DATA_DIR = "data"
 os.makedirs(f"{DATA_DIR}", exist_ok=True)
 
+BATCH_SIZE = 50     # Max number of IDs accepted by sp.tracks
+
 def load_data():
     global songs, songs_to_check, artists_to_check, song_artist
     # --------- ENTITIES ---------
     # Songs - dict
-    try:
-        with open(f"{DATA_DIR}/songs.json", "r") as f:
-            songs = json.load(f)
-    except FileNotFoundError:
-        songs = {}
+    songs = crawl_state.load_dict("songs")
 
-    # Songs To Check (list of IDs to check) - set
+    # Songs To Check (list of IDs to check) - frontier
     try:
-        with open(f"{DATA_DIR}/songs_to_check.json", "r") as f:
-            songs_to_check = set(json.load(f))
+        songs_to_check = crawl_state.load_frontier("songs", required=True)
     except FileNotFoundError:
         print(f"❌ No songs_to_check.json file found.")
         exit()
 
-    # Artists To Check (to further populate artists.json) - set
-    try:
-        with open(f"{DATA_DIR}/artists_to_check.json", "r") as f:
-            artists_to_check = set(json.load(f))
-    except FileNotFoundError:
-        artists_to_check = set()
+    # Artists To Check (to further populate artists.json) - frontier
+    artists_to_check = crawl_state.load_frontier("artists")
 
     # Song - Artist
-    try:
-        with open(f"{DATA_DIR}/song_artist.json", "r") as f:
-            raw = json.load(f)
-            song_artist = set(tuple(k.split('|')) for k in raw)
-    except FileNotFoundError:
-        song_artist = set()
+    song_artist = crawl_state.load_set("song_artist", pairs=True)
 
 
-def checkpoint():
-    print(f"✅ Checkpointing...")
-
-    # Songs
-    with open(f"{DATA_DIR}/songs.json", "w") as f:
-        json.dump(songs, f)
-    # Songs To Check
-    with open(f"{DATA_DIR}/songs_to_check.json", "w") as f:
-        json.dump(list(songs_to_check), f)
-    # Artists To Check
-    with open(f"{DATA_DIR}/artists_to_check.json", "w") as f:
-        json.dump(list(artists_to_check), f)
-    # Song-Artist
-    with open(f"{DATA_DIR}/song_artist.json", "w") as f:
-        json.dump([f"{k[0]}|{k[1]}" for k in song_artist], f)
-    print(f"💾 Checkpoint: {len(songs)} songs saved\n")
+"""
+Fetches full track objects for every ID, BATCH_SIZE per request, with the requests running concurrently
+through the crawler engine (which handles any rate limiting from Spotify's API).
+IDs Spotify does not recognize come back as None.
+"""
+async def get_tracks(track_ids, engine):
+    batches = chunks(track_ids, BATCH_SIZE)
+    results = await engine.call_many("tracks", batches)
+    return [item for result in results for item in result["tracks"]]
 
 
-def main():
-    auth_manager = SpotifyClientCredentials()
-    sp = spotipy.Spotify(auth_manager=auth_manager)
+def checkpoint():
+    print(f"✅ Checkpointing...")
+    written = crawl_state.checkpoint()
+    print(f"💾 Checkpoint: {len(songs)} songs saved ({written} records written)\n")
 
-    load_data()
 
-    processed_songs = 0
+"""
+Saves the songs for one batch of IDs from songs_to_check, along with their song-artist relationships.
+Returns the number of new songs
+"""
+async def process_batch(track_ids, engine):
+    processed = 0
+    tracks = await get_tracks(track_ids, engine)
 
-    print(f"Beginning processing! {len(songs)} exist, {len(songs_to_check)} to add.")
+    for track in tracks:
+        if not track:
+            continue
 
-    while songs_to_check:
-        track_id = songs_to_check.pop()
-        
-        while True:
-            try:
-                track = sp.track(track_id)
-                break
-            except spotipy.SpotifyException as e:
-                if e.http_status == 429:
-                    retry_after = int(e.headers.get('Retry-After', 1))
-                    print(f"❌ Rate limit hit. Retrying after {retry_after} seconds.\n")
-                    time.sleep(retry_after)
-                    print(f"Retrying...\n")
-                else:
-                    raise
-        
         song_id = track["id"]
         # Attributes
         if song_id not in songs:
@@ -107,21 +80,46 @@ def main():
                 "popularity": track.get("popularity", None),
                 "artURL": track["album"]["images"][0]["url"] if track["album"].get("images") else None
             }
-            processed_songs += 1
+            processed += 1
 
         for artist in track["artists"]:
             artist_id = artist["id"]
-            if artist_id not in artists_to_check:
-                artists_to_check.add(artist_id)
+            artists_to_check.discover(artist_id, depth=songs_to_check.depth(song_id) + 1,
+                                      popularity=track.get("popularity"))
             if (song_id, artist_id) not in song_artist:
                 song_artist.add((song_id, artist_id))
-        
-        if processed_songs % 25 == 0:
-            print(f"Processed {processed_songs} / {processed_songs + len(songs_to_check)} songs...")
-            checkpoint()
+
+    metrics.processed("songs", processed)
+    return processed
+
+
+async def crawl(engine):
+    processed_songs = 0
+
+    print(f"Beginning processing! {len(songs)} exist, {len(songs_to_check)} to add.")
+
+    while True:
+        # Drain songs_to_check in enough full-size batches to keep every worker busy
+        batch = take(songs_to_check, BATCH_SIZE * MAX_IN_FLIGHT)
+        if not batch:
+            break
+        processed_songs += await process_batch(batch, engine)
+        ack(songs_to_check, batch)
+
+        print(f"Processed {processed_songs} / {processed_songs + len(songs_to_check)} songs...")
+        checkpoint()
     
     checkpoint()
     print(f"✅ Finished! Successfully saved {processed_songs} songs. Total songs: {len(songs)}\n")
 
+
+def main():
+    sp = make_client()
+
+    load_data()
+
+    asyncio.run(crawl(CrawlerEngine(sp)))
+    crawl_state.close()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,187 @@
+"""
+Record / replay of Spotify responses, for measuring the crawler without network access.
+
+Recording: with CRAWL_RECORD=<path>, make_client() wraps the real client in a RecordingClient, which appends every
+response it returns to a gzipped JSON lines fixture file (e.g. data/fixtures.jsonl.gz). Batch lookups
+(sp.albums, sp.tracks, sp.artists) are split and stored per ID, because the IDs a batch holds depend on set order
+and differ between runs. Every other call is stored under its full request (method and arguments).
+
+Replay: with CRAWL_REPLAY=<path>, make_client() returns a ReplayClient instead, which answers from the fixtures
+without credentials or network. Unknown IDs in a batch come back as None, like Spotify's own answer, and other
+requests that were never recorded raise a 404. To look like the real API it can add latency and answer a share of
+requests with 429 and a Retry-After header:
+    CRAWL_REPLAY_LATENCY_MS     delay per request (default 0)
+    CRAWL_REPLAY_429_RATE       share of requests answered with 429 (default 0)
+    CRAWL_REPLAY_RETRY_AFTER    Retry-After seconds sent with each 429 (default 1)
+    CRAWL_REPLAY_RATE_LIMIT     requests per second each client may make, like one Spotify app. Requests beyond it in
+                                the same second get a 429 (default 0, no limit)
+    CRAWL_REPLAY_CLIENTS        number of replay clients make_client() pools, like that many credential pairs
+                                (default 1, see client_pool.py)
+
+crawl_benchmark.py runs the crawl stages against a ReplayClient and reports their throughput.
+"""
+import gzip
+import json
+import os
+import random
+import threading
+import time
+
+import spotipy
+
+from response_cache import BATCH_METHODS, request_key
+
+LATENCY_MS = float(os.environ.get("CRAWL_REPLAY_LATENCY_MS", 0))
+THROTTLE_RATE = float(os.environ.get("CRAWL_REPLAY_429_RATE", 0))
+RETRY_AFTER = int(os.environ.get("CRAWL_REPLAY_RETRY_AFTER", 1))
+RATE_LIMIT = float(os.environ.get("CRAWL_REPLAY_RATE_LIMIT", 0))
+CLIENTS = int(os.environ.get("CRAWL_REPLAY_CLIENTS", 1))
+
+# Counters of every ReplayClient in this process, read (and reset) by crawl_benchmark.py
+stats = {"requests": 0, "items": 0, "throttled": 0, "missing": 0}
+stats_lock = threading.Lock()
+
+# fixture path -> loaded fixtures (see load_fixtures)
+fixtures = {}
+
+# Every RecordingClient appends to the same file, so the clients of a pool take turns
+record_lock = threading.Lock()
+
+
+def count(**changes):
+    with stats_lock:
+        for k, v in changes.items():
+            stats[k] += v
+
+
+def reset_stats():
+    with stats_lock:
+        for k in stats:
+            stats[k] = 0
+
+
+"""
+Number of entities in a response: the items of a page, the non-empty entries of a batch, otherwise 1
+"""
+def response_items(method, response):
+    if method in BATCH_METHODS:
+        return sum(1 for item in response[BATCH_METHODS[method]] if item)
+    if isinstance(response, dict) and "items" in response:
+        return len(response["items"])
+    return 1
+
+
+"""
+Reads a fixture file into ((method, id) -> JSON, request key -> JSON). Responses are kept as JSON text and parsed
+on every call, so each caller gets its own copy (album_cache.strip_markets edits albums in place) and replay pays
+the parsing cost the real client does. Each file is only read once per process
+"""
+def load_fixtures(path):
+    if path not in fixtures:
+        items, requests = {}, {}
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                response = json.dumps(record["response"])
+                if "id" in record:
+                    items[(record["method"], record["id"])] = response
+                else:
+                    requests[record["key"]] = response
+        fixtures[path] = (items, requests)
+        print(f"📼 Loaded {len(items)} items and {len(requests)} responses from {path}")
+    return fixtures[path]
+
+
+class RecordingClient:
+    """Wraps a spotipy client and appends every response it returns to a fixture file."""
+
+    def __init__(self, sp, path):
+        self.sp = sp
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def record(self, method, args, kwargs, response):
+        if method in BATCH_METHODS and args:
+            ids = args[0].split(",") if isinstance(args[0], str) else args[0]
+            records = [
+                {"method": method, "id": item_id, "response": item}
+                for item_id, item in zip(ids, response[BATCH_METHODS[method]])
+            ]
+        else:
+            records = [{"method": method, "key": request_key(method, args, kwargs), "response": response}]
+        data = "".join(json.dumps(r) + "\n" for r in records)
+        # Each write is its own gzip member, which gzip readers concatenate
+        with record_lock, gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.write(data)
+
+    def __getattr__(self, method):
+        attr = getattr(self.sp, method)
+        if not callable(attr):
+            return attr
+
+        def recorded(*args, **kwargs):
+            response = attr(*args, **kwargs)
+            self.record(method, args, kwargs, response)
+            return response
+        return recorded
+
+
+class ReplayClient:
+    """Answers spotipy calls from a fixture file, with optional latency, injected 429s and a rate limit."""
+
+    def __init__(self, path, latency_ms=LATENCY_MS, throttle_rate=THROTTLE_RATE, retry_after=RETRY_AFTER,
+                 rate_limit=RATE_LIMIT, seed=None):
+        self.latency = latency_ms / 1000
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.rate_limit = rate_limit
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.window_start = 0.0
+        self.window_requests = 0
+
+        self.items, self.requests = load_fixtures(path)
+
+    def over_rate_limit(self):
+        """Counts a request against the current one-second window. True if it is over the limit."""
+        if not self.rate_limit:
+            return False
+        with self.random_lock:
+            now = time.monotonic()
+            if now - self.window_start >= 1:
+                self.window_start = now
+                self.window_requests = 0
+            self.window_requests += 1
+            return self.window_requests > self.rate_limit
+
+    def respond(self, method, args, kwargs):
+        if method in BATCH_METHODS:
+            ids = args[0].split(",") if isinstance(args[0], str) else args[0]
+            entries = []
+            for item_id in ids:
+                text = self.items.get((method, item_id))
+                if text is None:
+                    count(missing=1)
+                entries.append(json.loads(text) if text is not None else None)
+            return {BATCH_METHODS[method]: entries}
+
+        text = self.requests.get(request_key(method, args, kwargs))
+        if text is None:
+            count(missing=1)
+            raise spotipy.SpotifyException(404, -1, f"{method}{args} was not recorded")
+        return json.loads(text)
+
+    def __getattr__(self, method):
+        def replayed(*args, **kwargs):
+            if self.latency:
+                time.sleep(self.latency)
+            with self.random_lock:
+                throttled = self.throttle_rate and self.random.random() < self.throttle_rate
+            if throttled or self.over_rate_limit():
+                count(requests=1, throttled=1)
+                raise spotipy.SpotifyException(429, -1, "injected rate limit",
+                                               headers={"Retry-After": str(self.retry_after)})
+            response = self.respond(method, args, kwargs)
+            count(requests=1, items=response_items(method, response))
+            return response
+        return replayed
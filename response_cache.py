@@ -0,0 +1,234 @@
+"""
+On-disk cache of Spotify API responses, so a crawl that is re-run after a crash (or during development) does not
+repeat the album track, track and artist requests it already made. make_client() wraps the spotipy client in a CachedClient, which answers
+cacheable calls (sp.albums, sp.album_tracks, ...) from data/http_cache/ when it can and stores every new response.
+
+Each response is a gzipped JSON file named after the SHA-256 of its request (method name and arguments), so the same
+request always maps to the same file:
+    data/http_cache/<first 2 hex digits>/<sha256>.json.gz
+Batch lookups (sp.tracks, sp.artists) are split and stored per ID, like replay_client.py records them, because the IDs
+a batch holds depend on set order and differ between runs. A batch then only requests the IDs that are not cached.
+Entries expire after their endpoint's TTL (see TTLS). Calls not listed in TTLS are never cached. Reading an entry
+touches its file, and once the cache grows past its size limit the least recently used files are deleted.
+
+Tuning (environment variables):
+    CRAWL_CACHE             set to 0 to turn the cache off
+    CRAWL_CACHE_DIR         where responses are stored (default data/http_cache)
+    CRAWL_CACHE_MAX_MB      size limit (default 2048)
+
+Usage: python response_cache.py stats|clear
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+CACHE_DIR = os.environ.get("CRAWL_CACHE_DIR", "data/http_cache")
+ENABLED = os.environ.get("CRAWL_CACHE", "1") != "0"
+MAX_BYTES = int(float(os.environ.get("CRAWL_CACHE_MAX_MB", 2048)) * 1024 * 1024)
+EVICT_TO = 0.9      # Eviction deletes down to this share of MAX_BYTES, so it does not run on every write
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+# spotipy method -> seconds its responses stay fresh. Playlists change, so they expire quickly: an incremental
+# crawl the next day has to see the new snapshot_id. sp.playlist_items is not listed, since its request does not
+# name the snapshot it reads: a cached page could pair a new snapshot_id with old items, and the next incremental run
+# would then skip the playlist. Albums and tracks hardly ever change, and artist popularity drifts slowly.
+# sp.albums is not listed: album_cache.py already keeps every album object in crawl state, so caching the responses
+# here too would store each album twice
+TTLS = {
+    "playlist": 10 * 60,
+    "album_tracks": 30 * DAY,
+    "tracks": 30 * DAY,
+    "artists": 7 * DAY,
+}
+
+# Batch lookup method -> key of the list in its response
+BATCH_METHODS = {
+    "albums": "albums",
+    "tracks": "tracks",
+    "artists": "artists",
+}
+
+
+"""
+Canonical request key. kwargs are sorted, so the order they are passed in does not matter
+"""
+def request_key(method, args, kwargs):
+    request = json.dumps([method, list(args), kwargs], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Size-bounded, TTL-aware store of gzipped JSON responses. Safe to use from the engine's worker threads."""
+
+    def __init__(self, path=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.size = sum(size for _, _, size in self.entries())
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key[:2], f"{key}.json.gz")
+
+    def entries(self):
+        """(path, last used, size) of every cached file."""
+        if not os.path.isdir(self.path):
+            return
+        for sub in os.scandir(self.path):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith(".json.gz"):
+                    st = entry.stat()
+                    yield entry.path, st.st_mtime, st.st_size
+
+    def get(self, key, ttl):
+        """Returns (True, response) if the cache holds a fresh response for key, else (False, None)."""
+        path = self.entry_path(key)
+        try:
+            with open(path, "rb") as f:
+                entry = json.loads(gzip.decompress(f.read()))
+        except (FileNotFoundError, OSError, ValueError):
+            # Missing, or half-written by a crashed process (writes are atomic, so only from older versions)
+            with self.lock:
+                self.misses += 1
+            return False, None
+
+        if time.time() - entry["saved"] > ttl:
+            with self.lock:
+                self.misses += 1
+            return False, None
+
+        # The file's mtime is its last use, which is what eviction orders by
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        with self.lock:
+            self.hits += 1
+        return True, entry["response"]
+
+    def put(self, key, method, response):
+        path = self.entry_path(key)
+        data = gzip.compress(json.dumps({"method": method, "saved": time.time(), "response": response}).encode("utf-8"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file and rename, so a crash never leaves a truncated entry behind
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        try:
+            old_size = os.path.getsize(path)
+        except FileNotFoundError:
+            old_size = 0
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            self.size += len(data) - old_size
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """Deletes the least recently used entries until the cache is below EVICT_TO of its limit."""
+        entries = sorted(self.entries(), key=lambda e: e[1])
+        self.size = sum(size for _, _, size in entries)
+        target = self.max_bytes * EVICT_TO
+        removed = 0
+        for path, _, size in entries:
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+            removed += 1
+        print(f"🧹 Response cache: evicted {removed} entries ({self.size / 1024 / 1024:.0f} MB left)\n")
+
+    def clear(self):
+        with self.lock:
+            for path, _, _ in list(self.entries()):
+                os.remove(path)
+            self.size = 0
+
+
+class CachedClient:
+    """
+    Wraps a spotipy client. Methods listed in TTLS are served from the cache while fresh, everything else
+    (and every attribute) goes straight to the wrapped client. Batch lookups are cached per ID. Errors are never cached.
+    """
+
+    def __init__(self, sp, cache=None):
+        self.sp = sp
+        self.cache = cache if cache is not None else ResponseCache()
+
+    def __getattr__(self, method):
+        attr = getattr(self.sp, method)
+        ttl = TTLS.get(method)
+        if ttl is None or not callable(attr):
+            return attr
+
+        if method in BATCH_METHODS:
+            def cached_batch(*args, **kwargs):
+                return self.batch(method, attr, ttl, args, kwargs)
+            return cached_batch
+
+        def cached(*args, **kwargs):
+            key = request_key(method, args, kwargs)
+            hit, response = self.cache.get(key, ttl)
+            if hit:
+                return response
+            response = attr(*args, **kwargs)
+            self.cache.put(key, method, response)
+            return response
+        return cached
+
+    def batch(self, method, attr, ttl, args, kwargs):
+        """Answers a batch lookup from the cached IDs, and requests only the others in one call."""
+        ids = args[0].split(",") if isinstance(args[0], str) else list(args[0])
+        keys = [request_key(method, [item_id, *args[1:]], kwargs) for item_id in ids]
+        items = {}
+        for item_id, key in zip(ids, keys):
+            hit, item = self.cache.get(key, ttl)
+            if hit:
+                items[item_id] = item
+
+        missing = [item_id for item_id in dict.fromkeys(ids) if item_id not in items]
+        if missing:
+            response = attr(missing, *args[1:], **kwargs)
+            for item_id, item in zip(missing, response[BATCH_METHODS[method]]):
+                items[item_id] = item
+                self.cache.put(request_key(method, [item_id, *args[1:]], kwargs), method, item)
+        return {BATCH_METHODS[method]: [items[item_id] for item_id in ids]}
+
+
+"""
+Wraps sp in a CachedClient, unless CRAWL_CACHE=0. Clients of a pool share one cache
+"""
+def wrap(sp, cache=None):
+    if not ENABLED:
+        return sp
+    return CachedClient(sp, cache)
+
+
+def stats(cache):
+    entries = list(cache.entries())
+    print(f"{len(entries)} responses, {cache.size / 1024 / 1024:.1f} MB of {cache.max_bytes / 1024 / 1024:.0f} MB in {cache.path}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] == ["stats"]:
+        stats(ResponseCache())
+    elif sys.argv[1:] == ["clear"]:
+        ResponseCache().clear()
+        print(f"✅ Cleared {CACHE_DIR}")
+    else:
+        print("Usage: python response_cache.py stats|clear")
@@ -0,0 +1,223 @@
+"""
+Seen-ID index per entity type (songs, albums, artists), for the crawlers' "was this ID already found?" checks. An ID
+is seen once it has been stored or queued in its *_to_check set, so each ID is queued at most once: processed artists
+no longer go back into artists_to_check whenever another of their songs turns up, and process_albums no longer needs
+every song loaded just to skip the known ones.
+
+Each index is two memory-mapped arrays under data/seen/:
+    <entity>.<generation>.bloom.npy     a Bloom filter of every saved ID
+    <entity>.<generation>.ids.npy       the same IDs, sorted
+Most lookups of unseen IDs end at the filter, after a few byte reads. An ID the filter reports is confirmed by binary
+search in the sorted IDs, so a false positive never skips real work. At the default 1% false positive rate the
+filter takes about 1.2 bytes per ID, and both files are shared through the OS page cache by every stage using them.
+
+IDs added since the last save are kept in memory and journaled by crawl_state like every other table
+(data/journal/seen_<entity>.jsonl), after the tables they were stored or queued in. crawl_state merges them into a
+new generation once the journal outgrows the arrays, and data/seen/<entity>.json is switched to it atomically. The
+filter is rebuilt at twice the size once the IDs outgrow its capacity. A missing index is built from the entity's
+table and *_to_check set the first time it is opened (crawl_state.load_seen).
+
+Tuning (environment variables):
+    CRAWL_SEEN_FP_RATE      Bloom filter false positive rate (default 0.01)
+    CRAWL_SEEN_CAPACITY     smallest number of IDs a filter is sized for (default 1000000)
+"""
+import glob
+import hashlib
+import json
+import math
+import os
+
+import numpy as np
+
+import compact_store
+
+DATA_DIR = "data"
+SEEN_DIR = f"{DATA_DIR}/seen"
+os.makedirs(f"{SEEN_DIR}", exist_ok=True)
+
+FP_RATE = float(os.environ.get("CRAWL_SEEN_FP_RATE", 0.01))
+MIN_CAPACITY = int(os.environ.get("CRAWL_SEEN_CAPACITY", 1_000_000))
+HASH_CHUNK = 1_000_000      # IDs hashed at once when filling a filter
+
+MASK = 2 ** 64 - 1
+
+
+def manifest_path(entity):
+    return f"{SEEN_DIR}/{entity}.json"
+
+
+def array_path(entity, generation, column):
+    return f"{SEEN_DIR}/{entity}.{generation}.{column}.npy"
+
+
+def read_manifest(entity):
+    try:
+        with open(manifest_path(entity), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"generation": 0}
+
+
+def sync_dir():
+    dir_fd = os.open(SEEN_DIR, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+"""
+64-bit hash of an encoded ID. BLAKE2 runs in C, so hashing costs well under a microsecond per lookup
+"""
+def id_hash(raw):
+    return int.from_bytes(hashlib.blake2b(raw, digest_size=8).digest(), "little")
+
+
+def id_hashes(raw_ids):
+    return np.frombuffer(b"".join(hashlib.blake2b(raw, digest_size=8).digest() for raw in raw_ids), dtype="<u8")
+
+
+"""
+Bits and hash count of a filter holding capacity IDs at FP_RATE
+"""
+def filter_size(capacity):
+    bits = math.ceil(-capacity * math.log(FP_RATE) / math.log(2) ** 2)
+    bits = (bits + 7) // 8 * 8
+    return bits, max(1, round(bits / capacity * math.log(2)))
+
+
+"""
+Sets the filter bits of every ID in raw_ids. The k bit positions of an ID come from its one hash and a step derived
+from it, h + i * step (double hashing), like in SeenIds.maybe_saved
+"""
+def set_bits(bloom, raw_ids, bits, hashes):
+    for start in range(0, len(raw_ids), HASH_CHUNK):
+        h = id_hashes(raw_ids[start:start + HASH_CHUNK])
+        step = ((h >> np.uint64(32)) | (h << np.uint64(32))) | np.uint64(1)
+        for i in range(hashes):
+            position = (h + np.uint64(i) * step) % np.uint64(bits)
+            masks = np.left_shift(1, position & np.uint64(7)).astype(np.uint8)
+            np.bitwise_or.at(bloom, position >> np.uint64(3), masks)
+
+
+class SeenIds:
+    """
+    Every ID of one entity type that was ever stored or queued. Supports `in`, add() and len(), plus what crawl_state
+    needs to journal it like a table (pending, apply, save, snapshot_size).
+    """
+
+    def __init__(self, entity):
+        self.entity = entity
+        self.name = f"seen_{entity}"
+        self.pairs = False
+        self.pending = []
+        self.new = set()        # IDs added since the last save
+        # Same lock as the compact tables, so another stage's save never removes files between the two reads
+        with compact_store.locked():
+            self.load(read_manifest(entity))
+
+    def load(self, manifest):
+        self.generation = manifest["generation"]
+        if self.generation:
+            self.ids = np.load(array_path(self.entity, self.generation, "ids"), mmap_mode="r")
+            self.bloom = np.load(array_path(self.entity, self.generation, "bloom"), mmap_mode="r")
+            self.capacity = manifest["capacity"]
+            self.bits = manifest["bits"]
+            self.hashes = manifest["hashes"]
+        else:
+            self.ids = np.array([], dtype="S22")
+            self.bloom = np.zeros(0, dtype=np.uint8)
+            self.capacity = self.bits = self.hashes = 0
+        self.saved = len(self.ids)
+        # Indexing a memoryview returns plain ints, which is several times faster than indexing the array
+        self.bloom_bytes = memoryview(self.bloom)
+
+    def __len__(self):
+        return self.saved + len(self.new)
+
+    def maybe_saved(self, raw):
+        """False if raw is certainly not among the saved IDs, according to the filter."""
+        h = id_hash(raw)
+        step = ((h >> 32) | (h << 32)) & MASK | 1
+        bloom = self.bloom_bytes
+        for i in range(self.hashes):
+            position = ((h + i * step) & MASK) % self.bits
+            if not bloom[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def is_saved(self, raw):
+        if not self.saved or not self.maybe_saved(raw):
+            return False
+        i = int(np.searchsorted(self.ids, raw))
+        return i < self.saved and self.ids[i] == raw
+
+    def __contains__(self, spotify_id):
+        return spotify_id in self.new or self.is_saved(spotify_id.encode())
+
+    def add(self, spotify_id):
+        if spotify_id not in self:
+            self.new.add(spotify_id)
+            self.pending.append(["add", spotify_id])
+
+    def apply(self, record):
+        # A crash between a save and the journal reset replays IDs that are already saved
+        if record[1] not in self:
+            self.new.add(record[1])
+
+    def import_ids(self, spotify_ids):
+        """Adds IDs without journaling them, for building a new index that is saved right after."""
+        for spotify_id in spotify_ids:
+            if spotify_id not in self:
+                self.new.add(spotify_id)
+
+    def save(self):
+        """Merges the new IDs into a new generation of the sorted IDs and the filter."""
+        with compact_store.locked():
+            self.write()
+
+    def write(self):
+        manifest = read_manifest(self.entity)
+        if manifest["generation"] != self.generation:
+            # Another stage saved this index since it was loaded here. Build on its generation
+            new = self.new
+            self.load(manifest)
+            self.new = {i for i in new if not self.is_saved(i.encode())}
+        if not self.new and self.generation:
+            return
+
+        new_ids = np.array(sorted(i.encode() for i in self.new), dtype=bytes)
+        width = max(self.ids.dtype.itemsize, new_ids.dtype.itemsize)
+        new_ids = new_ids.astype(f"S{width}")
+        old_ids = np.asarray(self.ids, dtype=f"S{width}")
+        all_ids = np.insert(old_ids, np.searchsorted(old_ids, new_ids), new_ids)
+
+        capacity, bits, hashes = self.capacity, self.bits, self.hashes
+        if len(all_ids) > capacity:
+            # Rebuilt with room to grow, so this only happens each time the index doubles
+            capacity = max(MIN_CAPACITY, 2 * len(all_ids))
+            bits, hashes = filter_size(capacity)
+            bloom = np.zeros(bits // 8, dtype=np.uint8)
+            set_bits(bloom, all_ids, bits, hashes)
+        else:
+            bloom = np.array(self.bloom)
+            set_bits(bloom, new_ids, bits, hashes)
+
+        generation = self.generation + 1
+        compact_store.atomic_save(array_path(self.entity, generation, "ids"), all_ids)
+        compact_store.atomic_save(array_path(self.entity, generation, "bloom"), bloom)
+        compact_store.atomic_save(manifest_path(self.entity), {
+            "generation": generation, "count": len(all_ids), "capacity": capacity, "bits": bits, "hashes": hashes,
+        })
+        sync_dir()
+        for path in glob.glob(f"{SEEN_DIR}/{self.entity}.*.npy"):
+            if not path.startswith(f"{SEEN_DIR}/{self.entity}.{generation}."):
+                os.remove(path)
+
+        self.load(read_manifest(self.entity))
+        self.new = set()
+
+    def snapshot_size(self):
+        if not self.generation:
+            return 0
+        return sum(os.path.getsize(array_path(self.entity, self.generation, c)) for c in ("ids", "bloom"))
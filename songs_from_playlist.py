@@ -3,13 +3,15 @@ This script takes in a Spotify playlist ID. It then creates and updates playlist
 the playlist and adds the songs to songs.json. It also updates song-artist, song-playlist, and song-album relationships.
 Finally, it creates artists_to_check.json and albums_to_check.json, containing a list of IDs that should be added to the database.
 """
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
-
-import json
-import time
+import argparse
+import asyncio
 import os
 
+import album_cache
+import crawl_state
+import metrics
+from crawler_engine import CrawlerEngine, make_client
+
 
 # Initialize globals
 playlists = {}
@@ -19,130 +21,92 @@ albums_to_check = set()
 song_album = {}
 song_artist = set()
 song_playlist = {}
+playlist_snapshots = {}
+seen_songs = set()
 
 DATA_DIR = "data"
 os.makedirs(f"{DATA_DIR}", exist_ok=True)
 
+PAGE_SIZE = 100     # Max number of items per sp.playlist_items page
+
 
 def load_data():
-    global playlists, songs, artists_to_check, albums_to_check, song_album, song_artist, song_playlist
+    global playlists, songs, artists_to_check, albums_to_check, song_album, song_artist, song_playlist, playlist_snapshots
+    global seen_songs
     # --------- ENTITIES ---------
     # Playlists - dict
-    try:
-        with open(f"{DATA_DIR}/playlists.json", "r") as f:
-            playlists = json.load(f)
-    except FileNotFoundError:
-        playlists = {}
+    playlists = crawl_state.load_dict("playlists")
 
     # Songs - dict
-    try:
-        with open(f"{DATA_DIR}/songs.json", "r") as f:
-            songs = json.load(f)
-    except FileNotFoundError:
-        songs = {}
-
-    # Artists To Check (populate attributes later) - set
-    try:
-        with open(f"{DATA_DIR}/artists_to_check.json", "r") as f:
-            artists_to_check = set(json.load(f))
-    except FileNotFoundError:
-        artists_to_check = set()
-
-    # Albums To Check (populate attributes later) - set
-    try:
-        with open(f"{DATA_DIR}/albums_to_check.json", "r") as f:
-            albums_to_check = set(json.load(f))
-    except FileNotFoundError:
-        albums_to_check = set()
+    songs = crawl_state.load_dict("songs")
+
+    # Artists To Check (populate attributes later) - frontier
+    artists_to_check = crawl_state.load_frontier("artists")
+
+    # Albums To Check (populate attributes later) - frontier
+    albums_to_check = crawl_state.load_frontier("albums")
 
     # ------- RELATIONSHIPS -------
     # Song - Album
-    try:
-        with open(f"{DATA_DIR}/song_album.json", "r") as f:
-            raw = json.load(f)
-            song_album = {tuple(k.split('|')) : v for k, v in raw.items()}
-    except FileNotFoundError:
-        song_album = {}
+    song_album = crawl_state.load_dict("song_album", pairs=True)
 
     # Song - Artist
-    try:
-        with open(f"{DATA_DIR}/song_artist.json", "r") as f:
-            raw = json.load(f)
-            song_artist = set(tuple(k.split('|')) for k in raw)
-    except FileNotFoundError:
-        song_artist = set()
+    song_artist = crawl_state.load_set("song_artist", pairs=True)
 
     # Song - Playlist
-    try:
-        with open(f"{DATA_DIR}/song_playlist.json", "r") as f:
-            raw = json.load(f)
-            song_playlist = {tuple(k.split('|')) : v for k, v in raw.items()}
-    except FileNotFoundError:
-        song_playlist = {}
+    song_playlist = crawl_state.load_dict("song_playlist", pairs=True)
+
+    # snapshot_id of every playlist as of its last complete crawl (for --incremental)
+    playlist_snapshots = crawl_state.load_dict("playlist_snapshots")
+
+    # ------- SEEN IDS -------
+    # Every song already stored or queued (see seen_ids.py). The frontiers keep their own
+    seen_songs = crawl_state.load_seen("songs")
+
+    # Album objects shared with process_albums.py
+    album_cache.load_cache()
 
 
 # ------- HELPER FUNCTIONS -------
 
 """
-Grabs the item objects associated with the playlist ID. This function handles
-rate limits from Spotify API and accumulates all entries across pagination
-Input: playlist_id, Spotify client credentials
+Grabs the item objects associated with the playlist ID. The first page tells us the
+total, then every remaining page is requested concurrently through the crawler engine,
+which handles rate limits from Spotify API. Entries keep their playlist order
+Input: playlist_id, crawler engine
 """
-def get_playlist_items(playlist_id, sp):
-    all_items = []
-    results = None
-    while True:
-        try:
-            if results is None:
-                results = sp.playlist_items(playlist_id, limit=100)
-            else:
-                if results.get("next"):
-                    results = sp.next(results)
-                else:
-                    break  # no more pages
-
-            all_items.extend(results["items"])
-            print(f"🔹 Fetched {len(all_items)} items so far...\n")
-
-        except spotipy.SpotifyException as e:
-            if e.http_status == 429:
-                retry_after = int(e.headers.get('Retry-After', 1))
-                print(f"❌ Rate limit hit. Retrying after {retry_after} seconds.\n")
-                time.sleep(retry_after)
-                print(f"Retrying...\n")
-            else:
-                raise
+async def get_playlist_items(playlist_id, engine):
+    first = await engine.call("playlist_items", playlist_id, limit=PAGE_SIZE)
+    offsets = range(PAGE_SIZE, first["total"], PAGE_SIZE)
+    pages = await asyncio.gather(*(
+        engine.call("playlist_items", playlist_id, limit=PAGE_SIZE, offset=offset) for offset in offsets
+    ))
+
+    all_items = list(first["items"])
+    for page in pages:
+        all_items.extend(page["items"])
+    print(f"🔹 Fetched {len(all_items)} items in {len(pages) + 1} pages\n")
     return all_items
 
 """
 This function takes in track information and looks up its associated album ID.
-It then makes another API call to check if the album is actually a single or a
-compilation. If it is one of the two, it is not an album, and we do not add it to 
-albums_to_check or song_album.
+It then checks the album cache (fetching the album if it was never seen) to see if 
+the album is actually a single or a compilation. If it is one of the two, it is not 
+an album, and we do not add it to albums_to_check or song_album.
 """
-def process_track_album(track, sp):
+async def process_track_album(track, engine):
     song_id = track["id"]
     album_id = track["album"]["id"]
 
     # Look up if album is an "album", "single", or "compilation". If not an album, skip
-    while True:
-        try:
-            album = sp.album(album_id)
-            break
-        except spotipy.SpotifyException as e:
-            if e.http_status == 429:
-                retry_after = int(e.headers.get("Retry-After", 1))
-                print(f"❌ Rate limit hit. Retrying after {retry_after} seconds.\n")
-                time.sleep(retry_after)
-            else:
-                raise
-    if album.get("album_type") in ["single", "compilation"]:
+    album = await album_cache.get_album(album_id, engine)
+    if album is None or album.get("album_type") in ["single", "compilation"]:
         # Album is actually a single or compilation. Do not include this in the relationship
         return
     
     else:
-        if album_id not in albums_to_check:
-            albums_to_check.add(album_id)
+        # Albums processed before are not queued again
+        albums_to_check.discover(album_id, depth=1, popularity=album.get("popularity"))
         if (song_id, album_id) not in song_album:
             song_album[(song_id, album_id)] = {
                 "trackNumber": track["track_number"]
@@ -152,7 +116,7 @@ def process_track_album(track, sp):
 Saves all necessary attributes for Song entity, along with all of its relationships.
 Relationships include song_artist, song_album, song_playlist
 """
-def save_song(track, sp):
+async def save_song(track, engine):
     song_id = track["id"]
     # Attributes
     if song_id not in songs:
@@ -163,63 +127,71 @@ def save_song(track, sp):
             "popularity": track.get("popularity", None),
             "artURL": track["album"]["images"][0]["url"] if track["album"].get("images") else None
         }
+        seen_songs.add(song_id)
     # Relationships
     # Albums
-    process_track_album(track, sp)
+    await process_track_album(track, engine)
     # Artists
     for artist in track["artists"]:
         artist_id = artist["id"]
-        if artist_id not in artists_to_check:
-            artists_to_check.add(artist_id)
+        artists_to_check.discover(artist_id, depth=1, popularity=track.get("popularity"))
         if (song_id, artist_id) not in song_artist:
             song_artist.add((song_id, artist_id))
     # Playlist - handled in main loop
 
 """
-Checkpoint data in case of rate limits or other errors
+Checkpoint data in case of rate limits or other errors. Only changes since the last
+checkpoint are written (see crawl_state.py)
 """
 def checkpoint():
     print(f"✅ Checkpointing...")
+    written = crawl_state.checkpoint()
+    print(f"💾 Checkpoint: {len(songs)} songs, {len(song_artist)} song-artist relations, {len(song_playlist)} items saved ({written} records written)\n")
 
-    # Playlists
-    with open(f"{DATA_DIR}/playlists.json", "w") as f:
-        json.dump(playlists, f)
-    # Songs
-    with open(f"{DATA_DIR}/songs.json", "w") as f:
-        json.dump(songs, f)
-    # Artists
-    with open(f"{DATA_DIR}/artists_to_check.json", "w") as f:
-        json.dump(list(artists_to_check), f)
-    # Albums
-    with open(f"{DATA_DIR}/albums_to_check.json", "w") as f:
-        json.dump(list(albums_to_check), f)
-    
-    # Relationships
-    # Require flattening tuple keys, must reshape later
-    # Song-Album
-    with open(f"{DATA_DIR}/song_album.json", "w") as f:
-        json.dump({ f"{k[0]}|{k[1]}":v for k, v in song_album.items() }, f)
-    # Song-Artist
-    with open(f"{DATA_DIR}/song_artist.json", "w") as f:
-        json.dump([f"{k[0]}|{k[1]}" for k in song_artist], f)
-    # Song-Playlist
-    with open(f"{DATA_DIR}/song_playlist.json", "w") as f:
-        json.dump({ f"{k[0]}|{k[1]}":v for k, v in song_playlist.items() }, f)
-    
-    print(f"💾 Checkpoint: {len(songs)} songs, {len(song_artist)} song-artist relations, {len(song_playlist)} items saved\n")
 
 
 
+"""
+Drops song - playlist relationships for tracks that are no longer on the playlist.
+Only needed in incremental mode, where existing entries are kept instead of re-crawled
+"""
+def remove_stale_songs(playlist_id, playlist_items):
+    current = {item["track"]["id"] for item in playlist_items if item["track"]}
+    stale = [k for k in song_playlist if k[1] == playlist_id and k[0] not in current]
+    for k in stale:
+        del song_playlist[k]
+    if stale:
+        print(f"🗑️ Removed {len(stale)} songs no longer on the playlist")
 
-# ------- MAIN -------
-def main():
-    # Log in to Spotify
-    auth_manager = SpotifyClientCredentials()
-    sp = spotipy.Spotify(auth_manager=auth_manager)
-    
-    # Load saved JSONs
-    load_data()
 
+"""
+Rewrites songOrder of the song - playlist relationships kept from an earlier crawl, so they match the
+current playlist positions (a track listed twice keeps its first position). Only needed in incremental mode,
+where the loop in crawl() only saves new tracks
+"""
+def update_song_order(playlist_id, playlist_items):
+    positions = {}
+    for song_index, item in enumerate(playlist_items, start=1):
+        if item["track"]:
+            positions.setdefault(item["track"]["id"], song_index)
+    moved = 0
+    for song_id, song_index in positions.items():
+        entry = song_playlist.get((song_id, playlist_id))
+        if entry is not None and entry["songOrder"] != song_index:
+            song_playlist[(song_id, playlist_id)] = {**entry, "songOrder": song_index}
+            moved += 1
+    if moved:
+        print(f"🔀 Updated the position of {moved} songs")
+
+
+# ------- MAIN -------
+"""
+Crawls every playlist in spotify_ids. With incremental=True, playlists whose snapshot_id has not
+changed since their last complete crawl are skipped, and changed playlists only process tracks
+that are not in song_playlist yet. progress, if given, is called after every checkpoint, so stages
+running alongside (see pipeline.py) can start on the albums and artists found so far
+"""
+async def crawl(engine, incremental=False, progress=None):
     # Playlists information
     spotify_ids = {
         "Billboard Top 100": "6UeSakyzhiEt4NB3UAd6NQ",
@@ -230,7 +202,11 @@ def main():
     for playlist_name, playlist_id in spotify_ids.items():
         
         print(f"Fetching playlist: {playlist_name}")
-        playlist_info = sp.playlist(playlist_id)
+        playlist_info = await engine.call("playlist", playlist_id, fields="snapshot_id,images")
+
+        if incremental and playlist_snapshots.get(playlist_id) == playlist_info["snapshot_id"]:
+            print(f"⏩ {playlist_name} unchanged since last crawl. Skipping...\n")
+            continue
 
         # Populate playlist basic information
         if playlist_id not in playlists:
@@ -240,12 +216,22 @@ def main():
             }
 
         # Iterating through songs in playlist
-        playlist_items = get_playlist_items(playlist_id, sp)
+        playlist_items = await get_playlist_items(playlist_id, engine)
+        if incremental:
+            remove_stale_songs(playlist_id, playlist_items)
+            update_song_order(playlist_id, playlist_items)
+
+        # Only new tracks need processing in incremental mode. Positions still count every item
+        positions = [
+            (song_index, item) for song_index, item in enumerate(playlist_items, start=1)
+            if item["track"] and not (incremental and (item["track"]["id"], playlist_id) in song_playlist)
+        ]
+        # Fetch every album on the playlist up front, 20 per request, so save_song hits the cache
+        album_ids = [item["track"]["album"]["id"] for _, item in positions if item["track"].get("album", {}).get("id")]
+        await album_cache.get_albums(album_ids, engine)
         try:
-            for song_index, item in enumerate(playlist_items, start=1):             # item contains track, along with position info relative to playlist
+            for song_index, item in positions:             # item contains track, along with position info relative to playlist
                 track = item["track"]               # Track info
-                if not track:
-                    continue
 
                 # Song-Playlist relationship
                 if (track["id"], playlist_id) not in song_playlist:
@@ -254,19 +240,43 @@ def main():
                         "songOrder": song_index
                     } 
                 # Song Entity and Other Relationships   
-                save_song(track, sp)
+                await save_song(track, engine)
+                metrics.processed("playlists", 1)
 
                 # Checkpointing
                 if song_index % 50 == 0:
                     checkpoint()
-
-                song_index += 1
+                    if progress:
+                        progress()
         except Exception as e:
             print(f"⚠️ Error occurred: {e}\n")
             checkpoint()
+            if progress:
+                progress()
+            continue
 
+        # Only a complete crawl lets the next incremental run skip this snapshot
+        playlist_snapshots[playlist_id] = playlist_info["snapshot_id"]
         checkpoint()
+        if progress:
+            progress()
         print(f"✅ Successfully saved all playlists from {playlist_name}. Saved {len(songs)} songs total\n")
 
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl the seed playlists")
+    parser.add_argument("--incremental", action="store_true",
+                        help="skip playlists whose snapshot_id is unchanged and only process new tracks")
+    args = parser.parse_args()
+
+    # Log in to Spotify
+    sp = make_client()
+    
+    # Load saved JSONs
+    load_data()
+
+    asyncio.run(crawl(CrawlerEngine(sp), args.incremental))
+    crawl_state.close()
+
 if __name__ == "__main__":
     main()
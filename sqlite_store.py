@@ -0,0 +1,303 @@
+"""
+SQLite-backed crawl state, used instead of the JSON snapshots and journals when CRAWL_STORE=sqlite. Every crawl table
+lives in data/crawl_state.sqlite, in a table named after its schema.sql counterpart with the same ID columns, plus an
+index on the second ID of each relationship. SqliteDict and SqliteSet answer `in`, lookups, `len` and updates
+straight from the database, so memory stays flat as the catalog grows and nothing is loaded at startup.
+Changes are committed at each checkpoint, in one transaction. Items leased from a *_to_check set (see
+SqliteSet.lease) are put back into the committed state until they are acknowledged.
+
+The first time a table is opened, any existing data/<table>.json snapshot and journal are imported into it.
+create_tsv.py still reads .json snapshots, so export them after a crawl with
+    python sqlite_store.py export
+"""
+from collections.abc import MutableMapping, MutableSet
+import json
+import os
+import sqlite3
+import threading
+
+DATA_DIR = "data"
+DB_PATH = f"{DATA_DIR}/crawl_state.sqlite"
+os.makedirs(f"{DATA_DIR}", exist_ok=True)
+
+# crawl table -> (SQLite table, ID columns in crawl key order)
+TABLES = {
+    "songs": ("Songs", ["SongID"]),
+    "albums": ("Albums", ["AlbumID"]),
+    "artists": ("Artists", ["ArtistID"]),
+    "genres": ("Genres", ["GenreName"]),
+    "playlists": ("Playlists", ["PlaylistID"]),
+    "song_artist": ("Performs", ["SongID", "ArtistID"]),
+    "song_album": ("InAlbum", ["SongID", "AlbumID"]),
+    "song_playlist": ("InPlaylist", ["SongID", "PlaylistID"]),
+    "artist_genre": ("IsGenre", ["ArtistID", "GenreName"]),
+    "songs_to_check": ("SongsToCheck", ["SongID"]),
+    "albums_to_check": ("AlbumsToCheck", ["AlbumID"]),
+    "artists_to_check": ("ArtistsToCheck", ["ArtistID"]),
+    "album_cache": ("AlbumCache", ["AlbumID"]),
+}
+
+connection = None
+lock = threading.Lock()
+committed_changes = 0
+
+# Every open SqliteSet, for commit() to restore their leased items
+leasing = []
+
+
+def connect():
+    global connection
+    if connection is None:
+        connection = sqlite3.connect(DB_PATH, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+def table_spec(name, pairs):
+    if name in TABLES:
+        return TABLES[name]
+    return (name, ["ID1", "ID2"] if pairs else ["ID"])
+
+
+def table_exists(sql_name):
+    row = connect().execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (sql_name,)).fetchone()
+    return row is not None
+
+
+"""
+Creates the table (and the reverse-lookup index for relationships) if needed.
+Returns True if the table did not exist before.
+"""
+def create_table(sql_name, columns, with_value):
+    db = connect()
+    if table_exists(sql_name):
+        return False
+
+    column_defs = ", ".join(f"{c} TEXT NOT NULL" for c in columns)
+    value_def = ", Attributes TEXT" if with_value else ""
+    db.execute(f'CREATE TABLE "{sql_name}" ({column_defs}{value_def}, PRIMARY KEY ({", ".join(columns)})) WITHOUT ROWID')
+    if len(columns) == 2:
+        db.execute(f'CREATE INDEX "{sql_name}_{columns[1]}" ON "{sql_name}" ({columns[1]})')
+    return True
+
+
+class SqliteTable:
+    """Shared plumbing for SqliteDict and SqliteSet. Keys are IDs, or (id, id) tuples for relationships."""
+
+    def __init__(self, name, pairs, with_value):
+        self.name = name
+        self.pairs = pairs
+        self.sql_name, self.columns = table_spec(name, pairs)
+        with lock:
+            self.created = create_table(self.sql_name, self.columns, with_value)
+            self.count = connect().execute(f'SELECT COUNT(*) FROM "{self.sql_name}"').fetchone()[0]
+        self.where = " AND ".join(f"{c} = ?" for c in self.columns)
+        self.key_list = ", ".join(self.columns)
+
+    def params(self, key):
+        return key if self.pairs else (key,)
+
+    def to_key(self, row):
+        return tuple(row[:2]) if self.pairs else row[0]
+
+    def __contains__(self, key):
+        if self.pairs and not isinstance(key, tuple):
+            return False
+        with lock:
+            row = connect().execute(f'SELECT 1 FROM "{self.sql_name}" WHERE {self.where}', self.params(key)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        with lock:
+            rows = connect().execute(f'SELECT {self.key_list} FROM "{self.sql_name}"').fetchall()
+        return (self.to_key(row) for row in rows)
+
+    def delete(self, key):
+        with lock:
+            deleted = connect().execute(f'DELETE FROM "{self.sql_name}" WHERE {self.where}', self.params(key)).rowcount
+        self.count -= deleted
+        return deleted
+
+
+class SqliteDict(SqliteTable, MutableMapping):
+    """dict-like view of an entity or relationship table. Values are stored as JSON in the Attributes column."""
+
+    def __init__(self, name, pairs=False):
+        super().__init__(name, pairs, with_value=True)
+
+    def __getitem__(self, key):
+        with lock:
+            row = connect().execute(f'SELECT Attributes FROM "{self.sql_name}" WHERE {self.where}', self.params(key)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def __setitem__(self, key, value):
+        placeholders = ", ".join("?" for _ in self.columns)
+        with lock:
+            db = connect()
+            existed = db.execute(f'SELECT 1 FROM "{self.sql_name}" WHERE {self.where}', self.params(key)).fetchone()
+            db.execute(
+                f'INSERT OR REPLACE INTO "{self.sql_name}" ({self.key_list}, Attributes) VALUES ({placeholders}, ?)',
+                (*self.params(key), json.dumps(value))
+            )
+        if not existed:
+            self.count += 1
+
+    def __delitem__(self, key):
+        if not self.delete(key):
+            raise KeyError(key)
+
+    def items(self):
+        with lock:
+            rows = connect().execute(f'SELECT {self.key_list}, Attributes FROM "{self.sql_name}"').fetchall()
+        return [(self.to_key(row), json.loads(row[-1])) for row in rows]
+
+    def import_rows(self, items):
+        placeholders = ", ".join("?" for _ in self.columns)
+        with lock:
+            connect().executemany(
+                f'INSERT OR REPLACE INTO "{self.sql_name}" ({self.key_list}, Attributes) VALUES ({placeholders}, ?)',
+                ((*self.params(k), json.dumps(v)) for k, v in items)
+            )
+            self.count = connect().execute(f'SELECT COUNT(*) FROM "{self.sql_name}"').fetchone()[0]
+
+
+class SqliteSet(SqliteTable, MutableSet):
+    """set-like view of a *_to_check frontier, genres, or a relationship without attributes."""
+
+    def __init__(self, name, pairs=False):
+        super().__init__(name, pairs, with_value=False)
+        self.leased = set()
+        leasing.append(self)
+
+    def add(self, key):
+        placeholders = ", ".join("?" for _ in self.columns)
+        with lock:
+            added = connect().execute(
+                f'INSERT OR IGNORE INTO "{self.sql_name}" ({self.key_list}) VALUES ({placeholders})', self.params(key)
+            ).rowcount
+        self.count += added
+
+    def discard(self, key):
+        self.delete(key)
+
+    def pop(self):
+        with lock:
+            row = connect().execute(f'SELECT {self.key_list} FROM "{self.sql_name}" LIMIT 1').fetchone()
+        if row is None:
+            raise KeyError("pop from an empty set")
+        key = self.to_key(row)
+        self.delete(key)
+        return key
+
+    def lease(self, n):
+        """Takes up to n items out of the set. They stay in the committed table until ack()."""
+        with lock:
+            rows = connect().execute(f'SELECT {self.key_list} FROM "{self.sql_name}" LIMIT ?', (n,)).fetchall()
+        return self.lease_keys([self.to_key(row) for row in rows])
+
+    def lease_keys(self, keys):
+        """Leases the given items, which must be in the set. Used by frontier.Frontier to lease in priority order."""
+        for key in keys:
+            self.delete(key)
+        self.leased.update(keys)
+        return keys
+
+    def ack(self, keys):
+        """Marks leased items as done. The next commit no longer restores them."""
+        self.leased.difference_update(keys)
+
+    def release(self, keys):
+        """Returns leased items to the set unprocessed."""
+        for key in keys:
+            if key in self.leased:
+                self.leased.discard(key)
+                self.add(key)
+
+    # Called by commit() with the lock held
+    def restore_leased(self):
+        placeholders = ", ".join("?" for _ in self.columns)
+        restored = []
+        for key in self.leased:
+            inserted = connection.execute(
+                f'INSERT OR IGNORE INTO "{self.sql_name}" ({self.key_list}) VALUES ({placeholders})', self.params(key)
+            ).rowcount
+            if inserted:
+                restored.append(key)
+        return restored
+
+    # Called by commit() with the lock held. Only removes rows restore_leased() inserted, not rows added meanwhile
+    def delete_rows(self, keys):
+        for key in keys:
+            connection.execute(f'DELETE FROM "{self.sql_name}" WHERE {self.where}', self.params(key))
+
+    def import_rows(self, keys):
+        placeholders = ", ".join("?" for _ in self.columns)
+        with lock:
+            connect().executemany(
+                f'INSERT OR IGNORE INTO "{self.sql_name}" ({self.key_list}) VALUES ({placeholders})',
+                (self.params(k) for k in keys)
+            )
+            self.count = connect().execute(f'SELECT COUNT(*) FROM "{self.sql_name}"').fetchone()[0]
+
+
+"""
+Commits everything changed since the last checkpoint. Returns the number of rows changed.
+"""
+def commit():
+    global committed_changes
+    with lock:
+        db = connect()
+        changes = db.total_changes - committed_changes
+        # Leased rows are deleted in the open transaction. Commit them as still queued, then take them out again
+        restored = [(table, table.restore_leased()) for table in leasing]
+        db.commit()
+        for table, keys in restored:
+            table.delete_rows(keys)
+        committed_changes = db.total_changes
+    return changes
+
+
+"""
+(crawl table, SQLite table) of every table in the database. Tables not listed in TABLES (playlist_snapshots, the
+*_frontier signals, ...) are named after their crawl table
+"""
+def stored_tables():
+    crawl_names = {sql_name: name for name, (sql_name, _) in TABLES.items()}
+    rows = connect().execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name").fetchall()
+    return [(crawl_names.get(sql_name, sql_name), sql_name) for sql_name, in rows]
+
+
+"""
+Writes every SQLite table back out as a data/<table>.json snapshot (the format create_tsv.py reads)
+and clears its journal.
+"""
+def export_json():
+    import crawl_state
+
+    for name, sql_name in stored_tables():
+        columns = [r[1] for r in connect().execute(f'PRAGMA table_info("{sql_name}")')]
+        has_value = "Attributes" in columns
+        pairs = len(columns) - has_value == 2
+        table = SqliteDict(name, pairs) if has_value else SqliteSet(name, pairs)
+        if has_value:
+            snapshot = {crawl_state.encode_key(k): v for k, v in table.items()}
+        else:
+            snapshot = [crawl_state.encode_key(k) for k in table]
+        crawl_state.write_snapshot(name, snapshot)
+        open(crawl_state.journal_path(name), "w").close()
+        print(f"✅ Exported {len(table)} rows from {sql_name} to {crawl_state.snapshot_path(name)}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] == ["export"]:
+        export_json()
+    else:
+        print("Usage: python sqlite_store.py export")
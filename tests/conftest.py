@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Runs a test in an empty working directory with the crawl's data/ layout and no tables loaded."""
+    import compact_store
+    import crawl_state
+
+    monkeypatch.chdir(tmp_path)
+    for path in ["data/journal", "data/compact", "data/seen"]:
+        os.makedirs(path)
+    monkeypatch.setattr(crawl_state, "BACKEND", "json")
+    monkeypatch.setattr(crawl_state, "tables", {})
+    monkeypatch.setattr(crawl_state, "frontiers", {})
+    monkeypatch.setattr(compact_store, "ids", None)
+    return tmp_path
@@ -0,0 +1,104 @@
+import glob
+import multiprocessing
+import random
+
+import compact_store
+
+
+def reopen():
+    """Forgets the loaded ID table, like a new process would."""
+    compact_store.ids = None
+
+
+def test_tables_round_trip(data_dir):
+    song_album = compact_store.CompactDict("song_album")
+    song_album[("s1", "al1")] = {"trackNumber": 3}
+    song_album[("s2", "al1")] = {"trackNumber": None}
+    song_album.save()
+    song_album[("s3", "al2")] = {"trackNumber": 1}
+    del song_album[("s1", "al1")]
+    song_album.save()
+
+    reopen()
+    song_album = compact_store.CompactDict("song_album")
+    assert dict(song_album.items()) == {("s2", "al1"): {"trackNumber": None}, ("s3", "al2"): {"trackNumber": 1}}
+    # Only the current generation is left on disk
+    assert len(glob.glob("data/compact/song_album.*.npy")) == 2
+
+
+def test_entity_dict_round_trip(data_dir):
+    songs = compact_store.EntityDict("songs")
+    songs["b"] = {"songTitle": "B"}
+    songs["a"] = {"songTitle": "A"}
+    songs.save()
+    songs["c"] = {"songTitle": "C"}
+    songs["a"] = {"songTitle": "A2"}
+    songs.save()
+
+    songs = compact_store.EntityDict("songs")
+    assert songs.snapshot() == {"a": {"songTitle": "A2"}, "b": {"songTitle": "B"}, "c": {"songTitle": "C"}}
+
+
+def save_pairs(pairs):
+    reopen()
+    song_artist = compact_store.CompactSet("song_artist")
+    for pair in pairs:
+        song_artist.add(pair)
+    song_artist.save()
+
+
+def test_save_rebases_on_generation_saved_by_another_process(data_dir):
+    song_artist = compact_store.CompactSet("song_artist")
+    song_artist.add(("s1", "a1"))
+    song_artist.add(("s2", "a2"))
+
+    # Another process interns its own IDs at the same indexes, and saves first
+    process = multiprocessing.get_context("fork").Process(target=save_pairs, args=([("s3", "a3"), ("s2", "a4")],))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+
+    song_artist.save()
+    assert set(song_artist) == {("s1", "a1"), ("s2", "a2"), ("s3", "a3"), ("s2", "a4")}
+
+    reopen()
+    ids = compact_store.id_table()
+    assert len(ids) == len(set(ids.ids.tolist())) == 7
+    assert set(compact_store.CompactSet("song_artist")) == {("s1", "a1"), ("s2", "a2"), ("s3", "a3"), ("s2", "a4")}
+
+
+def save_rounds(seed, rounds, results):
+    reopen()
+    rng = random.Random(seed)
+    song_artist = compact_store.CompactSet("song_artist")
+    songs = compact_store.EntityDict("songs")
+    added = set()
+    for _ in range(rounds):
+        for _ in range(20):
+            pair = (f"s{rng.randrange(200)}", f"a{rng.randrange(200)}")
+            song_artist.add(pair)
+            songs[pair[0]] = {"by": seed}
+            added.add(pair)
+        song_artist.save()
+        songs.save()
+    results.put(added)
+
+
+def test_concurrent_saves_keep_every_change(data_dir):
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    processes = [context.Process(target=save_rounds, args=(seed, 10, results)) for seed in range(4)]
+    for process in processes:
+        process.start()
+    added = set()
+    for _ in processes:
+        added |= results.get(timeout=120)
+    for process in processes:
+        process.join()
+    assert all(process.exitcode == 0 for process in processes)
+
+    reopen()
+    assert set(compact_store.CompactSet("song_artist")) == added
+    assert set(compact_store.EntityDict("songs")) == {song for song, _ in added}
+    ids = compact_store.id_table()
+    assert len(ids) == len(set(ids.ids.tolist()))
@@ -0,0 +1,148 @@
+import json
+import os
+
+import crawl_state
+
+
+def restart():
+    """Forgets every loaded table, like a new process would."""
+    crawl_state.tables.clear()
+    crawl_state.frontiers.clear()
+
+
+def test_journal_replays_after_restart(data_dir):
+    songs = crawl_state.load_dict("songs")
+    songs["a"] = {"songTitle": "A"}
+    songs["b"] = {"songTitle": "B"}
+    crawl_state.checkpoint()
+    del songs["a"]
+    crawl_state.checkpoint()
+
+    restart()
+    assert crawl_state.load_dict("songs") == {"b": {"songTitle": "B"}}
+
+
+def test_truncated_journal_line_is_dropped(data_dir):
+    songs = crawl_state.load_dict("songs")
+    songs["a"] = 1
+    songs["b"] = 2
+    crawl_state.checkpoint()
+    # A crash in the middle of a write leaves a partial last line
+    with open(crawl_state.journal_path("songs"), "a") as f:
+        f.write('["put", "c", {"songTi')
+
+    restart()
+    songs = crawl_state.load_dict("songs")
+    assert songs == {"a": 1, "b": 2}
+
+    # The partial line was cut off, so records written after it still replay
+    songs["d"] = 4
+    crawl_state.checkpoint()
+    restart()
+    assert crawl_state.load_dict("songs") == {"a": 1, "b": 2, "d": 4}
+
+
+def test_pair_keys_round_trip(data_dir):
+    song_artist = crawl_state.load_set("song_artist", pairs=True)
+    song_artist.add(("s1", "a1"))
+    crawl_state.close()
+
+    restart()
+    assert crawl_state.load_set("song_artist", pairs=True) == {("s1", "a1")}
+    with open(crawl_state.snapshot_path("song_artist")) as f:
+        assert json.load(f) == ["s1|a1"]
+
+
+def test_compaction_writes_snapshot_and_empties_journal(data_dir):
+    songs = crawl_state.load_dict("songs")
+    for i in range(10):
+        songs[str(i)] = i
+    crawl_state.close()
+
+    assert os.path.getsize(crawl_state.journal_path("songs")) == 0
+    assert not os.path.exists(f"{crawl_state.snapshot_path('songs')}.tmp")
+    with open(crawl_state.snapshot_path("songs")) as f:
+        assert json.load(f) == {str(i): i for i in range(10)}
+
+
+def test_old_journal_replayed_onto_new_snapshot_gives_same_table(data_dir):
+    songs = crawl_state.load_dict("songs")
+    songs["a"] = 1
+    songs["b"] = 2
+    del songs["a"]
+    crawl_state.checkpoint()
+    with open(crawl_state.journal_path("songs")) as f:
+        journal = f.read()
+    crawl_state.close()
+
+    # A crash between writing the snapshot and emptying the journal
+    with open(crawl_state.journal_path("songs"), "w") as f:
+        f.write(journal)
+    restart()
+    assert crawl_state.load_dict("songs") == {"b": 2}
+
+
+def test_unacknowledged_lease_is_redelivered_after_crash(data_dir):
+    queue = crawl_state.load_set("albums_to_check")
+    for album_id in ["a", "b", "c", "d"]:
+        queue.add(album_id)
+    crawl_state.checkpoint()
+
+    leased = queue.lease(3)
+    assert len(leased) == 3 and len(queue) == 1
+    queue.ack(leased[:1])
+    crawl_state.checkpoint()
+
+    restart()
+    queue = crawl_state.load_set("albums_to_check")
+    assert queue == {"a", "b", "c", "d"} - set(leased[:1])
+
+
+def test_leased_items_stay_in_snapshot_until_acknowledged(data_dir):
+    queue = crawl_state.load_set("albums_to_check")
+    queue.add("a")
+    queue.add("b")
+    leased = queue.lease(2)
+    crawl_state.compact(queue)
+
+    restart()
+    assert crawl_state.load_set("albums_to_check") == set(leased)
+
+
+def test_release_returns_items(data_dir):
+    queue = crawl_state.load_set("albums_to_check")
+    queue.add("a")
+    leased = queue.lease(1)
+    queue.release(leased)
+    assert queue == {"a"} and not queue.leased
+
+
+def test_item_added_again_while_leased_stays_queued(data_dir):
+    queue = crawl_state.load_set("albums_to_check")
+    queue.add("a")
+    crawl_state.checkpoint()
+    leased = queue.lease(1)
+    queue.add("a")
+    queue.ack(leased)
+    crawl_state.checkpoint()
+
+    restart()
+    assert crawl_state.load_set("albums_to_check") == {"a"}
+
+
+def test_queue_journal_is_written_after_results(data_dir, monkeypatch):
+    songs = crawl_state.load_dict("songs")
+    queue = crawl_state.load_set("songs_to_check")
+    queue.add("a")
+    crawl_state.checkpoint()
+    queue.ack(queue.lease(1))
+    songs["a"] = 1
+
+    order = []
+    real_open = open
+    def recording_open(path, *args, **kwargs):
+        order.append(os.path.basename(path))
+        return real_open(path, *args, **kwargs)
+    monkeypatch.setattr("builtins.open", recording_open)
+    crawl_state.checkpoint()
+    assert order.index("songs.jsonl") < order.index("songs_to_check.jsonl")
@@ -0,0 +1,61 @@
+import pytest
+
+import crawl_state
+import frontier
+
+
+def make_frontier(data_dir, priority="depth"):
+    return frontier.Frontier(crawl_state.JournaledSet("albums_to_check"), set(), {}, priority)
+
+
+def test_depth_first_then_references_then_id(data_dir):
+    albums = make_frontier(data_dir)
+    albums.discover("c", depth=2)
+    albums.discover("b", depth=1)
+    albums.discover("a", depth=1)
+    albums.discover("d", depth=1)
+    albums.discover("d", depth=3)       # Found again: one more reference, keeps the smaller depth
+
+    assert albums.lease(4) == ["d", "a", "b", "c"]
+
+
+def test_references_order(data_dir):
+    albums = make_frontier(data_dir, "references")
+    albums.discover("a", depth=1)
+    albums.discover("b", depth=2)
+    albums.discover("b", depth=2)
+
+    assert albums.lease(2) == ["b", "a"]
+
+
+def test_popularity_order(data_dir):
+    albums = make_frontier(data_dir, "popularity")
+    albums.discover("a", depth=1, popularity=10)
+    albums.discover("b", depth=1)
+    albums.discover("c", depth=2, popularity=90)
+
+    assert albums.lease(3) == ["c", "a", "b"]
+
+
+def test_seen_items_are_not_queued_again(data_dir):
+    albums = make_frontier(data_dir)
+    albums.discover("a", depth=1)
+    albums.ack(albums.lease(1))
+    albums.discover("a", depth=1)
+
+    assert len(albums) == 0 and "a" not in albums.signals
+
+
+def test_released_items_are_leased_again_in_order(data_dir):
+    albums = make_frontier(data_dir)
+    albums.discover("a", depth=1)
+    albums.discover("b", depth=2)
+    leased = albums.lease(2)
+    albums.release(leased)
+
+    assert albums.lease(1) == ["a"]
+
+
+def test_unknown_priority_is_rejected(data_dir):
+    with pytest.raises(ValueError):
+        make_frontier(data_dir, "alphabetical")
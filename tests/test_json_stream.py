@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+import json_stream
+
+DOCUMENT = {
+    "a|b": {"trackNumber": 12345, "popularity": -7, "score": 1.5e-07, "big": 123456789012345678},
+    "c": [1, 2.25, -0.5, 1E+10, True, None, "x, y: {z}"],
+    "é\\\"": {"nested": {"deeper": [0, 10, 100]}},
+    "last": 9,
+}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 64])
+def test_object_matches_json_load_at_any_chunk_size(tmp_path, chunk_size):
+    path = tmp_path / "doc.json"
+    path.write_text(json.dumps(DOCUMENT, indent=1))
+
+    assert dict(json_stream.iter_json(str(path), chunk_size)) == DOCUMENT
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 4])
+def test_numbers_split_across_reads(tmp_path, chunk_size):
+    values = [123456, 1.5e-07, -98.75, 42, 3e5, 0]
+    path = tmp_path / "numbers.json"
+    path.write_text(json.dumps(values, separators=(",", ":")))
+
+    assert list(json_stream.iter_json(str(path), chunk_size)) == values
+
+
+def test_number_at_end_of_file(tmp_path):
+    path = tmp_path / "numbers.json"
+    path.write_text("[1, 22, 333]")
+
+    assert list(json_stream.iter_json(str(path), 2)) == [1, 22, 333]
+
+
+def test_empty_containers(tmp_path):
+    (tmp_path / "object.json").write_text("{ }")
+    (tmp_path / "array.json").write_text("[]")
+
+    assert list(json_stream.iter_json(str(tmp_path / "object.json"))) == []
+    assert list(json_stream.iter_json(str(tmp_path / "array.json"))) == []
+
+
+def test_not_a_container(tmp_path):
+    path = tmp_path / "scalar.json"
+    path.write_text("42")
+
+    with pytest.raises(ValueError):
+        list(json_stream.iter_json(str(path)))
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("spotipy")
+
+import crawl_state
+import pipeline
+import process_albums
+import process_artists
+import remaining_songs
+import songs_from_playlist
+from crawler_engine import CrawlerEngine
+
+TRACKS_PER_PLAYLIST = 60
+
+
+class FakeSpotify:
+    """Answers the calls songs_from_playlist.crawl makes, with a different album for every track."""
+
+    def playlist(self, playlist_id, fields=None):
+        return {"snapshot_id": f"{playlist_id}-1", "images": []}
+
+    def playlist_items(self, playlist_id, limit=100, offset=0):
+        items = [{
+            "added_at": "2024-01-01T00:00:00Z",
+            "track": {
+                "id": f"{playlist_id}-s{i}", "name": "Song", "duration_ms": 1000, "track_number": 1, "popularity": 1,
+                "album": {"id": f"{playlist_id}-al{i}", "release_date": "2024", "images": []},
+                "artists": [{"id": f"{playlist_id}-a{i}"}],
+            },
+        } for i in range(offset, min(offset + limit, TRACKS_PER_PLAYLIST))]
+        return {"total": TRACKS_PER_PLAYLIST, "items": items}
+
+    def albums(self, album_ids):
+        return {"albums": [{"id": album_id, "album_type": "album", "popularity": 1} for album_id in album_ids]}
+
+
+def test_album_batches_start_before_the_playlists_finish(data_dir, monkeypatch):
+    for name in ["albums_to_check", "songs_to_check", "artists_to_check"]:
+        crawl_state.load_set(name)
+    for stage in [songs_from_playlist, process_albums, remaining_songs, process_artists]:
+        stage.load_data()
+
+    playlists_running = True
+    album_batches = []
+
+    crawl = songs_from_playlist.crawl
+    async def tracked_crawl(*args):
+        nonlocal playlists_running
+        await crawl(*args)
+        playlists_running = False
+
+    async def process_album_batch(album_ids, engine):
+        album_batches.append(playlists_running)
+        return len(album_ids)
+
+    async def process_batch(ids, engine):
+        return len(ids)
+
+    monkeypatch.setattr(songs_from_playlist, "crawl", tracked_crawl)
+    monkeypatch.setattr(process_albums, "process_batch", process_album_batch)
+    monkeypatch.setattr(remaining_songs, "process_batch", process_batch)
+    monkeypatch.setattr(process_artists, "process_batch", process_batch)
+
+    asyncio.run(pipeline.run(CrawlerEngine(FakeSpotify(), rate=1000), False, False))
+
+    assert album_batches and album_batches[0]
+    assert len(process_albums.albums_to_check) == 0
@@ -0,0 +1,55 @@
+import response_cache
+
+
+class FakeSpotify:
+    def __init__(self):
+        self.calls = []
+
+    def tracks(self, track_ids, market=None):
+        self.calls.append(("tracks", list(track_ids)))
+        return {"tracks": [{"id": track_id} if track_id != "gone" else None for track_id in track_ids]}
+
+    def playlist_items(self, playlist_id, limit=100, offset=0):
+        self.calls.append(("playlist_items", playlist_id))
+        return {"items": [], "total": 0}
+
+
+def cached_client(tmp_path):
+    sp = FakeSpotify()
+    return sp, response_cache.CachedClient(sp, response_cache.ResponseCache(str(tmp_path / "cache")))
+
+
+def test_batches_are_cached_per_id(tmp_path):
+    sp, client = cached_client(tmp_path)
+    client.tracks(["a", "b", "gone"])
+
+    # Another batch of the same IDs, in another order, with one new ID
+    response = client.tracks(["gone", "c", "b", "a"])
+
+    assert response == {"tracks": [None, {"id": "c"}, {"id": "b"}, {"id": "a"}]}
+    assert sp.calls == [("tracks", ["a", "b", "gone"]), ("tracks", ["c"])]
+
+
+def test_cached_batch_makes_no_request(tmp_path):
+    sp, client = cached_client(tmp_path)
+    client.tracks("a,b")
+    sp.calls.clear()
+
+    assert client.tracks(["b", "a"]) == {"tracks": [{"id": "b"}, {"id": "a"}]}
+    assert sp.calls == []
+
+
+def test_batch_entries_depend_on_other_arguments(tmp_path):
+    sp, client = cached_client(tmp_path)
+    client.tracks(["a"], market="US")
+    client.tracks(["a"], market="DE")
+
+    assert len(sp.calls) == 2
+
+
+def test_playlist_items_are_not_cached(tmp_path):
+    sp, client = cached_client(tmp_path)
+    client.playlist_items("p", limit=100)
+    client.playlist_items("p", limit=100)
+
+    assert sp.calls == [("playlist_items", "p"), ("playlist_items", "p")]
@@ -0,0 +1,53 @@
+import seen_ids
+
+
+def test_saved_and_new_ids_are_seen(data_dir):
+    seen = seen_ids.SeenIds("songs")
+    for i in range(100):
+        seen.add(f"song{i}")
+    seen.save()
+    seen.add("new")
+
+    assert all(f"song{i}" in seen for i in range(100))
+    assert "new" in seen
+    # The filter may report false positives, but the sorted IDs never do
+    assert not any(f"other{i}" in seen for i in range(10000))
+    assert len(seen) == 101
+
+
+def test_filter_is_rebuilt_when_outgrown(data_dir, monkeypatch):
+    monkeypatch.setattr(seen_ids, "MIN_CAPACITY", 16)
+    seen = seen_ids.SeenIds("songs")
+    for i in range(10):
+        seen.add(f"song{i}")
+    seen.save()
+    first_capacity = seen.capacity
+    for i in range(10, 100):
+        seen.add(f"song{i}")
+    seen.save()
+
+    seen = seen_ids.SeenIds("songs")
+    assert seen.capacity > first_capacity
+    assert all(f"song{i}" in seen for i in range(100))
+
+
+def test_save_rebases_on_newer_generation(data_dir):
+    first = seen_ids.SeenIds("songs")
+    second = seen_ids.SeenIds("songs")
+    first.add("a")
+    first.add("b")
+    first.save()
+    second.add("b")
+    second.add("c")
+    second.save()
+
+    seen = seen_ids.SeenIds("songs")
+    assert len(seen) == 3 and all(i in seen for i in "abc")
+
+
+def test_replayed_journal_records_do_not_duplicate(data_dir):
+    seen = seen_ids.SeenIds("songs")
+    seen.add("a")
+    seen.save()
+    seen.apply(["add", "a"])
+    assert len(seen) == 1
@@ -0,0 +1,23 @@
+import pytest
+
+pytest.importorskip("spotipy")
+
+import songs_from_playlist
+
+
+def item(song_id):
+    return {"added_at": "2024-01-01T00:00:00Z", "track": {"id": song_id}}
+
+
+def test_refetch_rewrites_every_song_order(data_dir):
+    songs_from_playlist.load_data()
+    song_playlist = songs_from_playlist.song_playlist
+    for song_index, song_id in enumerate(["a", "b", "c"], start=1):
+        song_playlist[(song_id, "p")] = {"dateAdded": "2024-01-01T00:00:00Z", "songOrder": song_index}
+
+    # "a" was removed, "d" was added in front, and "c" is listed twice
+    items = [item("d"), item("c"), item("b"), item("c")]
+    songs_from_playlist.remove_stale_songs("p", items)
+    songs_from_playlist.update_song_order("p", items)
+
+    assert {k[0]: v["songOrder"] for k, v in song_playlist.items()} == {"c": 2, "b": 3}
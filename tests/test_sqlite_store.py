@@ -0,0 +1,33 @@
+import json
+
+import pytest
+
+import crawl_state
+import sqlite_store
+
+
+@pytest.fixture
+def sqlite_backend(data_dir, monkeypatch):
+    monkeypatch.setattr(crawl_state, "BACKEND", "sqlite")
+    monkeypatch.setattr(sqlite_store, "connection", None)
+    monkeypatch.setattr(sqlite_store, "leasing", [])
+    yield
+    sqlite_store.connection.close()
+
+
+def test_export_writes_every_table(sqlite_backend):
+    crawl_state.load_dict("songs")["s1"] = {"songTitle": "A"}
+    crawl_state.load_dict("playlist_snapshots")["p1"] = "snapshot-1"
+    crawl_state.load_dict("albums_frontier")["al1"] = {"depth": 1, "refs": 2, "popularity": -1}
+    crawl_state.load_set("song_artist", pairs=True).add(("s1", "a1"))
+    crawl_state.checkpoint()
+
+    sqlite_store.export_json()
+
+    def snapshot(name):
+        with open(crawl_state.snapshot_path(name)) as f:
+            return json.load(f)
+    assert snapshot("songs") == {"s1": {"songTitle": "A"}}
+    assert snapshot("playlist_snapshots") == {"p1": "snapshot-1"}
+    assert snapshot("albums_frontier") == {"al1": {"depth": 1, "refs": 2, "popularity": -1}}
+    assert snapshot("song_artist") == ["s1|a1"]
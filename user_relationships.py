@@ -3,232 +3,462 @@ This script handles synthetic user data. It uses user.tsv, song.tsv and artist.t
 follow playlists, like songs, follow artists, and follow other users. This will also finish creating
 playlists.tsv. Does not save intermediate .jsons, as re-running could create stale/contradictory information
 
+The four edge tables (followsPlaylist, likesSong, followsArtist, followsUser) are drawn with NumPy, one block of users
+at a time. Each block's edges are deduplicated as sorted int64 (user, target) keys and appended to its .tsv, so memory
+depends on the block size and run time grows linearly with the number of edges. Use --users and --edges to generate
+load-test sized graphs (e.g. --users 10000000 --edges 1000000000). A table gets at most half of all its possible
+(user, target) pairs (MAX_EDGE_DENSITY), so with few targets, such as the 16 synthetic playlists, --edges is capped.
+
+With --skewed, edges follow production-like skew instead of uniform sampling: likes and artist follows are weighted
+by SongPopularity / ArtistPopularity, user activity is Zipf-distributed, and followsUser grows by preferential
+attachment, so a few songs, artists and users hold most of the edges.
+
+--seed makes a run reproducible, and --shard-index / --shard-count split the users between processes. Each shard
+writes its own slice of every edge table, and concatenating the slices in order gives exactly the single-process
+output for the same seed:
+    for i in 0 1 2 3; do python user_relationships.py --seed 42 --shard-index $i --shard-count 4 & done; wait
+    cat output/likesSong.shard*-of-004.tsv > output/likesSong.tsv    # (and the other edge tables)
+
 Input Files: users.tsv, song.tsv, artist.tsv, song_playlist.json
 Output Files: playlist.tsv, createsPlaylist.tsv, followsPlaylist.tsv, inPlaylist.tsv, likesSong.tsv, followsArtist.tsv, and followsUser.tsv.
+
+Usage: python user_relationships.py [--users N] [--edges N] [--skewed] [--seed N] [--shard-index I --shard-count K]
 """
 
+import argparse
 import os
 import pandas as pd
+import numpy as np
 import json
-from datetime import datetime, timedelta
-import random
+import zlib
+from datetime import datetime
 
 DATA_DIR = "output"
 
-# Load TSV data
-print(f"----- Loading data... -----")
-
-users_df = pd.read_csv(f"{DATA_DIR}/users.tsv", sep="\t")
-songs_df = pd.read_csv(f"{DATA_DIR}/songs.tsv", sep="\t")
-artists_df = pd.read_csv(f"{DATA_DIR}/artists.tsv", sep="\t")
-
-# Load JSON info
-try:
-    with open("data/playlists.json", "r") as f:
-        playlists = json.load(f)
-except FileNotFoundError:
-    print(f"⚠️ playlists.json not found. Initializing empty dict")
-    playlists = {}
-
+NUM_NEW_PLAYLISTS = 16
+CHUNK_EDGES = 5_000_000         # edges generated and written per block of users
+
+# Average edges per user of each table. --edges is split between the tables in the same proportions
+EDGES_PER_USER = {
+    "followsPlaylist": 5,
+    "likesSong": 7,
+    "followsArtist": 7,
+    "followsUser": 7,
+}
 
-# Create Playlists
-print(f"----- Playlist -----")
+# followsUser: share of follows that stay within the follower's block of users (a community), and the chance
+# that one of those is followed back
+LOCAL_FOLLOW_SHARE = 0.5
+MUTUAL_FOLLOW_CHANCE = 0.7
 
-user_playlist = set()                       # To track playlist creators
+# --skewed: every POPULARITY_DOUBLING points of SongPopularity / ArtistPopularity double the chance of a like or
+# follow, user activity is Zipf-distributed, and no user's expected degree exceeds MAX_DEGREE_SHARE of the targets
+POPULARITY_DOUBLING = 10
+ZIPF_EXPONENT = 1.0
+MAX_DEGREE_SHARE = 0.1
 
-NUM_NEW_PLAYLISTS = 16
-playlist_names = [f"random_mix_{i}" for i in range(1, NUM_NEW_PLAYLISTS+1)]
-excluded_user_ids = [101, 102, 103, 104]    # Real users who created playlists
-eligible_users = users_df[~users_df["userID"].isin(excluded_user_ids)]
-
-print("Generating synthetic playlists...")
-for i, name in enumerate(playlist_names, start=1):
-    creator = eligible_users.sample(1).iloc[0]
-    
-    playlist_id = str(i)
-    if playlist_id not in playlists:
-        playlists[playlist_id] = {
-            "playlist_name": name,
-            "playlist_art_url": r"\N"
-        }
-    if (creator["userID"], playlist_id) not in user_playlist:
-        user_playlist.add((creator["userID"], playlist_id))
-        print(f"Added playlist {name}")
-
-# Save Playlist as TSV
-playlists_df = pd.DataFrame.from_dict(playlists, orient="index")
-playlists_df.index.name = "playlistID"
-playlists_df.reset_index(inplace=True)
-
-playlists_path = os.path.join(DATA_DIR, "playlists.tsv")
-playlists_df.to_csv(playlists_path, sep="\t", index=False)
-if os.path.exists(playlists_path):
-    print(f"✅ Successfully saved playlists.tsv\n")
+# Largest share of all (user, target) pairs a table may fill. block_edges draws with replacement and drops repeats,
+# which needs more and more rounds as a block fills up, and never finishes near full
+MAX_EDGE_DENSITY = 0.5
 
-
-# CreatesPlaylist (User - Playlist)
-print(f"----- createsPlaylist -----")
-# Real playlists
-real_creators = ["Billboard", "Trap Nation", "Drake", "swift_fan"]
-IDs = {
-    "Billboard": 101,
-    "Trap Nation": 102,
-    "Drake": 103,
-    "swift_fan": 104
-}
+# Real users who created the seed playlists (see generate_users.py), by username
 real_playlistIDs = {
     "Billboard": "6UeSakyzhiEt4NB3UAd6NQ",
     "Trap Nation": "0NCspsyf0OS4BsPgGhkQXM",
     "Drake": "0GsvYNj45QjR245EWqgfDs",
     "swift_fan": "6qSYIKJihVKpWr2HDeHjxS"
 }
-for user in real_creators:
-    if (IDs[user], real_playlistIDs[user]) not in user_playlist:
-        user_playlist.add((IDs[user], real_playlistIDs[user]))
 
-createsPlaylist = pd.DataFrame(user_playlist, columns=["userID", "playlistID"])
-createsPlaylist_path = os.path.join(DATA_DIR, "createsPlaylist.tsv")
-createsPlaylist.to_csv(createsPlaylist_path, sep="\t", index=False)
-if os.path.exists(createsPlaylist_path):
-    print(f"✅ Successfully saved createsPlaylist.tsv\n")
+# Set from --seed / --shard-index / --shard-count in main()
+seed = 0
+shard_index = 0
+shard_count = 1
 
 
-# Song - Playlist
-print(f"----- inPlaylist -----")
-# Load song_playlist.json
-try:
-    with open("data/song_playlist.json", "r") as f:
-        raw = json.load(f)
-        song_playlist = {tuple(k.split('|')) : v for k, v in raw.items()}
-except FileNotFoundError:
-    print(f"⚠️ song_playlist.json not found. Initializing empty dict")
-    song_playlist = {}
-
-skip_IDs = set(real_playlistIDs.values())
-for p_id in playlists_df["playlistID"]:
-    if p_id in skip_IDs:
-        print(f"⚠️ Randomly selected real playlist. Skipping...")
-        continue
-    # Sample random songs
-    songs_to_add = songs_df.sample(random.randint(0, 100))["songID"].tolist()
-    
-    song_pos = 1
-    # Add songs to playlist
-    for s_id in songs_to_add:
-        if (s_id, p_id) not in song_playlist:
-            song_playlist[(s_id, p_id)] = {
-                "dateAdded": (datetime(2025, 10, 11)).strftime("%Y-%m-%d"),
-                "songOrder": song_pos
+"""
+Returns the random generator for one part of the output. Every table (and every block of users within it) draws
+from its own stream derived from (seed, name, keys), so any block can be generated alone, in any process, and
+still come out the same
+"""
+def table_rng(name, *keys):
+    return np.random.default_rng([seed, zlib.crc32(name.encode()), *keys])
+
+
+"""
+Shards write <name>.shardNNN-of-NNN.tsv, and only shard 0 writes the header, so concatenating the shard files
+in order gives exactly <name>.tsv
+"""
+def output_path(name):
+    if shard_count == 1:
+        return os.path.join(DATA_DIR, f"{name}.tsv")
+    return os.path.join(DATA_DIR, f"{name}.shard{shard_index:03d}-of-{shard_count:03d}.tsv")
+
+
+def load_data():
+    print(f"----- Loading data... -----")
+    users_df = pd.read_csv(f"{DATA_DIR}/users.tsv", sep="\t")
+    songs_df = pd.read_csv(f"{DATA_DIR}/songs.tsv", sep="\t")
+    artists_df = pd.read_csv(f"{DATA_DIR}/artists.tsv", sep="\t")
+
+    # Load JSON info
+    try:
+        with open("data/playlists.json", "r") as f:
+            playlists = json.load(f)
+    except FileNotFoundError:
+        print(f"⚠️ playlists.json not found. Initializing empty dict")
+        playlists = {}
+    return users_df, songs_df, artists_df, playlists
+
+
+# ----- PLAYLISTS -----
+
+"""
+Creates the synthetic playlists and saves playlists.tsv. Returns the playlists DataFrame and the
+(creator, playlist) pairs of the synthetic playlists
+"""
+def create_playlists(users_df, playlists):
+    print(f"----- Playlist -----")
+    rng = table_rng("playlists")
+    user_playlist = set()                       # To track playlist creators
+
+    playlist_names = [f"random_mix_{i}" for i in range(1, NUM_NEW_PLAYLISTS+1)]
+    # Real users who created playlists are not picked as creators of synthetic ones
+    eligible_users = users_df[~users_df["username"].isin(real_playlistIDs.keys())]
+
+    print("Generating synthetic playlists...")
+    for i, name in enumerate(playlist_names, start=1):
+        creator = eligible_users.sample(1, random_state=rng).iloc[0]
+
+        playlist_id = str(i)
+        if playlist_id not in playlists:
+            playlists[playlist_id] = {
+                "playlist_name": name,
+                "playlist_art_url": r"\N"
             }
-            song_pos += 1
-
-in_playlist_df = pd.DataFrame([
-    {"songID": k[0], "playlistID": k[1], **v}
-    for k, v in song_playlist.items()
-])
-in_playlist_path = os.path.join(DATA_DIR, "inPlaylist.tsv")
-in_playlist_df.to_csv(in_playlist_path, sep="\t", index=False)
-if os.path.exists(in_playlist_path):
-    print(f"✅ Successfully saved inPlaylist.tsv\n")
-
-
-# User follows playlist (followsPlaylist.tsv)
-print(f"----- followsPlaylist -----")
-follows_playlist = set()
-for user_id in users_df["userID"]:
-    # Sample random playlists
-    following_playlist = playlists_df.sample(random.randint(0, 10))["playlistID"].tolist()
-
-    for p_id in following_playlist:
-        if (user_id, p_id) not in follows_playlist:
-            follows_playlist.add((user_id, p_id))
-
-follows_playlist_list = list(follows_playlist)
-follows_playlist_list.sort(key=lambda pair:pair[0])
-followsPlaylist_df = pd.DataFrame(follows_playlist_list, columns=["userID", "playlistID"])
-
-fol_play_path = os.path.join(DATA_DIR, "followsPlaylist.tsv")
-followsPlaylist_df.to_csv(fol_play_path, sep='\t', index=False)
-if os.path.exists(fol_play_path):
-    print(f"✅ Successfully saved followsPlaylist.tsv\n")
-
-
-# User - Song (likesSong)
-print("----- likesSong -----")
-likes_song_set = set()
-random_users = []
-for i in range(random.randint(10, 100)):            # Random number of users
-    random_users.append(random.randint(1, 100))     # Random user IDs
-
-for u_id in random_users:
-    # Sample random songs
-    liked_songs = songs_df.sample(random.randint(0, 25))["songID"].tolist()
-
-    for s_id in liked_songs:
-        if (u_id, s_id) not in likes_song_set:
-            likes_song_set.add((u_id, s_id))
-
-likes_song_list = list(likes_song_set)
-likes_song_list.sort(key=lambda pair:pair[0])
-likesSong_df = pd.DataFrame(likes_song_list, columns=["userID", "songID"])
-
-likes_song_path = os.path.join(DATA_DIR, "likesSong.tsv")
-likesSong_df.to_csv(likes_song_path, sep='\t', index=False)
-if os.path.exists(likes_song_path):
-    print(f"✅ Succesfully saved likesSong.tsv\n")
-
-
-# User - Artist (followsArtist)
-print("----- followsArtist -----")
-follows_artist_set = set()
-random_users = []
-for i in range(random.randint(10, 100)):            # Random number of users
-    random_users.append(random.randint(1, 100))     # Random user IDs
-
-for u_id in random_users:
-    # Sample random artists
-    artists = artists_df.sample(random.randint(0, 25))["artistID"].tolist()
-
-    for a_id in artists:
-        if (u_id, a_id) not in follows_artist_set:
-            follows_artist_set.add((u_id, a_id))
-
-follows_artist_list = list(follows_artist_set)
-follows_artist_list.sort(key=lambda pair:pair[0])
-followsArtist_df = pd.DataFrame(follows_artist_list, columns=["userID", "artistID"])
-
-follows_artist_path = os.path.join(DATA_DIR, "followsArtist.tsv")
-followsArtist_df.to_csv(follows_artist_path, sep='\t', index=False)
-if os.path.exists(follows_artist_path):
-    print(f"✅ Succesfully saved followsArtist.tsv\n")
-
-
-# User - User (followsUser)
-print("----- followsUser -----")
-follows_user_set = set()
-random_users = []
-for i in range(random.randint(10, 100)):            # Random number of users
-    random_users.append(random.randint(1, 100))     # Random user IDs
-
-for u_id in random_users:
-    # Sample random users
-    followees = users_df.sample(random.randint(0, 25))["userID"].tolist()
-
-    for followee_id in followees:
-        if u_id == followee_id:
+        if (creator["userID"], playlist_id) not in user_playlist:
+            user_playlist.add((creator["userID"], playlist_id))
+            print(f"Added playlist {name}")
+
+    # Save Playlist as TSV
+    playlists_df = pd.DataFrame.from_dict(playlists, orient="index")
+    playlists_df.index.name = "playlistID"
+    playlists_df.reset_index(inplace=True)
+
+    if shard_index == 0:
+        playlists_path = os.path.join(DATA_DIR, "playlists.tsv")
+        playlists_df.to_csv(playlists_path, sep="\t", index=False)
+        if os.path.exists(playlists_path):
+            print(f"✅ Successfully saved playlists.tsv\n")
+    return playlists_df, user_playlist
+
+
+# CreatesPlaylist (User - Playlist)
+def save_creates_playlist(users_df, playlists_df, user_playlist):
+    print(f"----- createsPlaylist -----")
+    # Real playlists. Creator IDs are looked up by username, since they depend on how many users were generated
+    creator_ids = dict(zip(users_df["username"], users_df["userID"]))
+    playlist_ids = set(playlists_df["playlistID"])
+    for user, playlist_id in real_playlistIDs.items():
+        if playlist_id not in playlist_ids:
+            # Not crawled (or a synthetic catalog). CreatesPlaylist would fail its foreign key to Playlists
+            print(f"⚠️ Playlist {playlist_id} not found in playlists.json. Skipping {user}...")
+            continue
+        if user not in creator_ids:
+            print(f"⚠️ Creator {user} not found in users.tsv. Skipping {playlist_id}...")
+            continue
+        if (creator_ids[user], playlist_id) not in user_playlist:
+            user_playlist.add((creator_ids[user], playlist_id))
+
+    createsPlaylist = pd.DataFrame(sorted(user_playlist), columns=["userID", "playlistID"])
+    createsPlaylist_path = os.path.join(DATA_DIR, "createsPlaylist.tsv")
+    createsPlaylist.to_csv(createsPlaylist_path, sep="\t", index=False)
+    if os.path.exists(createsPlaylist_path):
+        print(f"✅ Successfully saved createsPlaylist.tsv\n")
+
+
+# Song - Playlist
+def save_in_playlist(playlists_df, songs_df):
+    print(f"----- inPlaylist -----")
+    rng = table_rng("inPlaylist")
+    # Load song_playlist.json
+    try:
+        with open("data/song_playlist.json", "r") as f:
+            raw = json.load(f)
+            song_playlist = {tuple(k.split('|')) : v for k, v in raw.items()}
+    except FileNotFoundError:
+        print(f"⚠️ song_playlist.json not found. Initializing empty dict")
+        song_playlist = {}
+
+    skip_IDs = set(real_playlistIDs.values())
+    for p_id in playlists_df["playlistID"]:
+        if p_id in skip_IDs:
+            print(f"⚠️ Randomly selected real playlist. Skipping...")
             continue
-        if (u_id, followee_id) not in follows_user_set:
-            follows_user_set.add((u_id, followee_id))
-        # Check if they mutually follow each other
-        if (followee_id, u_id) not in follows_user_set and random.choices([True, False], weights=[0.7, 0.3], k=1)[0]:
-            follows_user_set.add((followee_id, u_id))
-
-follows_user_list = list(follows_user_set)
-follows_user_list.sort(key=lambda pair:pair[0])
-followsUser_df = pd.DataFrame(follows_user_list, columns=["followerID", "followeeID"])
-
-follows_user_path = os.path.join(DATA_DIR, "followsUser.tsv")
-followsUser_df.to_csv(follows_user_path, sep="\t", index=False)
-if os.path.exists(follows_user_path):
-    print("✅ Successfully saved followsUser.tsv")
-    
\ No newline at end of file
+        # Sample random songs
+        n = int(rng.integers(0, min(100, len(songs_df)), endpoint=True))
+        songs_to_add = songs_df.sample(n, random_state=rng)["songID"].tolist()
+
+        song_pos = 1
+        # Add songs to playlist
+        for s_id in songs_to_add:
+            if (s_id, p_id) not in song_playlist:
+                song_playlist[(s_id, p_id)] = {
+                    "dateAdded": (datetime(2025, 10, 11)).strftime("%Y-%m-%d"),
+                    "songOrder": song_pos
+                }
+                song_pos += 1
+
+    in_playlist_df = pd.DataFrame([
+        {"songID": k[0], "playlistID": k[1], **v}
+        for k, v in song_playlist.items()
+    ])
+    in_playlist_path = os.path.join(DATA_DIR, "inPlaylist.tsv")
+    in_playlist_df.to_csv(in_playlist_path, sep="\t", index=False)
+    if os.path.exists(in_playlist_path):
+        print(f"✅ Successfully saved inPlaylist.tsv\n")
+
+
+# ----- EDGES -----
+
+"""
+Samplers return `size` indexes drawn with rng from [lo, hi), either uniformly or in proportion to weights
+"""
+def uniform_sampler(rng, lo, hi, size):
+    return rng.integers(lo, hi, size=size, dtype=np.int64)
+
+
+def weighted_sampler(weights):
+    cdf = np.cumsum(weights, dtype=np.float64)
+    def sample(rng, lo, hi, size):
+        low = cdf[lo - 1] if lo else 0.0
+        x = low + rng.random(size) * (cdf[hi - 1] - low)
+        return np.minimum(np.searchsorted(cdf, x, side="right"), hi - 1)
+    return sample
+
+
+"""
+Popularity (0-100) to sampling weight. Spotify popularity grows roughly with the log of plays, so every
+POPULARITY_DOUBLING points doubles the weight. Missing popularity counts as 0
+"""
+def popularity_weights(popularity):
+    return np.exp2(np.nan_to_num(popularity.to_numpy(dtype=np.float64)) / POPULARITY_DOUBLING)
+
+
+"""
+Zipf-distributed activity: the user of rank r (a random permutation of users) has weight 1 / r^ZIPF_EXPONENT.
+Weights are capped so no user's expected degree exceeds MAX_DEGREE_SHARE of the targets, otherwise the most
+active users could not be given that many distinct edges
+"""
+def zipf_activity(rng, n_users, n_edges, n_targets):
+    weights = 1.0 / (rng.permutation(n_users) + 1.0) ** ZIPF_EXPONENT
+    for _ in range(20):
+        cap = MAX_DEGREE_SHARE * n_targets * weights.sum() / max(n_edges, 1)
+        if weights.max() <= cap:
+            break
+        weights = np.minimum(weights, cap)
+    return weights
+
+
+"""
+Block drawers. Each takes a block of users [u0, u1) and its rng, and returns a function that maps an array of source
+user indexes in it to int64 keys source * n_targets + target (with extra keys, if any, whose source is also in the block)
+"""
+def target_edges(n_targets, sample=uniform_sampler):
+    def block_draw(u0, u1, rng):
+        return lambda src: src * n_targets + sample(rng, 0, n_targets, len(src))
+    return block_draw
+
+
+"""
+followees(u0, u1) returns the sampler for the block's follows outside it
+"""
+def follow_edges(n_users, followees):
+    def block_draw(u0, u1, rng):
+        sample = followees(u0, u1)
+        def draw(src):
+            local = rng.random(len(src)) < LOCAL_FOLLOW_SHARE
+            dst = np.where(local, rng.integers(u0, u1, size=len(src)), sample(rng, len(src)))
+            keep = src != dst
+            src, dst, local = src[keep], dst[keep], local[keep]
+            # Both ends of a local follow are in this block, so the follow back can be added here without duplicates
+            back = local & (rng.random(len(src)) < MUTUAL_FOLLOW_CHANCE)
+            return np.concatenate([src * n_users + dst, dst[back] * n_users + src[back]])
+        return draw
+    return block_draw
+
+
+class PreferentialAttachment:
+    """
+    Block-sequential preferential attachment for followsUser. Users join block by block, and each block follows
+    users that joined before it or with it, in proportion to their followers so far + 1. Early users become hubs.
+    """
+
+    def __init__(self, n_users):
+        self.n_users = n_users
+        self.followers = np.zeros(n_users, dtype=np.int64)
+
+    def followees(self, u0, u1):
+        sample = weighted_sampler(self.followers[:u1] + 1)
+        return lambda rng, size: sample(rng, 0, u1, size)
+
+    def add_block(self, keys):
+        self.followers += np.bincount(keys % self.n_users, minlength=self.n_users)
+
+
+"""
+Sorted unique values. A sort and a neighbour comparison, which is much faster than np.unique on large int64 arrays
+"""
+def sorted_unique(keys):
+    keys = np.sort(keys)
+    return keys[np.concatenate(([True], keys[1:] != keys[:-1]))] if len(keys) else keys
+
+
+"""
+Draws n_edges distinct edges whose sources are users u0..u1-1, picked by sample_sources. Keeps drawing until
+there are enough unique keys, then drops a random excess. Returns the keys sorted, i.e. grouped by user
+"""
+def block_edges(rng, u0, u1, n_edges, capacity, sample_sources, draw):
+    n_edges = min(n_edges, capacity)
+    keys = np.empty(0, dtype=np.int64)
+    while len(keys) < n_edges:
+        size = (n_edges - len(keys)) * 11 // 10 + 16
+        keys = sorted_unique(np.concatenate([keys, draw(sample_sources(rng, u0, u1, size))]))
+    if len(keys) > n_edges:
+        keys = np.delete(keys, rng.choice(len(keys), len(keys) - n_edges, replace=False))
+    return keys
+
+
+"""
+Splits users into consecutive blocks of about CHUNK_EDGES edges each, by activity (None = uniform).
+Returns (u0, u1, edges) for each block
+"""
+def user_blocks(n_users, n_edges, activity=None):
+    n_blocks = min(n_users, max(1, -(-n_edges // CHUNK_EDGES)))
+    if activity is None:
+        cum = np.arange(1, n_users + 1, dtype=np.float64)
+    else:
+        cum = np.cumsum(activity, dtype=np.float64)
+    total = cum[-1]
+    cuts = np.searchsorted(cum, total * np.arange(1, n_blocks) / n_blocks, side="right")
+    bounds = np.unique(np.concatenate([[0], np.minimum(cuts, n_users), [n_users]]))
+    marks = [0] + [int(round(n_edges * cum[b - 1] / total)) for b in bounds[1:]]
+    return [(int(bounds[i]), int(bounds[i + 1]), marks[i + 1] - marks[i]) for i in range(len(bounds) - 1)]
+
+
+"""
+Generates one edge table block by block and streams it to <name>.tsv. Blocks cover consecutive user ranges and
+get a share of n_edges proportional to their users' activity (uniform if None). A shard writes only its own
+contiguous range of blocks. With on_block (preferential attachment), each block depends on the ones before it,
+so a shard also regenerates the blocks before its range, without writing them
+"""
+def save_edges(name, columns, user_ids, target_ids, n_edges, block_draw, activity=None, self_edges=True, on_block=None):
+    print(f"----- {name} -----")
+    n_users, n_targets = len(user_ids), len(target_ids)
+    if n_targets == 0:
+        print(f"⚠️ Nothing to link users to. Skipping {name}...\n")
+        return
+    targets_per_user = n_targets if self_edges else n_targets - 1
+    max_edges = int(n_users * targets_per_user * MAX_EDGE_DENSITY)
+    if n_edges > max_edges:
+        print(f"⚠️ {n_edges} edges is more than {MAX_EDGE_DENSITY:.0%} of the {n_users} x {targets_per_user} possible. "
+              f"Generating {max_edges} instead")
+        n_edges = max_edges
+    sample_sources = uniform_sampler if activity is None else weighted_sampler(activity)
+
+    blocks = user_blocks(n_users, n_edges, activity)
+    first = len(blocks) * shard_index // shard_count
+    last = len(blocks) * (shard_index + 1) // shard_count
+
+    path = output_path(name)
+    written = 0
+    with open(path, "w") as f:
+        if shard_index == 0:
+            f.write("\t".join(columns) + "\n")
+        for i, (u0, u1, target) in enumerate(blocks[:last]):
+            if i < first and on_block is None:
+                continue
+            rng = table_rng(name, i)
+            keys = block_edges(rng, u0, u1, target, (u1 - u0) * targets_per_user, sample_sources, block_draw(u0, u1, rng))
+            if on_block:
+                on_block(keys)
+            if i < first:
+                continue
+            pd.DataFrame({
+                columns[0]: user_ids[keys // n_targets],
+                columns[1]: target_ids[keys % n_targets],
+            }).to_csv(f, sep="\t", index=False, header=False)
+            written += len(keys)
+    print(f"✅ Successfully saved {written} rows to {path}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic user relationships")
+    parser.add_argument("--users", type=int, help="number of users (IDs 1..N) to generate edges for (default: users.tsv)")
+    parser.add_argument("--edges", type=int, help=f"total edges across the four edge tables (default: {sum(EDGES_PER_USER.values())} per user)")
+    parser.add_argument("--skewed", action="store_true", help="popularity-weighted targets, Zipf user activity and preferential-attachment followsUser")
+    parser.add_argument("--seed", type=int, help="makes the output reproducible (default: random, printed)")
+    parser.add_argument("--shard-index", type=int, default=0, help="which shard of the users this process generates")
+    parser.add_argument("--shard-count", type=int, default=1, help="number of shards the users are split into")
+    args = parser.parse_args()
+    if not 0 <= args.shard_index < args.shard_count:
+        parser.error("--shard-index must be between 0 and --shard-count - 1")
+
+    global seed, shard_index, shard_count
+    seed = args.seed if args.seed is not None else int(np.random.SeedSequence().entropy % 2**63)
+    shard_index, shard_count = args.shard_index, args.shard_count
+    print(f"🎲 Seed {seed}, shard {shard_index + 1} of {shard_count}\n")
+
+    users_df, songs_df, artists_df, playlists = load_data()
+    playlists_df, user_playlist = create_playlists(users_df, playlists)
+    if shard_index == 0:
+        # Small tables that are not split by user. Only the first shard writes them
+        save_creates_playlist(users_df, playlists_df, user_playlist)
+        save_in_playlist(playlists_df, songs_df)
+
+    if args.users:
+        user_ids = np.arange(1, args.users + 1, dtype=np.int64)
+        if args.users > len(users_df):
+            print(f"⚠️ users.tsv has {len(users_df)} users. Generate the rest with generate_users.py before loading\n")
+    else:
+        user_ids = users_df["userID"].to_numpy()
+    n_users = len(user_ids)
+
+    per_user = sum(EDGES_PER_USER.values())
+    total_edges = args.edges if args.edges is not None else per_user * n_users
+    edges = {name: total_edges * share // per_user for name, share in EDGES_PER_USER.items()}
+
+    playlist_ids = playlists_df["playlistID"].to_numpy()
+    song_ids = songs_df["songID"].to_numpy()
+    artist_ids = artists_df["artistID"].to_numpy()
+
+    if not args.skewed:
+        save_edges("followsPlaylist", ["userID", "playlistID"], user_ids, playlist_ids,
+                   edges["followsPlaylist"], target_edges(len(playlist_ids)))
+        save_edges("likesSong", ["userID", "songID"], user_ids, song_ids,
+                   edges["likesSong"], target_edges(len(song_ids)))
+        save_edges("followsArtist", ["userID", "artistID"], user_ids, artist_ids,
+                   edges["followsArtist"], target_edges(len(artist_ids)))
+        save_edges("followsUser", ["followerID", "followeeID"], user_ids, user_ids,
+                   edges["followsUser"], follow_edges(n_users, lambda u0, u1: lambda rng, size: uniform_sampler(rng, 0, n_users, size)),
+                   self_edges=False)
+        return
+
+    # Every table's activity comes from the same "activity" stream, so the same users are the most active everywhere
+    save_edges("followsPlaylist", ["userID", "playlistID"], user_ids, playlist_ids,
+               edges["followsPlaylist"], target_edges(len(playlist_ids)),
+               activity=zipf_activity(table_rng("activity"), n_users, edges["followsPlaylist"], len(playlist_ids)))
+    save_edges("likesSong", ["userID", "songID"], user_ids, song_ids,
+               edges["likesSong"], target_edges(len(song_ids), weighted_sampler(popularity_weights(songs_df["popularity"]))),
+               activity=zipf_activity(table_rng("activity"), n_users, edges["likesSong"], len(song_ids)))
+    save_edges("followsArtist", ["userID", "artistID"], user_ids, artist_ids,
+               edges["followsArtist"], target_edges(len(artist_ids), weighted_sampler(popularity_weights(artists_df["artistPopularity"]))),
+               activity=zipf_activity(table_rng("activity"), n_users, edges["followsArtist"], len(artist_ids)))
+    attachment = PreferentialAttachment(n_users)
+    save_edges("followsUser", ["followerID", "followeeID"], user_ids, user_ids,
+               edges["followsUser"], follow_edges(n_users, attachment.followees),
+               activity=zipf_activity(table_rng("activity"), n_users, edges["followsUser"], n_users), self_edges=False,
+               on_block=attachment.add_block)
+
+
+if __name__ == "__main__":
+    main()